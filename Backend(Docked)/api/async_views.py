@@ -0,0 +1,177 @@
+"""
+Async variants of the hot read endpoints for ASGI deployments
+Same URLs, payloads and cache keys as the DRF views in api.views, but the
+cache is read through an asyncio Redis client and the database through
+Django's async ORM, so one event-loop worker can hold many slow clients
+without tying up a thread each. Enabled with ASYNC_READ_VIEWS.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import redis.asyncio as aioredis
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from opentelemetry import trace
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
+
+from api.serialisers import ItemSerializer, ItemSearchSerializer
+from backend.custom_metrics import (
+    track_api_performance, track_cache_operation, track_item_view, track_search_operation
+)
+from backend.db_router import primary_reads
+from shopiet import trending
+from shopiet.models import Item
+from shopiet.view_counts import VIEW_BUFFER_KEY
+
+logger = logging.getLogger(__name__)
+tracer = trace.get_tracer(__name__)
+
+_redis: Optional[aioredis.Redis] = None
+# Cache key -> in-flight rebuild shared by concurrent misses on this event loop
+_inflight: Dict[str, asyncio.Future] = {}
+
+
+def _get_redis() -> aioredis.Redis:
+    global _redis
+    if _redis is None:
+        _redis = aioredis.from_url(settings.REDIS_URL)
+    return _redis
+
+
+async def _cache_get(key: str) -> Any:
+    """Read a value written by django-redis"""
+    value = await _get_redis().get(cache.client.make_key(key))
+    hit = value is not None
+    track_cache_operation("get", key, hit=hit)
+    return cache.client.decode(value) if hit else None
+
+
+async def _cache_set(key: str, value: Any, timeout: int):
+    """Write a value django-redis can read back"""
+    await _get_redis().set(cache.client.make_key(key), cache.client.encode(value), ex=timeout)
+    track_cache_operation("set", key, hit=True)
+
+
+async def _cached(key: str, timeout: int, load: Callable[[], Awaitable[Any]]) -> Any:
+    """Cache-aside read where concurrent misses for a key await one rebuild"""
+    value = await _cache_get(key)
+    if value is not None:
+        return value
+
+    future = _inflight.get(key)
+    if future is not None:
+        return await asyncio.shield(future)
+
+    future = _inflight[key] = asyncio.get_running_loop().create_future()
+    try:
+        with primary_reads():
+            value = await load()
+        if value is not None:
+            await _cache_set(key, value, timeout)
+        future.set_result(value)
+        return value
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        _inflight.pop(key, None)
+        # Nobody may be waiting; don't warn about an unretrieved exception
+        if future.done() and not future.cancelled():
+            future.exception()
+
+
+async def _authenticate(request) -> bool:
+    """Apply the project's JWT authentication, storing the user on request.auth_user"""
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except (AuthenticationFailed, TokenError):
+        result = None
+    request.auth_user = result[0] if result else None
+    return request.auth_user is not None
+
+
+def _unauthorized() -> JsonResponse:
+    return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+
+async def _load_items(queryset) -> list:
+    items = [item async for item in queryset.prefetch_related('images')]
+    return ItemSerializer(items, many=True).data
+
+
+@track_api_performance('get_data_async')
+async def getData(request):
+    """Get all items"""
+    if not await _authenticate(request):
+        return _unauthorized()
+
+    data = await _cached('all_items', 300, lambda: _load_items(Item.objects.all()))
+    return JsonResponse(data, safe=False)
+
+
+@track_api_performance('get_item_async')
+async def getItem(request, slug):
+    """Get item details and record the view"""
+    if not await _authenticate(request):
+        return _unauthorized()
+
+    async def load():
+        item = await Item.objects.prefetch_related('images').filter(slug=slug).afirst()
+        return ItemSerializer(item).data if item is not None else None
+
+    data = await _cached(f'item_{slug}', 360, load)
+    if data is None:
+        return HttpResponse(status=404)
+
+    user_id = str(request.auth_user.id)
+    category = data['item_category_name']
+    track_item_view(slug, user_id, category)
+    await _get_redis().hincrby(VIEW_BUFFER_KEY, slug, 1)
+    await sync_to_async(trending.record_signal, thread_sensitive=False)(slug, category, 'view')
+
+    return JsonResponse(data)
+
+
+@track_api_performance('get_category_items_async')
+async def getCatItems(request, item_category_name):
+    """Get items by category"""
+    if not await _authenticate(request):
+        return _unauthorized()
+
+    data = await _cached(
+        f'category_items_{item_category_name}', 360,
+        lambda: _load_items(Item.objects.filter(item_category_name=item_category_name)),
+    )
+    return JsonResponse(data, safe=False)
+
+
+@track_api_performance('search_items_async')
+async def getSearchItems(request, search_query):
+    """Search item names"""
+    if not await _authenticate(request):
+        return _unauthorized()
+
+    items = [item async for item in Item.objects.filter(item_name__icontains=search_query)]
+    data = ItemSearchSerializer(items, many=True).data
+    track_search_operation(search_query, str(request.auth_user.id), len(data))
+
+    if not data:
+        return JsonResponse([{"item_name": "no results match that query"}], safe=False)
+    return JsonResponse(data, safe=False)
+
+
+@track_api_performance('search_items_detailed_async')
+async def getSearchqItems(request, search_query):
+    """Search item names, returning full item data"""
+    if not await _authenticate(request):
+        return _unauthorized()
+
+    data = await _load_items(Item.objects.filter(item_name__icontains=search_query))
+    track_search_operation(search_query, str(request.auth_user.id), len(data))
+    return JsonResponse(data, safe=False)
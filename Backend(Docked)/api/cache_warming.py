@@ -0,0 +1,99 @@
+"""
+Cache warming for the Shopiet API
+Rebuilds the feed, the largest categories and the most viewed items after a
+deploy or a Redis flush, with bounded concurrency.
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Count
+from opentelemetry import trace
+
+from backend.db_router import primary_reads
+from shopiet.models import Item
+from shopiet.view_counts import most_viewed_slugs
+
+logger = logging.getLogger(__name__)
+tracer = trace.get_tracer(__name__)
+
+
+def _warm_tasks(top_categories: int, top_items: int) -> List[Tuple[str, Callable, tuple]]:
+    """List of (cache key, loader, args) to rebuild"""
+    from api.views import load_all_items_payload, load_category_payload, load_item_payload
+
+    tasks = [('all_items', load_all_items_payload, ())]
+
+    categories = (
+        Item.objects.exclude(item_category_name='')
+        .values('item_category_name')
+        .annotate(item_count=Count('id'))
+        .order_by('-item_count')[:top_categories]
+    )
+    for row in categories:
+        name = row['item_category_name']
+        tasks.append((f'category_items_{name}', load_category_payload, (name,)))
+
+    for slug in most_viewed_slugs(top_items):
+        tasks.append((f'item_{slug}', load_item_payload, (slug,)))
+
+    return tasks
+
+
+def _run_task(key: str, loader: Callable, args: tuple, force: bool) -> bool:
+    try:
+        if force:
+            # Bypasses single flight, so it has to ask for the primary itself
+            with primary_reads():
+                value = loader.uncoalesced(*args)
+            if value is not None:
+                cache.set(key, value, timeout=loader.cache_timeout)
+        else:
+            # Coalesced loaders skip keys that are already warm
+            value = loader(*args)
+        return value is not None
+    finally:
+        # Worker threads must not leak connections
+        connections.close_all()
+
+
+def warm_cache(top_categories: Optional[int] = None, top_items: Optional[int] = None,
+               workers: Optional[int] = None, force: bool = False) -> Dict[str, Any]:
+    """Rebuild the hottest cache keys in parallel and return a summary"""
+    top_categories = top_categories if top_categories is not None else settings.CACHE_WARM_TOP_CATEGORIES
+    top_items = top_items if top_items is not None else settings.CACHE_WARM_TOP_ITEMS
+    workers = workers or settings.CACHE_WARM_WORKERS
+
+    with tracer.start_as_current_span("cache.warm") as span:
+        start_time = time.time()
+        tasks = _warm_tasks(top_categories, top_items)
+        warmed, failed = 0, 0
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(_run_task, key, loader, args, force): key
+                for key, loader, args in tasks
+            }
+            for future in as_completed(futures):
+                try:
+                    if future.result():
+                        warmed += 1
+                except Exception as e:
+                    failed += 1
+                    logger.warning(f"Failed to warm {futures[future]}: {e}")
+
+        summary = {
+            'keys': len(tasks),
+            'warmed': warmed,
+            'failed': failed,
+            'duration': time.time() - start_time,
+        }
+        span.set_attribute("cache.warm.keys", len(tasks))
+        span.set_attribute("cache.warm.failed", failed)
+        logger.info(f"Cache warm finished: {summary}")
+        return summary
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from api.cache_warming import warm_cache
+
+
+class Command(BaseCommand):
+    help = "Rebuild the feed, top categories and most viewed item caches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, help="Number of largest categories to warm")
+        parser.add_argument('--items', type=int, help="Number of most viewed items to warm")
+        parser.add_argument('--workers', type=int, help="Maximum concurrent rebuilds")
+        parser.add_argument('--force', action='store_true', help="Rebuild keys that are already cached")
+
+    def handle(self, *args, **options):
+        summary = warm_cache(
+            top_categories=options['categories'],
+            top_items=options['items'],
+            workers=options['workers'],
+            force=options['force'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Warmed {summary['warmed']}/{summary['keys']} keys "
+            f"({summary['failed']} failed) in {summary['duration']:.2f}s"
+        ))
@@ -13,12 +13,16 @@ class ItemSerializer(serializers.ModelSerializer):
         fields ='__all__'
 
 class MessageSerializer(serializers.ModelSerializer):
+    content = serializers.CharField(source='body', read_only=True)
+
     class Meta:
         model = Message
-        fields = ['id', 'content', 'timestamp', 'sender_username','recipient_username']
+        fields = ['id', 'seq', 'content', 'timestamp', 'sender_username','recipient_username']
 
 class ChatSerializer(serializers.ModelSerializer):
     unseen_count = serializers.IntegerField(read_only=True)
+    viewed = serializers.BooleanField(read_only=True)
+    content = serializers.CharField(source='body', read_only=True)
     class Meta:
         model = Message
         fields = ['id', 'content', 'timestamp', 'sender_username','recipient_username','viewed', 'unseen_count']
@@ -1,16 +1,32 @@
+from django.conf import settings
 from django.urls import path, re_path
 from . import views
 
+if settings.ASYNC_READ_VIEWS:
+    # Serve the hot GETs from async views under ASGI
+    from . import async_views as read_views
+else:
+    read_views = views
+
 urlpatterns = [
-    path('', views.getData),
+    path('', read_views.getData),
     path('signup/', views.addUser),
     path('upload/', views.addItem),
+    path('upload/presign/', views.presignUpload),
+    path('upload/finalize/', views.finalizeUpload),
     path('update-profile/', views.update_profile),
-    path('item/<slug:slug>/', views.getItem),
+    path('item/<slug:slug>/', read_views.getItem),
+    path('item/<slug:slug>/similar/', views.getSimilarItems),
+    path('item/<slug:slug>/also-saved/', views.getCoSavedItems),
+    path('items/batch/', views.getItemsBatch),
     path('item-images/<slug:slug>/', views.getItemAdditionalImages),
-    path('category/<str:item_category_name>/', views.getCatItems),
-    path('search/<str:search_query>/', views.getSearchItems),
-    path('searchq/<str:search_query>/', views.getSearchqItems),
+    path('category/<str:item_category_name>/', read_views.getCatItems),
+    path('trending/', views.getTrending),
+    path('trending/<str:item_category_name>/', views.getTrending),
+    path('most-viewed/', views.getMostViewed),
+    path('most-viewed/<str:item_category_name>/', views.getMostViewed),
+    path('search/<str:search_query>/', read_views.getSearchItems),
+    path('searchq/<str:search_query>/', read_views.getSearchqItems),
     path('save/<str:username>/<slug:slug>/', views.save_item),
     path('saved-items/<str:username>/', views.getSavedItems),
     path('profile/<str:username>/', views.getProfile),
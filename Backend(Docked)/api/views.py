@@ -11,13 +11,23 @@ from django.shortcuts import get_object_or_404
 from rest_framework import status
 from django.db.models import Q
 from django.core.cache import cache
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.conf import settings
 import time
 import logging
 
-from shopiet.models import Item, Images, User, Profile, SavedItem, Message
+from shopiet.models import Item, Images, User, Profile, SavedItem, SimilarItem, Message, Conversation, MessageArchive
+from shopiet.view_counts import most_viewed_items, record_view
+from shopiet import trending
+from shopiet.direct_uploads import (DirectUploadError, close_staged, direct_uploads_enabled, discard_staged,
+                                    open_all_staged, presign_upload)
+from shopiet.image_processing import release_images, store_images
+from shopiet.recommendations import (
+    co_saved_items, invalidate_similar_items, record_co_save, refresh_similar_items, similar_items_cache_key
+)
 from api.serialisers import (ItemSerializer, ItemSearchSerializer, ImagesSerializer, 
                          SavedItemsSerializer, AddUserSerializer, AddItemSerializer, 
                          ProfileSerializer, MessageSerializer, ChatSerializer)
@@ -32,12 +42,19 @@ from backend.custom_metrics import (
     track_search_operation, track_message_sent, track_cache_operation,
     track_api_performance, add_business_context
 )
+from backend.cache_batch import cache_batch
+from backend.db_router import primary_reads
+from backend.notifications import notify_read
+from backend.single_flight import single_flight
 from opentelemetry import trace, metrics
 
 logger = logging.getLogger(__name__)
 tracer = trace.get_tracer(__name__)
 meter = metrics.get_meter(__name__)
 
+# Upper bound on slugs accepted by getItemsBatch
+ITEM_BATCH_MAX_SLUGS = 50
+
 
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
     @classmethod
@@ -84,57 +101,93 @@ class MyTokenObtainPairView(TokenObtainPairView):
                 raise
 
 
+# Cache payload builders, coalesced so concurrent misses share one query
+@single_flight(lambda: 'all_items', timeout=300)
+def load_all_items_payload():
+    """Serialized feed of all items"""
+    with tracer.start_as_current_span("db.query.all_items") as span:
+        start_time = time.time()
+        data = ItemSerializer(Item.objects.all(), many=True).data
+        span.set_attribute("db.query.duration", time.time() - start_time)
+        return data
+
+
+@single_flight(lambda slug: f'item_{slug}', timeout=360)
+def load_item_payload(slug):
+    """Serialized item detail, or None when the slug does not exist"""
+    try:
+        item = Item.objects.get(slug=slug)
+    except Item.DoesNotExist:
+        return None
+    return ItemSerializer(item).data
+
+
+@single_flight(lambda item_category_name: f'category_items_{item_category_name}', timeout=360)
+def load_category_payload(item_category_name):
+    """Serialized items for one category"""
+    category_items = Item.objects.filter(item_category_name=item_category_name)
+    return ItemSerializer(category_items, many=True).data
+
+
+@single_flight(similar_items_cache_key, timeout=3600)
+def load_similar_payload(slug):
+    """Serialized precomputed similar items for one item"""
+    similar = (
+        SimilarItem.objects.filter(item__slug=slug)
+        .select_related('similar')
+        .prefetch_related('similar__images')
+        .order_by('-score')[:settings.SIMILAR_ITEMS_TOP_K]
+    )
+    return [ItemSerializer(row.similar).data for row in similar]
+
+
 @api_view(['GET'])
 @track_api_performance('get_data')
 def getData(request):
     """Get all items with caching and observability"""
     cache_key = 'all_items'
     
-    with tracer.start_as_current_span("get_all_items") as span:
+    with tracer.start_as_current_span("get_all_items") as span, cache_batch() as batch:
         span.set_attribute("cache.key", cache_key)
         
         # Check cache first
-        cached_data = cache.get(cache_key)
+        cached_data = batch.get(cache_key)
         if cached_data:
-            track_cache_operation("get", cache_key, hit=True)
+            batch.track("get", cache_key, hit=True)
             span.set_attribute("cache.hit", True)
             span.set_attribute("items.count", len(cached_data))
             return Response(cached_data)
         
-        track_cache_operation("get", cache_key, hit=False)
+        batch.track("get", cache_key, hit=False)
         span.set_attribute("cache.hit", False)
         
-        # Query database
-        with tracer.start_as_current_span("db.query.all_items"):
-            start_time = time.time()
-            items = Item.objects.all()
-            query_duration = time.time() - start_time
-            
-            serializer = ItemSerializer(items, many=True)
-            cache.set(cache_key, serializer.data, timeout=300)
-            
-            # Track metrics
-            track_cache_operation("set", cache_key, hit=True)
-            span.set_attribute("db.query.duration", query_duration)
-            span.set_attribute("items.count", len(serializer.data))
-            
-            return Response(serializer.data)
+        # Query database, one caller per key at a time
+        data = load_all_items_payload()
+        span.set_attribute("items.count", len(data))
+        
+        return Response(data)
 
 
 @receiver(post_save, sender=Item)
 @receiver(post_delete, sender=Item)
 def invalidate_cache(sender, instance, **kwargs):
-    """Invalidate cache when items change"""
-    cache_key = 'all_items'
-    cache.delete(cache_key)
-    track_cache_operation("delete", cache_key, hit=True)
+    """Invalidate feed, category and detail caches when items change"""
+    cache_keys = [
+        'all_items',
+        f'category_items_{instance.item_category_name}',
+        f'item_{instance.slug}',
+    ]
+    with cache_batch() as batch:
+        batch.delete_many(cache_keys)
+        for cache_key in cache_keys:
+            batch.track("delete", cache_key, hit=True)
 
 
 @api_view(['GET'])
 @track_api_performance('get_profile')
 def getProfile(request, username):
     """Get user profile with observability"""
-    with track_business_operation("get_user_profile", username=username):
+    with trace_business_operation("get_user_profile", username=username):
         try:
             user = User.objects.get(username=username)
         except User.DoesNotExist:
@@ -160,49 +213,133 @@ def getItem(request, slug):
     """Get item details with caching and view tracking"""
     cache_key = f'item_{slug}'
     
-    with tracer.start_as_current_span("get_item_details") as span:
+    with tracer.start_as_current_span("get_item_details") as span, cache_batch() as batch:
         span.set_attribute("item.slug", slug)
         
         # Check cache
-        cached_item = cache.get(cache_key)
+        cached_item = batch.get(cache_key)
         if cached_item:
-            track_cache_operation("get", cache_key, hit=True)
+            batch.track("get", cache_key, hit=True)
             span.set_attribute("cache.hit", True)
             
             # Track view
             user_id = str(request.user.id) if request.user.is_authenticated else None
             track_item_view(slug, user_id)
+            record_view(slug)
+            trending.record_signal(slug, cached_item.get('item_category_name'), 'view')
             
             return Response(cached_item)
 
-        track_cache_operation("get", cache_key, hit=False)
+        batch.track("get", cache_key, hit=False)
         span.set_attribute("cache.hit", False)
 
-        try:
-            item = Item.objects.get(slug=slug)
-            serializer = ItemSerializer(item)
-            data = serializer.data
-            cache.set(cache_key, data, timeout=360)
-            
-            # Track view and cache set
-            user_id = str(request.user.id) if request.user.is_authenticated else None
-            track_item_view(slug, user_id, item.item_category_name)
-            track_cache_operation("set", cache_key, hit=True)
-            
-            span.set_attribute("item.category", item.item_category_name)
-            span.set_attribute("item.price", float(item.item_price))
-            
-            return Response(data)
-            
-        except Item.DoesNotExist:
+        data = load_item_payload(slug)
+        if data is None:
             return Response(status=status.HTTP_404_NOT_FOUND)
 
+        # Track view
+        user_id = str(request.user.id) if request.user.is_authenticated else None
+        track_item_view(slug, user_id, data['item_category_name'])
+        record_view(slug)
+        trending.record_signal(slug, data['item_category_name'], 'view')
+        
+        span.set_attribute("item.category", data['item_category_name'])
+        span.set_attribute("item.price", float(data['item_price']))
+        
+        return Response(data)
+
+
+@api_view(['GET'])
+@track_api_performance('get_similar_items')
+def getSimilarItems(request, slug):
+    """Get precomputed similar items for an item"""
+    cache_key = similar_items_cache_key(slug)
+
+    with tracer.start_as_current_span("get_similar_items") as span, cache_batch() as batch:
+        span.set_attribute("item.slug", slug)
+
+        cached_items = batch.get(cache_key)
+        if cached_items is not None:
+            batch.track("get", cache_key, hit=True)
+            span.set_attribute("cache.hit", True)
+            return Response(cached_items)
+
+        batch.track("get", cache_key, hit=False)
+        span.set_attribute("cache.hit", False)
+
+        data = load_similar_payload(slug)
+        span.set_attribute("items.count", len(data))
+        return Response(data)
+
+
+@api_view(['GET'])
+@track_api_performance('get_co_saved_items')
+def getCoSavedItems(request, slug):
+    """Get items that users who saved this item also saved"""
+    with tracer.start_as_current_span("get_co_saved_items") as span:
+        span.set_attribute("item.slug", slug)
+        item = get_object_or_404(Item, slug=slug)
+        data = [ItemSerializer(row.other).data for row in co_saved_items(item.id)]
+        span.set_attribute("items.count", len(data))
+        return Response(data)
+
+
+@api_view(['GET'])
+@track_api_performance('get_items_batch')
+def getItemsBatch(request):
+    """Get several items by slug with one MGET and one query for the misses"""
+    slugs = [slug for slug in request.query_params.get('slugs', '').split(',') if slug]
+    # Preserve request order while dropping duplicates
+    slugs = list(dict.fromkeys(slugs))
+
+    if not slugs:
+        return Response({'error': 'No slugs provided'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(slugs) > ITEM_BATCH_MAX_SLUGS:
+        return Response({'error': f'At most {ITEM_BATCH_MAX_SLUGS} slugs per request'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    with tracer.start_as_current_span("get_items_batch") as span, cache_batch() as batch:
+        span.set_attribute("items.requested", len(slugs))
+
+        # One MGET for every cached payload
+        cache_keys = {slug: f'item_{slug}' for slug in slugs}
+        cached = batch.get_many(cache_keys.values())
+        found = {slug: cached[key] for slug, key in cache_keys.items() if key in cached}
+        for slug, key in cache_keys.items():
+            batch.track("get", key, hit=slug in found)
+
+        misses = [slug for slug in slugs if slug not in found]
+        span.set_attribute("cache.hits", len(found))
+        span.set_attribute("cache.misses", len(misses))
+
+        if misses:
+            # One query for the misses, images included
+            # Back-filled into the shared cache, so read from the primary
+            with tracer.start_as_current_span("db.query.items_batch"), primary_reads():
+                items = Item.objects.filter(slug__in=misses).prefetch_related('images')
+                fresh = {item.slug: ItemSerializer(item).data for item in items}
+
+            if fresh:
+                # Back-filled in the batch's single pipelined flush
+                batch.set_many({cache_keys[slug]: data for slug, data in fresh.items()}, timeout=360)
+                for slug in fresh:
+                    batch.track("set", cache_keys[slug], hit=True)
+            found.update(fresh)
+
+        response_data = {
+            'items': [found[slug] for slug in slugs if slug in found],
+            'missing': [slug for slug in slugs if slug not in found],
+        }
+        span.set_attribute("items.count", len(response_data['items']))
+
+        return Response(response_data)
+
 
 @api_view(['GET'])
 @track_api_performance('get_conversations')
 def getConvos(request, username):
     """Get user conversations with observability"""
-    with track_business_operation("get_conversations", username=username):
+    with trace_business_operation("get_conversations", username=username):
         try:
             user = User.objects.get(username=username)
             messages = Message.objects.get_user_conversations(user)
@@ -217,7 +354,7 @@ def getConvos(request, username):
 @track_api_performance('get_item_images')
 def getItemAdditionalImages(request, slug):
     """Get additional images for an item"""
-    with track_business_operation("get_item_images", item_slug=slug):
+    with trace_business_operation("get_item_images", item_slug=slug):
         item = get_object_or_404(Item, slug=slug)
         images = Images.objects.filter(item=item)
         serializer = ImagesSerializer(images, many=True)
@@ -229,7 +366,7 @@ def getItemAdditionalImages(request, slug):
 def save_item(request, username, slug):
     """Save/unsave item with observability"""
     if request.method == 'POST':
-        with track_business_operation("save_item", username=username, item_slug=slug):
+        with trace_business_operation("save_item", username=username, item_slug=slug):
             try:
                 user = User.objects.get(username=username)
             except User.DoesNotExist:
@@ -243,11 +380,16 @@ def save_item(request, username, slug):
             if SavedItem.objects.filter(user=user, item=item).exists():
                 return Response({'error': 'Item already saved'}, status=status.HTTP_400_BAD_REQUEST)
 
-            saved_item = SavedItem(user=user, item=item)
-            saved_item.save()
+            try:
+                saved_item = SavedItem.objects.create(user=user, item=item)
+            except IntegrityError:
+                # Lost a race with a concurrent save of the same item
+                return Response({'error': 'Item already saved'}, status=status.HTTP_400_BAD_REQUEST)
 
             # Track the save action
             track_item_save(slug, str(user.id), "save")
+            trending.record_signal(slug, item.item_category_name, 'save')
+            record_co_save(user.id, item.id)
 
             serializer = SavedItemsSerializer(saved_item)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -257,7 +399,7 @@ def save_item(request, username, slug):
 @track_api_performance('get_saved_items')
 def getSavedItems(request, username):
     """Get user's saved items"""
-    with track_business_operation("get_saved_items", username=username):
+    with trace_business_operation("get_saved_items", username=username):
         try:
             user = User.objects.get(username=username)
         except User.DoesNotExist:
@@ -275,7 +417,7 @@ def getSavedItems(request, username):
 def addUser(request):
     """User registration with observability"""
     if request.method == 'POST':
-        with track_business_operation("user_registration"):
+        with trace_business_operation("user_registration"):
             serializer = AddUserSerializer(data=request.data)
             if serializer.is_valid():
                 username = serializer.validated_data["username"]
@@ -321,75 +463,166 @@ def getCatItems(request, item_category_name):
     """Get items by category with caching"""
     cache_key = f'category_items_{item_category_name}'
     
-    with tracer.start_as_current_span("get_category_items") as span:
+    with tracer.start_as_current_span("get_category_items") as span, cache_batch() as batch:
         span.set_attribute("category.name", item_category_name)
         
-        cached_items = cache.get(cache_key)
+        cached_items = batch.get(cache_key)
         if cached_items:
-            track_cache_operation("get", cache_key, hit=True)
+            batch.track("get", cache_key, hit=True)
             span.set_attribute("cache.hit", True)
             return Response(cached_items)
 
-        track_cache_operation("get", cache_key, hit=False)
+        batch.track("get", cache_key, hit=False)
         span.set_attribute("cache.hit", False)
 
-        try:
-            category_items = Item.objects.filter(item_category_name=item_category_name)
-            serializer = ItemSerializer(category_items, many=True)
-            data = serializer.data
-            cache.set(cache_key, data, timeout=360)
-            
-            track_cache_operation("set", cache_key, hit=True)
-            span.set_attribute("items.count", len(data))
-            
-            return Response(data)
-        except Item.DoesNotExist:
-            return Response(status=status.HTTP_404_NOT_FOUND)
+        data = load_category_payload(item_category_name)
+        span.set_attribute("items.count", len(data))
+        
+        return Response(data)
+
+
+@api_view(['GET'])
+@track_api_performance('get_trending')
+def getTrending(request, item_category_name=None):
+    """Get a page of trending items, optionally within one category"""
+    try:
+        page = max(int(request.query_params.get('page', 1)), 1)
+        page_size = min(max(int(request.query_params.get('page_size', settings.TRENDING_PAGE_SIZE)), 1), 100)
+    except ValueError:
+        return Response({'error': 'page and page_size must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+    with tracer.start_as_current_span("get_trending_items") as span:
+        span.set_attribute("category.name", item_category_name or "all")
+        span.set_attribute("trending.page", page)
+
+        ranked, total = trending.trending_page(item_category_name, page, page_size)
+        scores = dict(ranked)
+
+        items = Item.objects.filter(slug__in=scores).prefetch_related('images')
+        by_slug = {item.slug: item for item in items}
+        results = []
+        for slug, score in ranked:
+            if slug in by_slug:
+                data = ItemSerializer(by_slug[slug]).data
+                data['trending_score'] = round(score, 4)
+                results.append(data)
+
+        span.set_attribute("items.count", len(results))
+
+        return Response({
+            'page': page,
+            'page_size': page_size,
+            'count': total,
+            'results': results,
+        })
+
+
+@api_view(['GET'])
+@track_api_performance('get_most_viewed')
+def getMostViewed(request, item_category_name=None):
+    """Get a page of items ordered by view count, optionally within one category"""
+    try:
+        page = max(int(request.query_params.get('page', 1)), 1)
+        page_size = min(max(int(request.query_params.get('page_size', settings.TRENDING_PAGE_SIZE)), 1), 100)
+    except ValueError:
+        return Response({'error': 'page and page_size must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+    with tracer.start_as_current_span("get_most_viewed_items") as span:
+        span.set_attribute("category.name", item_category_name or "all")
+        span.set_attribute("most_viewed.page", page)
+
+        items = most_viewed_items(item_category_name)
+        start = (page - 1) * page_size
+        results = ItemSerializer(items.prefetch_related('images')[start:start + page_size], many=True).data
+        span.set_attribute("items.count", len(results))
+
+        return Response({
+            'page': page,
+            'page_size': page_size,
+            'count': items.count(),
+            'results': results,
+        })
+
+
+@receiver(pre_delete, sender=Item)
+def invalidate_deleted_similar_items(sender, instance, **kwargs):
+    """Drop cached similar-items lists that show the deleted item; the cascade removes its rows"""
+    slugs = [instance.slug, *Item.objects.filter(similar_items__similar=instance).values_list('slug', flat=True)]
+    transaction.on_commit(lambda: invalidate_similar_items(slugs))
+
+
+@receiver(post_delete, sender=Item)
+def remove_trending_item(sender, instance, **kwargs):
+    """Drop deleted items from the trending rankings"""
+    trending.remove_item(instance.slug, instance.item_category_name)
 
 
-@receiver(post_save, sender=Item)
 @receiver(post_delete, sender=Item)
-def invalidate_category_cache(sender, instance, **kwargs):
-    """Invalidate category cache when items change"""
-    cache_key = f'category_items_{instance.item_category_name}'
-    cache.delete(cache_key)
-    track_cache_operation("delete", cache_key, hit=True)
+def release_item_thumbnail(sender, instance, **kwargs):
+    """Release the deleted item's thumbnail blob"""
+    release_images([instance.item_thumbnail.name])
+
+
+@receiver(post_delete, sender=Images)
+def release_item_image(sender, instance, **kwargs):
+    """Release the deleted image's blob"""
+    release_images([instance.image.name])
 
 
 @api_view(['GET'])
 @track_api_performance('get_messages')
 def getMessages(request, roomname):
     """Get messages with caching and observability"""
-    with track_business_operation("get_messages", room=roomname):
+    with trace_business_operation("get_messages", room=roomname), cache_batch() as batch:
         try:
+            users = roomname.split('_')
+            if len(users) != 2:
+                return Response({"error": "Invalid room name"}, status=400)
+
+            after_seq = request.query_params.get('after_seq')
+            if after_seq is not None:
+                try:
+                    after_seq = int(after_seq)
+                except ValueError:
+                    return Response({"error": "after_seq must be an integer"}, status=400)
+
+            conversation = Conversation.objects.between_usernames(users[0], users[1])
+            # Advancing the watermark is a single-row UPDATE, skipped when nothing is unread
+            if conversation is not None and request.user.id in (conversation.user_low_id, conversation.user_high_id):
+                if conversation.mark_read(request.user.id):
+                    notify_read(conversation, request.user)
+
+            # Catching up after a reconnect only needs what was missed
+            if after_seq is not None:
+                if conversation is None:
+                    return Response([])
+                messages = conversation.messages_after(after_seq).select_related('sender', 'recipient')
+                return Response(MessageSerializer(messages, many=True).data)
+
             cache_key = f'messages_{roomname}'
-            cached_messages = cache.get(cache_key)
+            cached_messages = batch.get(cache_key)
 
             if cached_messages:
-                track_cache_operation("get", cache_key, hit=True)
+                batch.track("get", cache_key, hit=True)
                 return Response(cached_messages)
 
-            track_cache_operation("get", cache_key, hit=False)
+            batch.track("get", cache_key, hit=False)
 
-            users = roomname.split('_')
-            if len(users) != 2:
-                return Response({"error": "Invalid room name"}, status=400)
-
-            messages = Message.objects.filter(
-                (Q(sender__username=users[0]) & Q(recipient__username=users[1])) |
-                (Q(sender__username=users[1]) & Q(recipient__username=users[0]))
-            ).order_by('timestamp')
-            
-            current_user = request.user.username
-            is_recipient = (current_user == users[0] or current_user == users[1])
-            if is_recipient:
-                messages.update(viewed=True)
-
-            serializer = MessageSerializer(messages, many=True)
-            cache.set(cache_key, serializer.data, timeout=300)
-            track_cache_operation("set", cache_key, hit=True)
+            if conversation is None:
+                data = []
+            else:
+                # Bounded by the conversation's start so older partitions are skipped;
+                # read from the primary as the result is cached for both participants
+                with primary_reads():
+                    messages = conversation.live_messages().select_related(
+                        'sender', 'recipient'
+                    ).order_by('id')
+                    data = MessageArchive.objects.history(conversation) + MessageSerializer(messages, many=True).data
+
+            batch.set(cache_key, data, timeout=300)
+            batch.track("set", cache_key, hit=True)
             
-            return Response(serializer.data)
+            return Response(data)
         except Exception as e:
             logger.error(f"Error getting messages for room {roomname}: {e}")
             return Response({"error": str(e)}, status=500)
@@ -400,17 +633,19 @@ def invalidate_message_cache(sender, instance, **kwargs):
     """Invalidate message cache and track message"""
     roomname = f'{instance.sender.username}_{instance.recipient.username}'
     cache_key = f'messages_{roomname}'
-    cache.delete(cache_key)
     
     reverse_roomname = f'{instance.recipient.username}_{instance.sender.username}'
     reverse_cache_key = f'messages_{reverse_roomname}'
-    cache.delete(reverse_cache_key)
+
+    # Both room orientations go out in one round trip
+    with cache_batch() as batch:
+        batch.delete_many([cache_key, reverse_cache_key])
     
     # Track message sent
     track_message_sent(
         str(instance.sender.id), 
         str(instance.recipient.id), 
-        len(instance.content)
+        len(instance.body)
     )
 
 
@@ -421,7 +656,7 @@ def getSearchItems(request, search_query):
     start_time = time.time()
     user_id = str(request.user.id) if request.user.is_authenticated else None
     
-    with track_business_operation("search_items", query=search_query[:50]):
+    with trace_business_operation("search_items", query=search_query[:50]):
         try:
             items = Item.objects.filter(item_name__icontains=search_query)
             serializer = ItemSearchSerializer(items, many=True)
@@ -445,7 +680,7 @@ def getSearchqItems(request, search_query):
     """Detailed search with full item data"""
     user_id = str(request.user.id) if request.user.is_authenticated else None
     
-    with track_business_operation("search_items_detailed", query=search_query[:50]):
+    with trace_business_operation("search_items_detailed", query=search_query[:50]):
         try:
             items = Item.objects.filter(item_name__icontains=search_query)
             serializer = ItemSerializer(items, many=True)
@@ -464,7 +699,7 @@ def update_profile(request):
     if request.method == 'POST':
         username = request.data.get('username')
         
-        with track_business_operation("update_profile", username=username):
+        with trace_business_operation("update_profile", username=username):
             try:
                 user = User.objects.get(username=username)
             except User.DoesNotExist:
@@ -482,6 +717,52 @@ def update_profile(request):
             return Response(serializer.errors, status=400)
 
 
+def _create_item(serializer, user, additional_images):
+    """Store the validated thumbnail and additional images and create the item"""
+    # Compress and store the thumbnail and every additional image at once
+    thumbnail = serializer.validated_data['item_thumbnail']
+    try:
+        stored = store_images(
+            [(thumbnail, Item.item_thumbnail.field.upload_to)]
+            + [(image, Images.image.field.upload_to) for image in additional_images]
+        )
+    except Exception as e:
+        logger.error(f"Could not store images for new item from {user.username}: {e}")
+        return Response({'error': 'Could not store images'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    # Stored names are assigned as committed files, so the models skip recompressing them
+    try:
+        with transaction.atomic():
+            item = serializer.save(item_thumbnail=stored[0].name,
+                                   item_thumbnail_placeholder=stored[0].placeholder)
+            Images.objects.bulk_create([
+                Images(item=item, image=image.name, image_placeholder=image.placeholder)
+                for image in stored[1:]
+            ])
+    except Exception:
+        release_images([image.name for image in stored])
+        raise
+
+    # Link the new listing into the similar items table
+    try:
+        refresh_similar_items(item)
+    except Exception as e:
+        logger.warning(f"Could not refresh similar items for {item.slug}: {e}")
+
+    # Track item creation
+    track_item_creation(
+        item.slug, 
+        str(user.id), 
+        getattr(item, 'item_category_name', 'unknown')
+    )
+
+    response_data = {
+        'message': 'Item uploaded successfully',
+        'slug': item.slug
+    }
+    return Response(response_data, status=status.HTTP_201_CREATED)
+
+
 @api_view(['POST'])
 @track_api_performance('add_item')
 def addItem(request):
@@ -489,7 +770,7 @@ def addItem(request):
     if request.method == 'POST':
         item_username = request.data.get('item_username')
         
-        with track_business_operation("add_item", username=item_username):
+        with trace_business_operation("add_item", username=item_username):
             try:
                 user = User.objects.get(username=item_username)
             except User.DoesNotExist:
@@ -501,26 +782,68 @@ def addItem(request):
             except ValidationError as e:
                 return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-            item = serializer.save()
-
-            # Handle additional images
-            if 'additional_images' in request.FILES:
-                additional_images = request.FILES.getlist('additional_images')
-                for image in additional_images:
-                    Images.objects.create(item=item, image=image)
-
-            # Track item creation
-            track_item_creation(
-                item.slug, 
-                str(user.id), 
-                getattr(item, 'item_category_name', 'unknown')
-            )
-
-            response_data = {
-                'message': 'Item uploaded successfully',
-                'slug': item.slug
-            }
-            return Response(response_data, status=status.HTTP_201_CREATED)
+            return _create_item(serializer, user, request.FILES.getlist('additional_images'))
+
+
+@api_view(['POST'])
+@track_api_performance('presign_upload')
+def presignUpload(request):
+    """Presigned form for uploading one item image straight to the media bucket"""
+    if not direct_uploads_enabled():
+        return Response({'error': 'Direct uploads need object storage'}, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+    # Staging keys are scoped to the authenticated user, never to a name in the body
+    item_username = request.user.username
+    if request.data.get('item_username', item_username) != item_username:
+        return Response({'error': 'You can only upload your own items'}, status=status.HTTP_403_FORBIDDEN)
+
+    try:
+        data = presign_upload(item_username, request.data.get('filename', ''), request.data.get('content_type', ''))
+    except DirectUploadError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(data)
+
+
+@api_view(['POST'])
+@track_api_performance('finalize_upload')
+def finalizeUpload(request):
+    """Create an item from images already uploaded to the bucket with presignUpload"""
+    if not direct_uploads_enabled():
+        return Response({'error': 'Direct uploads need object storage'}, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+    user = request.user
+    item_username = user.username
+    if request.data.get('item_username', item_username) != item_username:
+        return Response({'error': 'You can only upload your own items'}, status=status.HTTP_403_FORBIDDEN)
+
+    with trace_business_operation("finalize_upload", username=item_username):
+        thumbnail_key = request.data.get('thumbnail_key')
+        image_keys = request.data.get('image_keys') or []
+        if not isinstance(image_keys, list):
+            return Response({'error': 'image_keys must be a list'}, status=status.HTTP_400_BAD_REQUEST)
+        keys = [thumbnail_key] + image_keys
+        try:
+            staged = open_all_staged(item_username, keys)
+        except DirectUploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            data = {key: value for key, value in request.data.items() if key not in ('thumbnail_key', 'image_keys')}
+            data['item_username'] = item_username
+            data['item_thumbnail'] = staged[0]
+            serializer = AddItemSerializer(data=data)
+            try:
+                serializer.is_valid(raise_exception=True)
+            except ValidationError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            response = _create_item(serializer, user, staged[1:])
+        finally:
+            close_staged(staged)
+
+        if response.status_code == status.HTTP_201_CREATED:
+            discard_staged(keys)
+        return response
 
 
 # Health check endpoint
@@ -11,8 +11,8 @@ import os
 
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
 import backend.routing
+from backend.ws_auth import JWTAuthMiddlewareStack
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -24,7 +24,7 @@ print(f"ASGI DJANGO_SETTINGS_MODULE: {os.getenv('DJANGO_SETTINGS_MODULE')}")
 print(f"ASGI REDIS_URL: {os.getenv('REDIS_URL')}")
 application = ProtocolTypeRouter({
     'http':get_asgi_application(),
-'websocket':AuthMiddlewareStack(
+'websocket':JWTAuthMiddlewareStack(
     URLRouter(
         backend.routing.websocket_urlpatterns
     )
@@ -0,0 +1,182 @@
+"""
+Cache batching for Shopiet
+Collects cache gets, sets and deletes issued during a request or a signal
+burst and sends them to Redis as a single pipeline.
+"""
+
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from opentelemetry import trace
+
+from backend.custom_metrics import track_cache_operation
+
+logger = logging.getLogger(__name__)
+tracer = trace.get_tracer(__name__)
+
+_current_batch: ContextVar[Optional['CacheBatch']] = ContextVar('shopiet_cache_batch', default=None)
+
+
+class CacheBatch:
+    """Queue of pending cache writes flushed in one round trip"""
+
+    def __init__(self, alias: str = DEFAULT_CACHE_ALIAS):
+        self.cache = caches[alias]
+        self._pending: List[Tuple[str, str, Any, Any]] = []
+        self._tracked: List[Tuple[str, str, bool]] = []
+        self.round_trips = 0
+        self.operations = 0
+
+    @property
+    def _redis_client(self):
+        """django-redis client, or None when the cache is not Redis backed"""
+        client = getattr(self.cache, 'client', None)
+        if client is None or not hasattr(client, 'get_client'):
+            return None
+        return client
+
+    def set(self, key: str, value: Any, timeout=DEFAULT_TIMEOUT):
+        self._pending.append(('set', key, value, timeout))
+
+    def set_many(self, mapping: Dict[str, Any], timeout=DEFAULT_TIMEOUT):
+        for key, value in mapping.items():
+            self.set(key, value, timeout)
+
+    def delete(self, key: str):
+        self._pending.append(('delete', key, None, None))
+
+    def delete_many(self, keys: Iterable[str]):
+        for key in keys:
+            self.delete(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Read a key, sending any pending writes in the same round trip"""
+        return self.get_many([key]).get(key, default)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Read several keys, sending any pending writes in the same round trip"""
+        keys = list(keys)
+        pending, self._pending = self._pending, []
+        return self._execute(pending, keys)
+
+    def track(self, operation: str, key: str, hit: bool):
+        """Defer a track_cache_operation call until the batch is flushed"""
+        self._tracked.append((operation, key, hit))
+
+    def flush(self):
+        """Send pending writes and emit deferred cache metrics"""
+        pending, self._pending = self._pending, []
+        if pending:
+            self._execute(pending, [])
+
+        tracked, self._tracked = self._tracked, []
+        for operation, key, hit in tracked:
+            track_cache_operation(operation, key, hit)
+
+    def _execute(self, pending: List[Tuple[str, str, Any, Any]], read_keys: List[str]) -> Dict[str, Any]:
+        if not pending and not read_keys:
+            return {}
+
+        self.round_trips += 1
+        self.operations += len(pending) + len(read_keys)
+
+        with tracer.start_as_current_span("cache.batch.execute") as span:
+            span.set_attribute("cache.batch.writes", len(pending))
+            span.set_attribute("cache.batch.reads", len(read_keys))
+
+            client = self._redis_client
+            if client is None:
+                return self._execute_fallback(pending, read_keys)
+
+            pipe = client.get_client(write=True).pipeline(transaction=False)
+            for operation, key, value, timeout in pending:
+                redis_key = client.make_key(key)
+                if operation == 'delete':
+                    pipe.delete(redis_key)
+                    continue
+
+                # Same conversion as django-redis: seconds, not get_backend_timeout's epoch
+                if timeout is DEFAULT_TIMEOUT:
+                    timeout = self.cache.default_timeout
+                if timeout is None:
+                    pipe.set(redis_key, client.encode(value))
+                elif int(timeout * 1000) <= 0:
+                    pipe.delete(redis_key)
+                else:
+                    pipe.set(redis_key, client.encode(value), px=int(timeout * 1000))
+
+            for key in read_keys:
+                pipe.get(client.make_key(key))
+
+            results = pipe.execute()
+
+        values = results[len(pending):]
+        return {
+            key: client.decode(value)
+            for key, value in zip(read_keys, values)
+            if value is not None
+        }
+
+    def _execute_fallback(self, pending, read_keys) -> Dict[str, Any]:
+        """Apply queued operations in order against a non-Redis cache"""
+        for operation, key, value, timeout in pending:
+            if operation == 'delete':
+                self.cache.delete(key)
+            else:
+                self.cache.set(key, value, timeout)
+        return self.cache.get_many(read_keys) if read_keys else {}
+
+
+def current_batch() -> Optional[CacheBatch]:
+    """Return the batch open in this context, if any"""
+    return _current_batch.get()
+
+
+@contextmanager
+def cache_batch(alias: str = DEFAULT_CACHE_ALIAS):
+    """Open a cache batch, joining the enclosing one when already inside a batch"""
+    batch = _current_batch.get()
+    if batch is not None:
+        yield batch
+        return
+
+    batch = CacheBatch(alias)
+    token = _current_batch.set(batch)
+    try:
+        yield batch
+    finally:
+        _current_batch.reset(token)
+        try:
+            batch.flush()
+        except Exception as e:
+            logger.warning(f"Cache batch flush failed: {e}")
+
+        span = trace.get_current_span()
+        span.set_attribute("cache.round_trips", batch.round_trips)
+        span.set_attribute("cache.operations", batch.operations)
+
+
+class CacheBatchMiddleware:
+    """Wrap each request in a cache batch so its cache traffic shares round trips
+
+    Under ASGI the sync views run in worker threads and open their own batch,
+    so the async path only passes the request through.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.get_response(request)
+        with cache_batch():
+            return self.get_response(request)
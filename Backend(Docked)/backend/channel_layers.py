@@ -0,0 +1,42 @@
+"""
+Sharded Redis channel layer
+channels_redis already spreads groups and channels over several hosts, but
+its CRC ring remaps most keys whenever a host is added. This layer keeps the
+same wire format and swaps the placement for jump consistent hashing, so
+growing from N to N+1 shards moves only about 1/(N+1) of the rooms. A room's
+group membership lives on the shard its group name hashes to.
+
+Every process must list the shards in CHANNEL_REDIS_SHARDS in the same order.
+"""
+
+import hashlib
+
+from channels_redis.core import RedisChannelLayer
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """Lamping & Veach jump consistent hash of a 64-bit key into [0, buckets)"""
+    bucket, candidate = -1, 0
+    while candidate < buckets:
+        bucket = candidate
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        candidate = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_for(value, shards: int) -> int:
+    """Shard index of a group or channel name"""
+    if shards == 1:
+        return 0
+    if isinstance(value, str):
+        value = value.encode('utf8')
+    # Stable across processes, unlike hash()
+    key = int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), 'big')
+    return jump_hash(key, shards)
+
+
+class ShardedRedisChannelLayer(RedisChannelLayer):
+    """RedisChannelLayer that places keys on shards with jump consistent hashing"""
+
+    def consistent_hash(self, value):
+        return shard_for(value, self.ring_size)
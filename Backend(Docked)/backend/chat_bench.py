@@ -0,0 +1,199 @@
+"""
+Load harness for chat consumers
+Drives a consumer through Channels' WebsocketCommunicator on an in-memory
+channel layer: N rooms with M sockets each, every room sending K messages.
+Reports sent and delivered messages per second, fan-out latency percentiles
+(send to arrival on each socket in the room), database writes per second and
+Python heap per open socket. Run through the bench_chat management command,
+which points the database at a throwaway test database.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Dict, List
+
+from channels.layers import channel_layers
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+IN_MEMORY_LAYER = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer', 'CONFIG': {'capacity': 10000}}}
+WRITE_PREFIXES = ('INSERT', 'UPDATE', 'DELETE')
+
+
+@dataclass
+class BenchResult:
+    consumer: str
+    sockets: int
+    messages_sent: int
+    frames_expected: int
+    frames_delivered: int
+    duration: float
+    latencies: List[float]
+    db_writes: int
+    memory_per_socket: float
+
+    def percentile(self, pct: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+    def summary(self) -> Dict[str, float]:
+        duration = self.duration or 1e-9
+        return {
+            'sockets': self.sockets,
+            'sent_per_second': self.messages_sent / duration,
+            'delivered_per_second': self.frames_delivered / duration,
+            'p50_ms': self.percentile(50) * 1000,
+            'p95_ms': self.percentile(95) * 1000,
+            'p99_ms': self.percentile(99) * 1000,
+            'db_writes_per_second': self.db_writes / duration,
+            'kib_per_socket': self.memory_per_socket / 1024,
+            'lost_frames': self.frames_expected - self.frames_delivered,
+        }
+
+
+class WriteCounter:
+    """Count write statements on every database connection opened after install()
+
+    Consumers write from asgiref's long-lived sync thread, whose connection can
+    outlive one benchmark run, so a single installed counter is shared and
+    runs read deltas from it.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+        self._installed = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith(WRITE_PREFIXES):
+            with self._lock:
+                self.count += 1
+        return execute(sql, params, many, context)
+
+    def on_connection_created(self, sender, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def install(self):
+        if not self._installed:
+            connection_created.connect(self.on_connection_created, weak=False)
+            self._installed = True
+        return self
+
+
+write_counter = WriteCounter()
+
+
+def create_room_users(rooms: int) -> List[List[str]]:
+    """Two users per room, returned as [[user_a, user_b], ...]"""
+    pairs = [[f'bench{room}a', f'bench{room}b'] for room in range(rooms)]
+    usernames = [username for pair in pairs for username in pair]
+    existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+    User.objects.bulk_create([User(username=username) for username in usernames if username not in existing])
+    return pairs
+
+
+async def _receive_frames(communicator, expected: int, sent_at: Dict[str, float],
+                          latencies: List[float], timeout: float) -> int:
+    received = 0
+    while received < expected:
+        try:
+            text = await communicator.receive_from(timeout=timeout)
+        except asyncio.TimeoutError:
+            break
+        frame = json.loads(text)
+        if frame.get('type') != 'chat_message':
+            continue
+        started = sent_at.get(frame.get('message'))
+        if started is not None:
+            latencies.append(time.perf_counter() - started)
+            received += 1
+    return received
+
+
+async def _run(consumer_path: str, room_users: List[List[str]], sockets_per_room: int,
+               messages_per_room: int, timeout: float, write_counter: WriteCounter) -> BenchResult:
+    application = import_string(consumer_path).as_asgi()
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    rooms = []
+    for users in room_users:
+        room = '_'.join(users)
+        communicators = []
+        for _ in range(sockets_per_room):
+            communicator = WebsocketCommunicator(application, f'/ws/socket-server/{room}/')
+            communicator.scope['url_route'] = {'args': (), 'kwargs': {'room_name': room}}
+            connected, _ = await communicator.connect()
+            if not connected:
+                raise RuntimeError(f"{consumer_path} refused a socket for {room}")
+            communicators.append(communicator)
+        rooms.append((users, communicators))
+    memory = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    sockets = len(room_users) * sockets_per_room
+    sent_at: Dict[str, float] = {}
+    latencies: List[float] = []
+
+    async def drive_room(index, users, communicators):
+        receivers = [
+            asyncio.ensure_future(_receive_frames(communicator, messages_per_room, sent_at, latencies, timeout))
+            for communicator in communicators
+        ]
+        for number in range(messages_per_room):
+            token = f'bench-{index}-{number}'
+            sent_at[token] = time.perf_counter()
+            await communicators[0].send_to(text_data=json.dumps({
+                'message': token, 'sender': users[0], 'recipient': users[1], 'client_id': token,
+            }))
+        return sum(await asyncio.gather(*receivers))
+
+    writes_before = write_counter.count
+    started = time.perf_counter()
+    delivered = await asyncio.gather(*(drive_room(index, users, communicators)
+                                      for index, (users, communicators) in enumerate(rooms)))
+    duration = time.perf_counter() - started
+    writes = write_counter.count - writes_before
+
+    for _, communicators in rooms:
+        for communicator in communicators:
+            await communicator.disconnect()
+
+    return BenchResult(
+        consumer=consumer_path,
+        sockets=sockets,
+        messages_sent=len(room_users) * messages_per_room,
+        frames_expected=sockets * messages_per_room,
+        frames_delivered=sum(delivered),
+        duration=duration,
+        latencies=latencies,
+        db_writes=writes,
+        memory_per_socket=memory / max(sockets, 1),
+    )
+
+
+def run_chat_bench(consumer_path: str, rooms: int, sockets_per_room: int,
+                   messages_per_room: int, timeout: float = 10.0) -> BenchResult:
+    """Benchmark one consumer class on a fresh in-memory channel layer"""
+    write_counter.install()
+    room_users = create_room_users(rooms)
+    with override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYER):
+        channel_layers.backends.clear()
+        try:
+            return asyncio.run(_run(consumer_path, room_users, sockets_per_room,
+                                    messages_per_room, timeout, write_counter))
+        finally:
+            channel_layers.backends.clear()
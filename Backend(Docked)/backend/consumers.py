@@ -1,66 +1,260 @@
 import json
+import logging
+import time
+from urllib.parse import parse_qs
 from channels.generic.websocket import WebsocketConsumer
 from asgiref.sync import async_to_sync
+from django.conf import settings
 from django.contrib.auth import get_user_model
 
+from backend import chat_sync, presence
+from backend.notifications import notification_group, notify_new_message
+
+logger = logging.getLogger(__name__)
+
 
 
 class ChatConsumer(WebsocketConsumer):
     def connect(self):
         raw_room_name = self.scope['url_route']['kwargs']['room_name']
         users = raw_room_name.split('_')
-        self.room_group_name = '_'.join(sorted(users))
+        self.room_users = sorted(users)
+        self.room_group_name = '_'.join(self.room_users)
+        self.rate_limiter = presence.RateLimiter()
+        self.username = None
+        self.conversation = None
+        self.presence_touched_at = 0.0
         async_to_sync(self.channel_layer.group_add)(
             self.room_group_name,
             self.channel_name
         )
         self.accept()
 
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        self.identify()
+
+        # Reconnecting clients can resume in the handshake itself
+        if query.get('last_seq'):
+            self.resume(query['last_seq'][0])
+
     def disconnect(self, close_code):
         async_to_sync(self.channel_layer.group_discard)(
             self.room_group_name,
             self.channel_name
         )
-    
+        if self.username is not None:
+            try:
+                presence.leave(self.username, self.channel_name)
+                presence.set_typing(self.room_group_name, self.username, False)
+                presence.schedule_room_broadcast(self.room_group_name, self.room_users)
+            except Exception as e:
+                logger.warning(f"Could not record {self.username} leaving {self.room_group_name}: {e}")
+
+    def identify(self):
+        """Attach the socket to the authenticated room participant and mark them online
+
+        The identity comes from the connection scope only, a username in a
+        frame or the query string is never trusted for acks or presence.
+        """
+        user = self.scope.get('user')
+        if self.username is not None or user is None or not user.is_authenticated:
+            return
+        username = user.username
+        if username not in self.room_users:
+            return
+        self.username = username
+        self.presence_touched_at = time.monotonic()
+        try:
+            presence.touch(username, self.channel_name)
+            presence.schedule_room_broadcast(self.room_group_name, self.room_users)
+        except Exception as e:
+            logger.warning(f"Could not record {username} joining {self.room_group_name}: {e}")
+
+    def refresh_presence(self):
+        """Keep the user online while their socket sends anything at all
+
+        Touches Redis at most a few times per PRESENCE_TTL_SECONDS, and tells
+        the room when a user whose presence had lapsed is back.
+        """
+        if self.username is None:
+            return
+        now = time.monotonic()
+        if now - self.presence_touched_at < settings.PRESENCE_TTL_SECONDS / 4:
+            return
+        self.presence_touched_at = now
+        try:
+            if presence.touch(self.username, self.channel_name):
+                presence.schedule_room_broadcast(self.room_group_name, self.room_users)
+        except Exception as e:
+            logger.warning(f"Could not refresh presence for {self.username}: {e}")
 
     def receive(self, text_data):
+        if text_data is None or len(text_data.encode('utf8')) > settings.CHAT_MAX_FRAME_BYTES:
+            # 1009: message too big
+            self.close(code=1009)
+            return
+        try:
+            text_data_json = json.loads(text_data)
+        except ValueError:
+            self.send_error('Malformed frame')
+            return
+        if not isinstance(text_data_json, dict):
+            self.send_error('Malformed frame')
+            return
+        event_type = text_data_json.get('type', 'chat_message')
+        self.refresh_presence()
+
+        if event_type == 'chat_message':
+            self.receive_chat_message(text_data_json)
+        elif event_type == 'ack':
+            self.receive_ack(text_data_json)
+        elif event_type == 'resume':
+            self.identify()
+            self.resume(text_data_json.get('last_seq'))
+        elif event_type == 'typing':
+            # Typing is cheap to send and easy to flood
+            if not self.rate_limiter.allow():
+                return
+            self.identify()
+            if self.username is None:
+                return
+            try:
+                presence.set_typing(self.room_group_name, self.username, bool(text_data_json.get('typing', True)))
+                presence.schedule_room_broadcast(self.room_group_name, self.room_users)
+            except Exception as e:
+                logger.warning(f"Could not record typing from {self.username}: {e}")
+        # 'presence' heartbeats need nothing beyond refresh_presence above
+
+    def receive_chat_message(self, text_data_json):
         from shopiet.models import Message  # Lazy import
         def get_user():
             return get_user_model()
 
-        text_data_json = json.loads(text_data)
-        message = text_data_json['message']
-        sender = text_data_json['sender']
-        recipient = text_data_json['recipient']
+        message = text_data_json.get('message')
+        sender = text_data_json.get('sender')
+        recipient = text_data_json.get('recipient')
+        if not isinstance(message, str) or not message.strip() or not sender or not recipient:
+            self.send_error('A message needs text, a sender and a recipient')
+            return
+        if len(message) > settings.CHAT_MAX_MESSAGE_CHARS:
+            self.send_error(f'Messages are limited to {settings.CHAT_MAX_MESSAGE_CHARS} characters')
+            return
+
+        User = get_user()
+        try:
+            sender_user = User.objects.get(username=sender)
+            recipient_user = User.objects.get(username=recipient)
+        except User.DoesNotExist:
+            self.send_error('Unknown sender or recipient')
+            return
 
+        # Persisted before it is broadcast, so every delivered message has a sequence number
+        new_message = Message.objects.create(
+            sender=sender_user,
+            recipient=recipient_user,
+            content=message
+        )
+        self.conversation = new_message.conversation
+
+        # Serialized once for the whole room instead of once per socket; the
+        # echoed client_id doubles as the sender's delivery receipt
         async_to_sync(self.channel_layer.group_send)(
             self.room_group_name,
             {
                 'type': 'chat_message',
-                'message': message,
-                'sender': sender,
-                'recipient': recipient
+                'text': chat_sync.encode_frame(chat_sync.chat_frame(new_message, text_data_json.get('client_id')))
             }
         )
+        notify_new_message(new_message)
 
-        User = get_user()
-        sender_user = User.objects.get(username=sender)
-        recipient_user = User.objects.get(username=recipient)
+        self.identify()
+        if self.username == sender:
+            try:
+                presence.set_typing(self.room_group_name, sender, False)
+                presence.schedule_room_broadcast(self.room_group_name, self.room_users)
+            except Exception as e:
+                logger.warning(f"Could not clear typing for {sender}: {e}")
 
-        new_message = Message.objects.create(
-            sender=sender_user,
-            recipient=recipient_user,
-            content=message
-        )
+    def get_conversation(self):
+        from shopiet.models import Conversation  # Lazy import
+        if self.conversation is None:
+            self.conversation = Conversation.objects.between_usernames(*self.room_users)
+        return self.conversation
+
+    def receive_ack(self, text_data_json):
+        """Record how far the client has read and tell the room when that moved"""
+        self.identify()
+        conversation = self.get_conversation()
+        if self.username is None or conversation is None:
+            return
+        try:
+            seq = int(text_data_json['seq'])
+            advanced = chat_sync.record_ack(conversation.pk, self.username, seq)
+        except (KeyError, TypeError, ValueError):
+            return
+        except Exception as e:
+            logger.warning(f"Could not record ack from {self.username}: {e}")
+            return
+
+        if advanced:
+            async_to_sync(self.channel_layer.group_send)(
+                self.room_group_name,
+                {
+                    'type': 'room_event',
+                    'text': chat_sync.encode_frame({'type': 'delivered', 'username': self.username, 'seq': seq})
+                }
+            )
+
+    def resume(self, last_seq):
+        """Send only the messages after the client's last seen sequence number"""
+        conversation = self.get_conversation()
+        if conversation is None:
+            self.send(text_data=chat_sync.encode_frame({'type': 'resume', 'messages': [], 'last_seq': 0, 'complete': True}))
+            return
+        # Re-read so last_seq reflects messages sent since the lookup
+        conversation.refresh_from_db(fields=['last_seq'])
+
+        try:
+            last_seq = int(last_seq)
+        except (TypeError, ValueError):
+            last_seq = chat_sync.acked_seq(conversation.pk, self.username) if self.username else 0
+        self.send(text_data=chat_sync.encode_frame(chat_sync.resume_frame(conversation, last_seq)))
+
+    def send_error(self, error):
+        self.send(text_data=chat_sync.encode_frame({'type': 'error', 'error': error}))
 
     def chat_message(self, event):
-        message = event['message']
-        sender = event['sender']
-        recipient = event['recipient']
-
-        self.send(text_data=json.dumps({
-            'type': 'chat_message',
-            'message': message,
-            'sender': sender,
-            'recipient': recipient
-        }))
+        self.send(text_data=event['text'])
+
+    def room_event(self, event):
+        self.send(text_data=event['text'])
+
+
+class NotificationConsumer(WebsocketConsumer):
+    """Per-user socket receiving unread-count and last-message deltas"""
+
+    def connect(self):
+        self.group_name = None
+        username = self.scope['url_route']['kwargs']['username']
+        user = self.scope.get('user')
+        # Badges and message previews are private, only the user themselves may subscribe
+        if user is None or not user.is_authenticated or user.username != username:
+            self.close()
+            return
+        self.group_name = notification_group(username)
+        async_to_sync(self.channel_layer.group_add)(
+            self.group_name,
+            self.channel_name
+        )
+        self.accept()
+
+    def disconnect(self, close_code):
+        if self.group_name is None:
+            return
+        async_to_sync(self.channel_layer.group_discard)(
+            self.group_name,
+            self.channel_name
+        )
+
+    def notify(self, event):
+        self.send(text_data=event['text'])
@@ -3,6 +3,7 @@ Custom Metrics and Business Logic Monitoring for Shopiet Application
 This file should be placed in Backend(Docked)/backend/custom_metrics.py
 """
 
+import asyncio
 import logging
 import time
 from typing import Dict, Any, Optional
@@ -116,6 +117,31 @@ class ShopietMetrics:
             unit="s"
         )
         
+        # Database connection pool metrics
+        self.db_pool_connections_in_use = meter.create_up_down_counter(
+            name="shopiet_db_pool_connections_in_use",
+            description="Number of pooled database connections checked out",
+            unit="1"
+        )
+        
+        self.db_pool_utilization = meter.create_histogram(
+            name="shopiet_db_pool_utilization",
+            description="Fraction of the pool checked out at checkout time",
+            unit="1"
+        )
+        
+        self.db_pool_wait_duration = meter.create_histogram(
+            name="shopiet_db_pool_wait_duration_seconds",
+            description="Time spent waiting for a pooled database connection",
+            unit="s"
+        )
+        
+        self.db_pool_timeouts_total = meter.create_counter(
+            name="shopiet_db_pool_timeouts_total",
+            description="Total number of checkouts that timed out on a saturated pool",
+            unit="1"
+        )
+        
         # Redis/Cache metrics
         self.cache_operations_total = meter.create_counter(
             name="shopiet_cache_operations_total",
@@ -129,6 +155,12 @@ class ShopietMetrics:
             unit="1"
         )
         
+        self.single_flight_total = meter.create_counter(
+            name="shopiet_single_flight_total",
+            description="Total number of coalesced cache recomputations by role",
+            unit="1"
+        )
+        
         # Business Logic metrics
         self.api_errors_total = meter.create_counter(
             name="shopiet_api_errors_total",
@@ -373,6 +405,28 @@ def track_database_query(query_type: str, table: str, duration: float, success:
     shopiet_metrics.db_query_duration.record(duration, attributes)
 
 
+def track_db_pool_checkout(alias: str, wait: float, in_use: int, max_size: int):
+    """Track a connection checked out of the database pool"""
+    attributes = {"database": alias}
+    
+    shopiet_metrics.db_pool_connections_in_use.add(1, attributes)
+    shopiet_metrics.db_pool_wait_duration.record(wait, attributes)
+    shopiet_metrics.db_pool_utilization.record(in_use / max_size, attributes)
+
+
+def track_db_pool_checkin(alias: str):
+    """Track a connection returned to the database pool"""
+    shopiet_metrics.db_pool_connections_in_use.add(-1, {"database": alias})
+
+
+def track_db_pool_timeout(alias: str, wait: float):
+    """Track a checkout that gave up waiting on a saturated pool"""
+    attributes = {"database": alias}
+    
+    shopiet_metrics.db_pool_timeouts_total.add(1, attributes)
+    shopiet_metrics.db_pool_wait_duration.record(wait, attributes)
+
+
 def track_cache_operation(operation: str, key: str, hit: bool):
     """Track cache operation"""
     attributes = {
@@ -387,6 +441,11 @@ def track_cache_operation(operation: str, key: str, hit: bool):
     shopiet_metrics.cache_hit_ratio.record(hit_value, {"operation": operation.lower()})
 
 
+def track_single_flight(role: str):
+    """Track a single-flight call as leader, follower or remote waiter"""
+    shopiet_metrics.single_flight_total.add(1, {"role": role})
+
+
 def track_authentication_attempt(username: str, success: bool, method: str = "jwt"):
     """Track authentication attempts"""
     attributes = {
@@ -407,35 +466,68 @@ def add_business_context(span: trace.Span, context: Dict[str, Any]):
         span.set_attribute(f"shopiet.{key}", str(value))
 
 
+def _set_api_span_attributes(span: trace.Span, view_name: str, request: Any):
+    span.set_attribute("shopiet.api_view", view_name)
+    span.set_attribute("shopiet.component", "api")
+    
+    if request:
+        span.set_attribute("http.method", request.method)
+        span.set_attribute("http.url", request.build_absolute_uri())
+
+
+def _set_api_user_attributes(span: trace.Span, user: Any):
+    if user is not None and user.is_authenticated:
+        span.set_attribute("user.id", str(user.id))
+        span.set_attribute("user.authenticated", True)
+    else:
+        span.set_attribute("user.authenticated", False)
+
+
+def _record_api_error(span: trace.Span, e: Exception):
+    span.set_attribute("success", False)
+    span.set_attribute("error.type", type(e).__name__)
+    span.set_attribute("error.message", str(e))
+
+
 def track_api_performance(view_name: str):
-    """Decorator for tracking API view performance"""
+    """Decorator for tracking API view performance, for sync and async views"""
     def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                request = args[0] if args else None
+                
+                with tracer.start_as_current_span(f"api.{view_name}") as span:
+                    _set_api_span_attributes(span, view_name, request)
+                    try:
+                        result = await func(*args, **kwargs)
+                        span.set_attribute("success", True)
+                        return result
+                    except Exception as e:
+                        _record_api_error(span, e)
+                        raise
+                    finally:
+                        # Async views authenticate inside the view and store the user here
+                        if request:
+                            _set_api_user_attributes(span, getattr(request, 'auth_user', None))
+            
+            return async_wrapper
+        
         @wraps(func)
         def wrapper(*args, **kwargs):
             request = args[0] if args else None
             
             with tracer.start_as_current_span(f"api.{view_name}") as span:
-                span.set_attribute("shopiet.api_view", view_name)
-                span.set_attribute("shopiet.component", "api")
-                
+                _set_api_span_attributes(span, view_name, request)
                 if request:
-                    span.set_attribute("http.method", request.method)
-                    span.set_attribute("http.url", request.build_absolute_uri())
-                    
-                    if hasattr(request, 'user') and request.user.is_authenticated:
-                        span.set_attribute("user.id", str(request.user.id))
-                        span.set_attribute("user.authenticated", True)
-                    else:
-                        span.set_attribute("user.authenticated", False)
+                    _set_api_user_attributes(span, getattr(request, 'user', None))
                 
                 try:
                     result = func(*args, **kwargs)
                     span.set_attribute("success", True)
                     return result
                 except Exception as e:
-                    span.set_attribute("success", False)
-                    span.set_attribute("error.type", type(e).__name__)
-                    span.set_attribute("error.message", str(e))
+                    _record_api_error(span, e)
                     raise
         
         return wrapper
@@ -0,0 +1,5 @@
+"""
+Pooled PostgreSQL backend for Shopiet
+Use ENGINE 'backend.db_pool' to hand out connections from a bounded,
+health-checked pool instead of opening one per request or per thread.
+"""
@@ -0,0 +1,46 @@
+import threading
+
+from django.db.backends.postgresql import base
+
+from backend.db_pool.pool import ConnectionPool
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias: str, settings_dict: dict) -> ConnectionPool:
+    """Return the process-wide pool for a database alias"""
+    with _pools_lock:
+        if alias not in _pools:
+            options = settings_dict.get('POOL', {})
+            _pools[alias] = ConnectionPool(
+                alias,
+                max_size=options.get('MAX_SIZE', 10),
+                timeout=options.get('TIMEOUT', 10.0),
+                max_idle=options.get('MAX_IDLE', 300.0),
+                health_check_interval=options.get('HEALTH_CHECK_INTERVAL', 30.0),
+            )
+        return _pools[alias]
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """PostgreSQL wrapper that checks connections out of a shared pool
+
+    Closing the wrapper (end of request, close_old_connections in Channels
+    consumers) hands the connection back to the pool instead of closing it,
+    so use CONN_MAX_AGE = 0 with this engine.
+    """
+
+    @property
+    def pool(self) -> ConnectionPool:
+        return get_pool(self.alias, self.settings_dict)
+
+    def get_new_connection(self, conn_params):
+        return self.pool.acquire(
+            lambda: super(DatabaseWrapper, self).get_new_connection(conn_params)
+        )
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.release(self.connection)
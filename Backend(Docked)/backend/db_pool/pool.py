@@ -0,0 +1,123 @@
+"""
+Bounded, thread-safe database connection pool
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Tuple
+
+from django.db.utils import OperationalError
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool:
+    """Reuses raw DB-API connections, blocking callers once max_size are checked out"""
+
+    def __init__(self, alias: str, max_size: int = 10, timeout: float = 10.0,
+                 max_idle: float = 300.0, health_check_interval: float = 30.0):
+        self.alias = alias
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+        self.in_use = 0
+        self._idle: Deque[Tuple[Any, float]] = deque()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+
+    def acquire(self, connect: Callable[[], Any]) -> Any:
+        """Check out a connection, opening one with connect() if none is idle"""
+        from backend.custom_metrics import track_db_pool_checkout, track_db_pool_timeout
+
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            wait = time.monotonic() - start
+            track_db_pool_timeout(self.alias, wait)
+            raise OperationalError(
+                f"Timed out after {wait:.1f}s waiting for a connection from the "
+                f"'{self.alias}' pool ({self.max_size} connections in use)"
+            )
+
+        try:
+            connection = self._take_idle() or connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self.in_use += 1
+            in_use = self.in_use
+        track_db_pool_checkout(self.alias, time.monotonic() - start, in_use, self.max_size)
+        return connection
+
+    def release(self, connection: Any):
+        """Return a checked-out connection, discarding it if it is broken"""
+        from backend.custom_metrics import track_db_pool_checkin
+
+        try:
+            if self._reset(connection):
+                with self._lock:
+                    self._idle.append((connection, time.monotonic()))
+            else:
+                self._discard(connection)
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+            track_db_pool_checkin(self.alias)
+
+    def close_all(self):
+        """Close every idle connection"""
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+        for connection, _ in idle:
+            self._discard(connection)
+
+    def _take_idle(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                # Most recently used first, so the least used ones can age out
+                connection, last_used = self._idle.pop()
+
+            idle_for = time.monotonic() - last_used
+            if idle_for > self.max_idle or getattr(connection, 'closed', False):
+                self._discard(connection)
+                continue
+            if idle_for > self.health_check_interval and not self._is_healthy(connection):
+                self._discard(connection)
+                continue
+            return connection
+
+    @staticmethod
+    def _is_healthy(connection) -> bool:
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _reset(connection) -> bool:
+        """Roll back anything left open; False when the connection is unusable"""
+        if getattr(connection, 'closed', False):
+            return False
+        try:
+            if connection.info.transaction_status != 0:
+                connection.rollback()
+            return True
+        except Exception as e:
+            logger.debug(f"Discarding pooled connection: {e}")
+            return False
+
+    @staticmethod
+    def _discard(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
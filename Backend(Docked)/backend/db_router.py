@@ -0,0 +1,193 @@
+"""
+Read-replica routing for Shopiet
+Reads made while serving a GET/HEAD request go to a replica; everything else
+(writes, non-safe requests, management commands, Channels consumers) uses
+the primary. A client that just wrote is pinned to the primary for
+REPLICA_STICKY_SECONDS so it reads its own writes, and replicas lagging more
+than REPLICA_MAX_LAG_SECONDS are skipped.
+Values written to the shared cache outlive the request, so code that fills
+the cache reads inside primary_reads() instead of from a possibly stale replica.
+"""
+
+import hashlib
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+_reads_on_replica: ContextVar[bool] = ContextVar('shopiet_reads_on_replica', default=False)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_COOKIE = 'shopiet_db_pin'
+
+_lag_lock = threading.Lock()
+# alias -> (checked at, healthy)
+_lag_checks: Dict[str, Tuple[float, bool]] = {}
+
+
+def replica_aliases() -> List[str]:
+    return [alias for alias in settings.DATABASES if alias.startswith('replica_')]
+
+
+@contextmanager
+def primary_reads():
+    """Read from the primary within the block, e.g. while computing a value to cache"""
+    token = _reads_on_replica.set(False)
+    try:
+        yield
+    finally:
+        _reads_on_replica.reset(token)
+
+
+def _replica_lag(alias: str) -> float:
+    """Seconds the replica is behind the primary (0 for non-PostgreSQL test replicas)
+
+    Raises when a standby has no streaming WAL receiver: with the primary
+    unreachable, receive and replay positions stay equal and the replica
+    would otherwise report itself caught up while falling further behind.
+    """
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    with connection.cursor() as cursor:
+        # The last replayed commit only ages usefully while WAL is still pending;
+        # a caught-up replica of an idle primary would otherwise look further behind every second
+        cursor.execute(
+            "SELECT pg_is_in_recovery(), "
+            "EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming'), "
+            "CASE WHEN NOT pg_is_in_recovery() THEN 0 "
+            "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+            "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+        )
+        in_recovery, streaming, lag = cursor.fetchone()
+    if in_recovery and not streaming:
+        raise RuntimeError("WAL receiver is not streaming from the primary")
+    return float(lag)
+
+
+def replica_is_healthy(alias: str) -> bool:
+    """Whether a replica is reachable and within the lag budget, checked at most every few seconds"""
+    now = time.monotonic()
+    with _lag_lock:
+        checked_at, healthy = _lag_checks.get(alias, (0.0, True))
+        if now - checked_at < settings.REPLICA_LAG_CHECK_INTERVAL:
+            return healthy
+        # Claim the check so concurrent readers keep using the last verdict
+        _lag_checks[alias] = (now, healthy)
+
+    try:
+        lag = _replica_lag(alias)
+        healthy = lag <= settings.REPLICA_MAX_LAG_SECONDS
+        if not healthy:
+            logger.warning(f"Replica {alias} is {lag:.1f}s behind, reading from primary")
+    except Exception as e:
+        logger.warning(f"Replica {alias} lag check failed: {e}")
+        healthy = False
+
+    with _lag_lock:
+        _lag_checks[alias] = (time.monotonic(), healthy)
+    return healthy
+
+
+class ReplicaRouter:
+    """Send reads to a healthy replica while a request allows it"""
+
+    def db_for_read(self, model, **hints):
+        if not _reads_on_replica.get():
+            return DEFAULT_DB_ALIAS
+        # Reads inside a write transaction must see that transaction
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+
+        healthy = [alias for alias in replica_aliases() if replica_is_healthy(alias)]
+        return random.choice(healthy) if healthy else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def _pin_key(request) -> Optional[str]:
+    """Identify the client by its bearer token, or None for anonymous clients"""
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if not authorization:
+        return None
+    digest = hashlib.sha256(authorization.encode()).hexdigest()[:32]
+    return f'db_pin_{digest}'
+
+
+class ReplicaRoutingMiddleware:
+    """Route a request's reads to replicas unless it writes or recently wrote"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not replica_aliases():
+            return self.get_response(request)
+
+        pin_key = _pin_key(request)
+        pinned = PIN_COOKIE in request.COOKIES or (pin_key is not None and cache.get(pin_key) is not None)
+
+        token = _reads_on_replica.set(request.method in SAFE_METHODS and not pinned)
+        try:
+            response = self.get_response(request)
+        finally:
+            _reads_on_replica.reset(token)
+
+        if self._should_pin(request, response):
+            if pin_key is not None:
+                cache.set(pin_key, 1, timeout=settings.REPLICA_STICKY_SECONDS)
+            self._set_pin_cookie(response)
+        return response
+
+    async def __acall__(self, request):
+        if not replica_aliases():
+            return await self.get_response(request)
+
+        pin_key = _pin_key(request)
+        pinned = PIN_COOKIE in request.COOKIES or (pin_key is not None and await cache.aget(pin_key) is not None)
+
+        token = _reads_on_replica.set(request.method in SAFE_METHODS and not pinned)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _reads_on_replica.reset(token)
+
+        if self._should_pin(request, response):
+            if pin_key is not None:
+                await cache.aset(pin_key, 1, timeout=settings.REPLICA_STICKY_SECONDS)
+            self._set_pin_cookie(response)
+        return response
+
+    @staticmethod
+    def _should_pin(request, response) -> bool:
+        # Read-your-writes: stay on the primary until replicas catch up
+        return request.method not in SAFE_METHODS and response.status_code < 400
+
+    @staticmethod
+    def _set_pin_cookie(response):
+        response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS,
+                            httponly=True, samesite='Lax')
@@ -0,0 +1,201 @@
+"""
+Production media serving
+serve_media replaces django.conf.urls.static for locally stored uploads.
+It answers conditional requests with 304 and serves single byte ranges (206 /
+416). Content-addressed names (<sha256>.<ext>, see shopiet.image_processing)
+get a year-long immutable Cache-Control, since a changed image always gets a
+new URL. Compressible files are served from .br / .gz siblings when the
+client accepts them; `python -m whitenoise.compress <MEDIA_ROOT>` builds those.
+ETag and Last-Modified come from the file actually sent, and encoded
+siblings' ETags carry the encoding, so each representation validates alone.
+
+With MEDIA_ACCEL set, the body is handed to the front server
+(X-Accel-Redirect for nginx, X-Sendfile for Apache/lighttpd), which does
+ranges and sendfile itself. Otherwise bodies are FileResponses. Under a WSGI
+server with wsgi.file_wrapper (gunicorn) those go out through sendfile, byte
+ranges included. ASGI servers have no sendfile and stream them in chunks.
+"""
+
+import mimetypes
+import os
+import re
+import stat
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+_HASHED_NAME = re.compile(r'(^|/)[0-9a-f]{64}\.\w+$')
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+COMPRESSIBLE_TYPES = ('text/', 'image/svg+xml', 'application/json', 'application/javascript')
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+
+
+class _RangeFile:
+    """File limited to `length` bytes from its current position
+
+    Keeps fileno() so WSGI file wrappers can sendfile the range; gunicorn
+    starts at the descriptor's offset and stops at Content-Length.
+    """
+
+    def __init__(self, file, length: int):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self) -> int:
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def is_immutable(path: str) -> bool:
+    """Whether a media path is content addressed and can be cached forever"""
+    return bool(_HASHED_NAME.search(path))
+
+
+def etag_for(st: os.stat_result, encoding: Optional[str] = None) -> str:
+    """Strong validator of one representation; encoded siblings carry their encoding"""
+    suffix = f'-{encoding}' if encoding else ''
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}{suffix}"'
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) of a single bytes range, or None when unsatisfiable"""
+    first, last = _RANGE.match(header.strip()).groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # Suffix range: the final N bytes
+        start, end = max(size - int(last), 0), size - 1
+    if start > end or start >= size:
+        return None
+    return start, end
+
+
+def _not_modified(request, etag: str, st: os.stat_result) -> bool:
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        return if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
+    modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return modified_since is not None and int(st.st_mtime) <= modified_since
+
+
+def _precompressed(request, full_path: str, content_type: str):
+    """Path and encoding of an accepted .br / .gz sibling, if one exists"""
+    if not content_type.startswith(COMPRESSIBLE_TYPES):
+        return full_path, None
+    accepted = request.headers.get('Accept-Encoding', '')
+    for encoding, suffix in PRECOMPRESSED:
+        if encoding in accepted and os.path.isfile(full_path + suffix):
+            return full_path + suffix, encoding
+    return full_path, None
+
+
+def _accel_response(path: str, encoding: Optional[str], content_type: str) -> Optional[HttpResponse]:
+    """Empty response handing the file to the front server, when MEDIA_ACCEL is set"""
+    accel = settings.MEDIA_ACCEL
+    if not accel:
+        return None
+    suffix = dict(PRECOMPRESSED).get(encoding, '')
+    response = HttpResponse(content_type=content_type)
+    if accel == 'nginx':
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX.rstrip('/') + '/' + path + suffix
+    else:
+        response['X-Sendfile'] = safe_join(settings.MEDIA_ROOT, path) + suffix
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    """Serve an uploaded file from MEDIA_ROOT with caching and byte range support"""
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("Not found")
+    try:
+        st = os.stat(full_path)
+    except OSError:
+        raise Http404("Not found")
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404("Not found")
+
+    content_type, _ = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+    identity_etag = etag_for(st)
+    cache_control = (
+        IMMUTABLE_CACHE_CONTROL if is_immutable(path)
+        else f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}'
+    )
+    vary = 'Accept-Encoding' if content_type.startswith(COMPRESSIBLE_TYPES) else None
+
+    # Ranges are served from the identity encoding only. Malformed and
+    # multi-range headers get the full body, which RFC 9110 allows.
+    range_header = request.headers.get('Range')
+    if range_header:
+        match = _RANGE.match(range_header.strip())
+        if not match or match.groups() == ('', ''):
+            range_header = None
+        elif request.headers.get('If-Range', identity_etag) not in (identity_etag, http_date(st.st_mtime)):
+            range_header = None
+    if range_header:
+        body_path, encoding = full_path, None
+    else:
+        body_path, encoding = _precompressed(request, full_path, content_type)
+
+    # Validators describe the bytes actually sent, so caches never mix
+    # an encoded body with the identity one
+    body_st = os.stat(body_path) if encoding else st
+    etag = etag_for(body_st, encoding)
+
+    if _not_modified(request, etag, body_st):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        response['Cache-Control'] = cache_control
+        if vary:
+            response['Vary'] = vary
+        return response
+
+    response = _accel_response(path, encoding, content_type)
+    if response is None:
+        file = open(body_path, 'rb')
+        if range_header:
+            byte_range = parse_range(range_header, st.st_size)
+            if byte_range is None:
+                file.close()
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{st.st_size}'
+                return response
+            start, end = byte_range
+            file.seek(start)
+            response = FileResponse(_RangeFile(file, end - start + 1), status=206, content_type=content_type)
+            response['Content-Length'] = str(end - start + 1)
+            response['Content-Range'] = f'bytes {start}-{end}/{st.st_size}'
+        else:
+            response = FileResponse(file, content_type=content_type)
+
+    if encoding:
+        response['Content-Encoding'] = encoding
+    if vary:
+        response['Vary'] = vary
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(body_st.st_mtime)
+    response['Cache-Control'] = cache_control
+    return response
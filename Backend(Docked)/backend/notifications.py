@@ -0,0 +1,78 @@
+"""
+Per-user notification pushes over the Channels layer
+Every user has a notify_<username> group joined by NotificationConsumer.
+New messages and read receipts are pushed to it as single-conversation
+deltas in the same shape as the conversations endpoint, so clients can patch
+their conversation list instead of polling it.
+"""
+
+import logging
+import re
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from backend.chat_sync import encode_frame
+
+logger = logging.getLogger(__name__)
+
+_GROUP_UNSAFE = re.compile(r'[^\w.-]')
+
+
+def notification_group(username: str) -> str:
+    """Channel layer group for a user; group names only allow [A-Za-z0-9_.-]"""
+    return f'notify_{_GROUP_UNSAFE.sub("_", username)}'[:99]
+
+
+def notify_user(username: str, payload: dict):
+    """Send a payload to every notification socket of a user"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        # Serialized once here, each socket sends the text as is
+        async_to_sync(channel_layer.group_send)(
+            notification_group(username),
+            {'type': 'notify', 'text': encode_frame(payload)},
+        )
+    except Exception as e:
+        logger.warning(f"Could not notify {username}: {e}")
+
+
+def notify_new_message(message):
+    """Push the conversation's new last message and unread count to both participants"""
+    from api.serialisers import ChatSerializer  # Lazy import
+
+    conversation = message.conversation
+    sender, recipient = message.sender, message.recipient
+
+    message.unseen_count = conversation.unread_count(recipient.id)
+    notify_user(recipient.username, {
+        'type': 'conversation_update',
+        'conversation_with': sender.username,
+        **ChatSerializer(message).data,
+    })
+
+    # Sending a message moves the sender's own watermark past it
+    message.unseen_count = 0
+    notify_user(sender.username, {
+        'type': 'conversation_update',
+        'conversation_with': recipient.username,
+        **ChatSerializer(message).data,
+    })
+
+
+def notify_read(conversation, reader):
+    """Clear the reader's badge and tell the other participant their messages were seen"""
+    other = conversation.user_high if reader.id == conversation.user_low_id else conversation.user_low
+
+    notify_user(reader.username, {
+        'type': 'conversation_read',
+        'conversation_with': other.username,
+        'unseen_count': 0,
+    })
+    notify_user(other.username, {
+        'type': 'conversation_seen',
+        'conversation_with': reader.username,
+        'last_read_id': conversation.last_read_id(reader.id),
+    })
@@ -0,0 +1,183 @@
+"""
+Presence and typing state for chat sockets
+Online status is a Redis sorted set of a user's sockets scored by expiry, so
+a socket that dies without disconnecting drops out after PRESENCE_TTL_SECONDS.
+Typing is a short-lived key per room and user. Room state changes are
+coalesced: the first change in a window takes a SET NX PX lock and schedules
+one broadcast at the end of the window, later changes in the window only
+update Redis and ride along. Expiry happens silently in Redis, so each
+broadcast also arms a timer for the room's next lapsing typing or online
+entry, which broadcasts again once it is gone.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from backend.chat_sync import encode_frame
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_KEY = 'presence_{}'
+LAST_SEEN_KEY = 'last_seen_{}'
+TYPING_KEY = 'typing_{}_{}'
+ROOM_WINDOW_KEY = 'room_broadcast_{}'
+
+LAST_SEEN_TTL = 30 * 24 * 3600
+# Lapse broadcasts wait this long past the expiry so the entry is really gone
+LAPSE_MARGIN_SECONDS = 0.05
+
+_lapse_lock = threading.Lock()
+# room -> (monotonic deadline, timer) of the pending lapse broadcast in this process
+_lapse_timers: Dict[str, Tuple[float, threading.Timer]] = {}
+
+
+def _redis():
+    return get_redis_connection('default')
+
+
+def touch(username: str, channel_name: str) -> bool:
+    """Mark a socket of the user as alive for another PRESENCE_TTL_SECONDS
+
+    Returns whether the user was offline until now.
+    """
+    now = time.time()
+    key = PRESENCE_KEY.format(username)
+    pipe = _redis().pipeline(transaction=False)
+    pipe.zcount(key, now, '+inf')
+    pipe.zadd(key, {channel_name: now + settings.PRESENCE_TTL_SECONDS})
+    pipe.zremrangebyscore(key, '-inf', now)
+    pipe.expire(key, settings.PRESENCE_TTL_SECONDS)
+    return pipe.execute()[0] == 0
+
+
+def leave(username: str, channel_name: str) -> bool:
+    """Drop a socket, returning whether the user still has another one open"""
+    now = time.time()
+    key = PRESENCE_KEY.format(username)
+    pipe = _redis().pipeline(transaction=False)
+    pipe.zrem(key, channel_name)
+    pipe.zremrangebyscore(key, '-inf', now)
+    pipe.zcard(key)
+    pipe.set(LAST_SEEN_KEY.format(username), int(now), ex=LAST_SEEN_TTL)
+    return pipe.execute()[2] > 0
+
+
+def set_typing(room: str, username: str, typing: bool):
+    key = TYPING_KEY.format(room, username)
+    if typing:
+        _redis().set(key, 1, ex=settings.TYPING_TTL_SECONDS)
+    else:
+        _redis().delete(key)
+
+
+def _read_room(room: str, usernames: List[str]) -> Tuple[Dict, Optional[float]]:
+    """Room state and the seconds until its next typing or online entry lapses"""
+    now = time.time()
+    pipe = _redis().pipeline(transaction=False)
+    for username in usernames:
+        pipe.zcount(PRESENCE_KEY.format(username), now, '+inf')
+        pipe.get(LAST_SEEN_KEY.format(username))
+        pipe.pttl(TYPING_KEY.format(room, username))
+        pipe.zrange(PRESENCE_KEY.format(username), -1, -1, withscores=True)
+    results = pipe.execute()
+
+    users, lapses = {}, []
+    for index, username in enumerate(usernames):
+        sockets, last_seen, typing_ttl, latest = results[index * 4:index * 4 + 4]
+        users[username] = {
+            'online': sockets > 0,
+            'last_seen': int(last_seen) if last_seen else None,
+            # -2 means no key; -1 (no expiry) should not happen but still counts as typing
+            'typing': typing_ttl != -2,
+        }
+        if typing_ttl > 0:
+            lapses.append(typing_ttl / 1000)
+        if sockets > 0 and latest:
+            lapses.append(latest[0][1] - now)
+    return {'type': 'room_state', 'users': users}, min(lapses, default=None)
+
+
+def room_state(room: str, usernames: List[str]) -> Dict:
+    """Online, last-seen and typing state of a room's participants in one round trip"""
+    return _read_room(room, usernames)[0]
+
+
+def _broadcast_room_state(room: str, usernames: List[str]):
+    try:
+        state, lapse = _read_room(room, usernames)
+        async_to_sync(get_channel_layer().group_send)(room, {'type': 'room_event', 'text': encode_frame(state)})
+    except Exception as e:
+        logger.warning(f"Room state broadcast for {room} failed: {e}")
+        return
+    if lapse is not None:
+        _watch_lapse(room, usernames, max(lapse, 0) + LAPSE_MARGIN_SECONDS)
+
+
+def _watch_lapse(room: str, usernames: List[str], delay: float):
+    """Broadcast again after delay unless an earlier lapse broadcast is already pending"""
+    deadline = time.monotonic() + delay
+    with _lapse_lock:
+        pending = _lapse_timers.get(room)
+        if pending is not None and pending[0] <= deadline:
+            return
+        if pending is not None:
+            pending[1].cancel()
+        timer = threading.Timer(delay, _on_lapse, args=(room, usernames))
+        timer.daemon = True
+        _lapse_timers[room] = (deadline, timer)
+    timer.start()
+
+
+def _on_lapse(room: str, usernames: List[str]):
+    with _lapse_lock:
+        pending = _lapse_timers.get(room)
+        if pending is not None and pending[1] is threading.current_thread():
+            del _lapse_timers[room]
+    # Refreshed entries make this a no-op broadcast that re-arms for the new expiry
+    schedule_room_broadcast(room, usernames)
+
+
+def schedule_room_broadcast(room: str, usernames: List[str]):
+    """Broadcast the room's state once at the end of the current window
+
+    Only the change that opens a window (across all workers) schedules the
+    broadcast, so a room sends at most one state event per window.
+    """
+    window_ms = settings.ROOM_BROADCAST_WINDOW_MS
+    try:
+        opened = _redis().set(ROOM_WINDOW_KEY.format(room), 1, nx=True, px=window_ms)
+    except Exception as e:
+        logger.warning(f"Room broadcast window for {room} unavailable: {e}")
+        opened = True
+    if not opened:
+        return
+
+    timer = threading.Timer(window_ms / 1000, _broadcast_room_state, args=(room, usernames))
+    timer.daemon = True
+    timer.start()
+
+
+class RateLimiter:
+    """Token bucket for one socket's presence and typing frames"""
+
+    def __init__(self, rate: Optional[float] = None, burst: Optional[int] = None):
+        self.rate = rate or settings.SOCKET_EVENT_RATE
+        self.burst = burst or settings.SOCKET_EVENT_BURST
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
@@ -3,4 +3,5 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r'ws/socket-server/(?P<room_name>\w+)/$', consumers.ChatConsumer.as_asgi()),
+    re_path(r'ws/notifications/(?P<username>[\w.@+-]+)/$', consumers.NotificationConsumer.as_asgi()),
 ]
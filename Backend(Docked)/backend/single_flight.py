@@ -0,0 +1,144 @@
+"""
+Single-flight request coalescing for Shopiet cache misses
+Only one caller recomputes a given cache key at a time: callers in the same
+process wait on the leader's result, and other workers wait on a Redis lease
+until the leader has written the key.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from functools import wraps
+from typing import Any, Callable, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from opentelemetry import trace
+
+from backend.custom_metrics import track_cache_operation, track_single_flight
+from backend.db_router import primary_reads
+
+logger = logging.getLogger(__name__)
+tracer = trace.get_tracer(__name__)
+
+
+class _Call:
+    """An in-flight computation that followers in this process can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.failed = False
+
+
+class SingleFlight:
+    """Coalesce concurrent recomputations of the same cache key"""
+
+    def __init__(self, lease_ttl: Optional[float] = None, wait_timeout: Optional[float] = None,
+                 poll_interval: float = 0.05):
+        self.lease_ttl = lease_ttl or getattr(settings, 'SINGLE_FLIGHT_LEASE_TTL', 10)
+        self.wait_timeout = wait_timeout or getattr(settings, 'SINGLE_FLIGHT_WAIT_TIMEOUT', 5)
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, compute: Callable[[], Any], timeout: int = 300) -> Any:
+        """Return compute()'s result for key, running it at most once at a time"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        with tracer.start_as_current_span("single_flight") as span:
+            span.set_attribute("single_flight.key", key)
+
+            if not leader:
+                span.set_attribute("single_flight.role", "follower")
+                track_single_flight("follower")
+                if call.done.wait(self.wait_timeout) and not call.failed:
+                    return call.result
+                # Leader failed or is too slow, use what it stored or do the work ourselves
+                span.set_attribute("single_flight.fallback", True)
+                value = cache.get(key)
+                if value is not None:
+                    track_cache_operation("get", key, hit=True)
+                    return value
+                return self._compute_and_store(key, compute, timeout)
+
+            try:
+                call.result = self._lead(key, compute, timeout, span)
+                return call.result
+            except Exception:
+                call.failed = True
+                raise
+            finally:
+                call.done.set()
+                with self._lock:
+                    self._calls.pop(key, None)
+
+    def _lead(self, key: str, compute: Callable[[], Any], timeout: int, span) -> Any:
+        lease_key = f'lease_{key}'
+        token = uuid.uuid4().hex
+
+        if not cache.add(lease_key, token, timeout=self.lease_ttl):
+            # Another worker holds the lease, wait for it to publish the key
+            span.set_attribute("single_flight.role", "remote_wait")
+            track_single_flight("remote_wait")
+            deadline = time.monotonic() + self.wait_timeout
+            while time.monotonic() < deadline:
+                time.sleep(self.poll_interval)
+                value = cache.get(key)
+                if value is not None:
+                    track_cache_operation("get", key, hit=True)
+                    return value
+                if cache.get(lease_key) is None:
+                    break
+            span.set_attribute("single_flight.fallback", True)
+            return self._compute_and_store(key, compute, timeout)
+
+        span.set_attribute("single_flight.role", "leader")
+        track_single_flight("leader")
+        try:
+            # The key may have been filled while we were acquiring the lease
+            value = cache.get(key)
+            if value is not None:
+                track_cache_operation("get", key, hit=True)
+                return value
+            return self._compute_and_store(key, compute, timeout)
+        finally:
+            if cache.get(lease_key) == token:
+                cache.delete(lease_key)
+
+    def _compute_and_store(self, key: str, compute: Callable[[], Any], timeout: int) -> Any:
+        # Cached for every reader, so never built from a lagging replica
+        with primary_reads():
+            value = compute()
+        if value is not None:
+            cache.set(key, value, timeout=timeout)
+            track_cache_operation("set", key, hit=True)
+        return value
+
+
+# Shared group used by the decorator
+default_group = SingleFlight()
+
+
+def single_flight(key_func: Callable[..., str], timeout: int = 300, group: Optional[SingleFlight] = None):
+    """Decorator coalescing concurrent calls that map to the same cache key
+
+    The wrapped function computes the value to cache; ``key_func`` receives the
+    same arguments and returns the cache key. The result is cached for
+    ``timeout`` seconds unless it is None.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = key_func(*args, **kwargs)
+            return (group or default_group).do(key, lambda: func(*args, **kwargs), timeout=timeout)
+
+        wrapper.uncoalesced = func
+        wrapper.cache_timeout = timeout
+        return wrapper
+    return decorator
@@ -1,13 +1,14 @@
+import re
 
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
 from rest_framework_simplejwt.views import (
     
     TokenRefreshView,
 )
 from api.views import MyTokenObtainPairView
+from backend.media import serve_media
 
 
 urlpatterns = [
@@ -20,5 +21,8 @@ urlpatterns = [
     
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Bucket storage serves its own URLs
+if settings.MEDIA_STORAGE == 'local':
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media),
+    ]
@@ -0,0 +1,51 @@
+"""
+JWT authentication for websocket connections
+
+The SPA authenticates with SimpleJWT access tokens rather than session cookies,
+and browsers cannot set an Authorization header on a websocket handshake, so
+the access token travels as a ?token= query parameter instead. A valid token
+sets scope['user']; a missing or invalid one leaves whatever the session
+middleware resolved (usually AnonymousUser), which the consumers refuse.
+"""
+
+import logging
+from urllib.parse import parse_qs
+
+from channels.auth import AuthMiddlewareStack
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+
+logger = logging.getLogger(__name__)
+
+
+@database_sync_to_async
+def user_for_token(raw_token):
+    """The active user an access token belongs to, or None"""
+    # Lazy import, SimpleJWT needs the app registry that asgi.py has not loaded yet
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+
+    authentication = JWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidToken, TokenError, AuthenticationFailed) as e:
+        logger.info(f"Rejected websocket token: {e}")
+        return None
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """Populate scope['user'] from a ?token= access token"""
+
+    async def __call__(self, scope, receive, send):
+        query = parse_qs(scope.get('query_string', b'').decode())
+        token = query.get('token')
+        if token:
+            user = await user_for_token(token[0])
+            if user is not None:
+                scope = dict(scope, user=user)
+        return await super().__call__(scope, receive, send)
+
+
+def JWTAuthMiddlewareStack(inner):
+    """Session authentication with a JWT override, for the admin and the SPA alike"""
+    return AuthMiddlewareStack(JWTAuthMiddleware(inner))
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Item, Images, Category, Profile,SavedItem, Message
+from .models import Item, Images, Category, Profile,SavedItem, Message, Conversation
 
 # Register your models here.
 admin.site.register(Item)
@@ -7,4 +7,5 @@ admin.site.register(Images)
 admin.site.register(Category)
 admin.site.register(Profile)
 admin.site.register(SavedItem)
-admin.site.register(Message)
\ No newline at end of file
+admin.site.register(Message)
+admin.site.register(Conversation)
\ No newline at end of file
@@ -0,0 +1,139 @@
+"""
+Presigned direct-to-bucket uploads
+With MEDIA_STORAGE = 's3' browsers POST image bytes straight to the bucket
+using a presigned form, under a per-user staging prefix, so app servers never
+receive upload request bodies. Finalizing an item opens the staged objects,
+runs them through image_processing like any other upload and deletes the
+staging copies; a bucket lifecycle rule (setup_media_bucket) expires the ones
+that are never finalized.
+"""
+
+import logging
+import os
+import posixpath
+import re
+import uuid
+from functools import lru_cache
+from typing import Dict, List
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from shopiet.image_processing import delete_stored
+
+logger = logging.getLogger(__name__)
+
+STAGING_PREFIX = 'uploads-staging'
+STAGING_EXPIRE_DAYS = 1
+
+CONTENT_TYPES = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/webp': '.webp',
+    'image/gif': '.gif',
+}
+
+_SEGMENT_UNSAFE = re.compile(r'[^\w.-]')
+
+
+class DirectUploadError(Exception):
+    """A presign or finalize request the client has to correct"""
+
+
+def direct_uploads_enabled() -> bool:
+    """Whether media lives in a bucket browsers can upload to"""
+    return hasattr(default_storage, 'bucket_name')
+
+
+def _user_prefix(username: str) -> str:
+    return f'{STAGING_PREFIX}/{_SEGMENT_UNSAFE.sub("_", username)}/'
+
+
+def _bucket_key(name: str) -> str:
+    """Object key of a storage name, including the storage's location prefix"""
+    location = getattr(default_storage, 'location', '')
+    return posixpath.join(location, name) if location else name
+
+
+@lru_cache(maxsize=1)
+def _presign_client():
+    """S3 client that signs against the endpoint browsers can reach"""
+    public_endpoint = settings.AWS_S3_PUBLIC_ENDPOINT_URL
+    if public_endpoint == settings.AWS_S3_ENDPOINT_URL:
+        return default_storage.connection.meta.client
+
+    import boto3  # Only needed for object storage
+
+    return boto3.client(
+        's3',
+        endpoint_url=public_endpoint,
+        aws_access_key_id=default_storage.access_key,
+        aws_secret_access_key=default_storage.secret_key,
+        region_name=default_storage.region_name,
+        config=default_storage.client_config,
+    )
+
+
+def presign_upload(username: str, filename: str, content_type: str) -> Dict:
+    """Presigned POST form for one image under the user's staging prefix
+
+    The policy pins the key and content type and caps the size at
+    DIRECT_UPLOAD_MAX_BYTES, so the form cannot be reused for anything else.
+    """
+    if content_type not in CONTENT_TYPES:
+        raise DirectUploadError(f"Unsupported image type {content_type!r}")
+    extension = os.path.splitext(filename)[1].lower() or CONTENT_TYPES[content_type]
+    if not re.fullmatch(r'\.\w{1,5}', extension):
+        extension = CONTENT_TYPES[content_type]
+
+    key = f'{_user_prefix(username)}{uuid.uuid4().hex}{extension}'
+    post = _presign_client().generate_presigned_post(
+        Bucket=default_storage.bucket_name,
+        Key=_bucket_key(key),
+        Fields={'Content-Type': content_type},
+        Conditions=[
+            {'Content-Type': content_type},
+            ['content-length-range', 1, settings.DIRECT_UPLOAD_MAX_BYTES],
+        ],
+        ExpiresIn=settings.DIRECT_UPLOAD_EXPIRES_SECONDS,
+    )
+    return {
+        'key': key,
+        'url': post['url'],
+        'fields': post['fields'],
+        'expires_in': settings.DIRECT_UPLOAD_EXPIRES_SECONDS,
+    }
+
+
+def open_staged(username: str, key: str):
+    """Open a finished direct upload of the user for processing"""
+    if not isinstance(key, str) or not key.startswith(_user_prefix(username)) or '..' in key:
+        raise DirectUploadError("Unknown upload key")
+    if not default_storage.exists(key):
+        raise DirectUploadError("Upload has not completed or has expired")
+    return default_storage.open(key, 'rb')
+
+
+def open_all_staged(username: str, keys: List[str]) -> List:
+    """Open several staged uploads, closing any already opened if one is invalid"""
+    opened = []
+    try:
+        for key in keys:
+            opened.append(open_staged(username, key))
+    except Exception:
+        close_staged(opened)
+        raise
+    return opened
+
+
+def close_staged(files):
+    for staged in files:
+        try:
+            staged.close()
+        except Exception as e:
+            logger.warning(f"Could not close staged upload {staged.name}: {e}")
+
+
+def discard_staged(keys: List[str]):
+    """Delete staging copies once their images are processed"""
+    delete_stored(keys)
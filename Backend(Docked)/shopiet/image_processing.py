@@ -0,0 +1,190 @@
+"""
+Image compression and storage for item uploads
+Uploads larger than FILE_UPLOAD_MAX_MEMORY_SIZE arrive as temporary files, so
+they are handed to TinyPNG by path and the compressed result is written to a
+temporary file and streamed into storage in chunks, never held whole in the
+request thread. All images of an upload are compressed and stored at the
+same time on a bounded worker pool.
+
+Files are content addressed: each is named after the SHA-256 of the uploaded
+bytes and tracked by an ImageBlob with a reference count, so a photo that was
+already uploaded skips compression and storage and reuses the stored file.
+Callers release their references when rows go away and unreferenced files
+are deleted.
+
+Each new image also gets a 16px JPEG preview as a data URI, stored on the
+blob and the rows using it, so item grids can paint a blurred placeholder
+without fetching anything.
+"""
+
+import base64
+import hashlib
+import io
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import tinify
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_SIZE = 16
+
+
+class StoredImage(NamedTuple):
+    name: str
+    placeholder: str
+
+
+def _compress_to_file(upload, destination: str):
+    """Compress an upload with TinyPNG into the destination path"""
+    if hasattr(upload, 'temporary_file_path'):
+        source = tinify.from_file(upload.temporary_file_path())
+    else:
+        upload.seek(0)
+        source = tinify.from_buffer(upload.read())
+    source.to_file(destination)
+
+
+def placeholder_for(source) -> str:
+    """Tiny JPEG data URI of an image file, or '' when it cannot be decoded"""
+    try:
+        source.seek(0)
+        with Image.open(source) as image:
+            # Lets JPEG decode at a fraction of full size
+            image.draft('RGB', (PLACEHOLDER_SIZE * 4, PLACEHOLDER_SIZE * 4))
+            preview = ImageOps.exif_transpose(image).convert('RGB')
+        preview.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+        buffer = io.BytesIO()
+        preview.save(buffer, 'JPEG', quality=50, optimize=True)
+    except Exception as e:
+        logger.warning(f"Could not build placeholder for {getattr(source, 'name', source)}: {e}")
+        return ''
+    finally:
+        source.seek(0)
+    return 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def content_hash(upload) -> str:
+    """SHA-256 of an upload, read in chunks"""
+    digest = hashlib.sha256()
+    upload.seek(0)
+    for chunk in upload.chunks():
+        digest.update(chunk)
+    upload.seek(0)
+    return digest.hexdigest()
+
+
+def _compress_and_save(upload, name: str):
+    """Compress an upload into storage under name, returning the stored name and size
+
+    When compression fails the original upload is stored instead.
+    """
+    handle, compressed_path = tempfile.mkstemp(suffix=os.path.splitext(name)[1])
+    os.close(handle)
+    try:
+        try:
+            _compress_to_file(upload, compressed_path)
+        except Exception as e:
+            logger.warning(f"Could not compress {upload.name}, storing original: {e}")
+            upload.seek(0)
+            return default_storage.save(name, upload), upload.size
+
+        with open(compressed_path, 'rb') as compressed:
+            return default_storage.save(name, File(compressed, name=upload.name)), os.path.getsize(compressed_path)
+    finally:
+        os.remove(compressed_path)
+
+
+def store_image(upload, upload_to: str) -> StoredImage:
+    """Store an uploaded image once per distinct content, returning its name and placeholder
+
+    The caller owns one reference on the returned name and must hand it to
+    release_images if the row using it is not saved or is later deleted.
+    """
+    from shopiet.models import ImageBlob  # Lazy import
+
+    digest = content_hash(upload)
+    existing = ImageBlob.objects.acquire(digest)
+    if existing is not None:
+        return StoredImage(*existing)
+
+    placeholder = placeholder_for(upload)
+    extension = os.path.splitext(upload.name)[1].lower()
+    name = default_storage.generate_filename(os.path.join(upload_to, digest[:2], f'{digest}{extension}'))
+    stored, size = _compress_and_save(upload, name)
+
+    blob, created = ImageBlob.objects.register(digest, stored, size, placeholder)
+    if not created and blob[0] != stored:
+        # A concurrent upload of the same bytes won the race; never delete the file its blob uses
+        delete_stored([stored])
+    return StoredImage(*blob)
+
+
+def _store_in_worker(upload, upload_to: str) -> StoredImage:
+    try:
+        return store_image(upload, upload_to)
+    finally:
+        # Worker threads must not leak connections (or pool slots)
+        connections.close_all()
+
+
+def store_images(uploads: Sequence[Tuple[object, str]], workers: Optional[int] = None) -> List[StoredImage]:
+    """Compress and store (upload, upload_to) pairs concurrently, returning results in input order
+
+    If any image fails, the ones already stored are deleted before re-raising.
+    """
+    if not uploads:
+        return []
+    workers = min(workers or settings.IMAGE_PROCESSING_WORKERS, len(uploads))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-upload') as pool:
+        futures = [pool.submit(_store_in_worker, upload, upload_to) for upload, upload_to in uploads]
+
+    stored, error = [], None
+    for future in futures:
+        try:
+            stored.append(future.result())
+        except Exception as e:
+            error = error or e
+    if error is not None:
+        release_images([image.name for image in stored])
+        raise error
+    return stored
+
+
+def delete_stored(names: Sequence[str]):
+    """Best-effort removal of stored files"""
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except Exception as e:
+            logger.warning(f"Could not delete orphaned upload {name}: {e}")
+
+
+def release_images(names: Sequence[str]):
+    """Drop one reference per stored name, deleting files nothing uses any more
+
+    Files are removed only after the surrounding transaction commits, so a
+    rolled back delete keeps its images.
+    """
+    from shopiet.models import ImageBlob  # Lazy import
+
+    orphans = ImageBlob.objects.release(names)
+    if orphans:
+        transaction.on_commit(lambda: delete_stored(orphans))
+
+
+def compress_field_file(field_file) -> str:
+    """Replace a newly assigned image on a model field with its stored copy, returning its placeholder"""
+    upload_to = field_file.field.upload_to
+    stored = store_image(field_file.file, upload_to)
+    field_file.name = stored.name
+    field_file._committed = True
+    return stored.placeholder
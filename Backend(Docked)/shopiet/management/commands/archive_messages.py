@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from shopiet.message_partitions import archive_partition, cold_partitions, is_partitioned
+
+
+class Command(BaseCommand):
+    help = "Move cold monthly message partitions into the compressed MessageArchive table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--after-months', type=int, help="Archive months older than this")
+        parser.add_argument('--dry-run', action='store_true', help="List the partitions without archiving")
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            self.stdout.write("Message table is not partitioned, nothing to do")
+            return
+
+        partitions = cold_partitions(options['after_months'])
+        archived = 0
+        for partition in partitions:
+            if options['dry_run']:
+                self.stdout.write(f"Would archive {partition.name}")
+                continue
+            count = archive_partition(partition)
+            archived += count
+            self.stdout.write(f"Archived {count} messages from {partition.name}")
+
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} messages from {len(partitions)} partitions"))
@@ -0,0 +1,45 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from shopiet.image_processing import placeholder_for
+from shopiet.models import ImageBlob, Images, Item
+
+
+class Command(BaseCommand):
+    help = "Build inline placeholders for images stored before they were computed on upload"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help="Rows per bulk UPDATE")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        cache = dict(ImageBlob.objects.exclude(placeholder='').values_list('name', 'placeholder'))
+
+        def placeholder(name):
+            if name not in cache:
+                try:
+                    with default_storage.open(name, 'rb') as source:
+                        cache[name] = placeholder_for(source)
+                except Exception as e:
+                    self.stderr.write(f"Could not open {name}: {e}")
+                    cache[name] = ''
+            return cache[name]
+
+        blobs = list(ImageBlob.objects.filter(placeholder='').only('name'))
+        for blob in blobs:
+            blob.placeholder = placeholder(blob.name)
+        ImageBlob.objects.bulk_update(blobs, ['placeholder'], batch_size=batch_size)
+
+        items = list(Item.objects.filter(item_thumbnail_placeholder='').exclude(item_thumbnail='').only('item_thumbnail'))
+        for item in items:
+            item.item_thumbnail_placeholder = placeholder(item.item_thumbnail.name)
+        Item.objects.bulk_update(items, ['item_thumbnail_placeholder'], batch_size=batch_size)
+
+        images = list(Images.objects.filter(image_placeholder='').exclude(image='').exclude(image=None).only('image'))
+        for image in images:
+            image.image_placeholder = placeholder(image.image.name)
+        Images.objects.bulk_update(images, ['image_placeholder'], batch_size=batch_size)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Built placeholders for {len(blobs)} blobs, {len(items)} thumbnails and {len(images)} images"
+        ))
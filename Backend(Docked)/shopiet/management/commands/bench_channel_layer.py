@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.channel_layers import ShardedRedisChannelLayer
+
+
+async def _measure(hosts, groups, messages, concurrency, timeout):
+    """group_send throughput with one receiving channel per group, in messages per second"""
+    layer = ShardedRedisChannelLayer(hosts=hosts, prefix=f'bench{time.monotonic_ns()}', capacity=messages)
+    channels = []
+    for index in range(groups):
+        channel = await layer.new_channel()
+        await layer.group_add(f'bench_room_{index}', channel)
+        channels.append(channel)
+
+    received = 0
+    done = asyncio.Event()
+
+    async def receive(channel):
+        nonlocal received
+        while not done.is_set():
+            await layer.receive(channel)
+            received += 1
+            if received >= messages:
+                done.set()
+
+    receivers = [asyncio.ensure_future(receive(channel)) for channel in channels]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(number):
+        async with semaphore:
+            await layer.group_send(f'bench_room_{number % groups}', {'type': 'chat_message', 'text': 'x' * 64})
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(number) for number in range(messages)))
+    try:
+        await asyncio.wait_for(done.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    duration = time.perf_counter() - started
+
+    for task in receivers:
+        task.cancel()
+    await asyncio.gather(*receivers, return_exceptions=True)
+    await layer.flush()
+    return received / duration, received
+
+
+class Command(BaseCommand):
+    help = "Measure channel layer group_send throughput from 1 to N Redis shards"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shards', required=True,
+                            help="Comma separated redis:// URLs, e.g. local instances on 6379-6382")
+        parser.add_argument('--groups', type=int, default=200, help="Rooms, one receiving channel each")
+        parser.add_argument('--messages', type=int, default=20000, help="group_send calls per run")
+        parser.add_argument('--concurrency', type=int, default=100, help="Concurrent group_send calls")
+        parser.add_argument('--timeout', type=float, default=60.0, help="Seconds to wait for delivery")
+
+    def handle(self, *args, **options):
+        shards = [url.strip() for url in options['shards'].split(',') if url.strip()]
+        if not shards:
+            raise CommandError("Give at least one shard")
+
+        self.stdout.write("shards  msgs/s  delivered")
+        for count in range(1, len(shards) + 1):
+            rate, received = asyncio.run(_measure(
+                shards[:count], options['groups'], options['messages'],
+                options['concurrency'], options['timeout'],
+            ))
+            self.stdout.write(f"{count:>6}  {rate:>6.0f}  {received}/{options['messages']}")
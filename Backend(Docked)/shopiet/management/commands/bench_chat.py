@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from backend.chat_bench import run_chat_bench
+
+
+class Command(BaseCommand):
+    help = "Benchmark chat consumers over an in-memory channel layer and a throwaway test database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--consumer', action='append', dest='consumers',
+                            help="Dotted path of a consumer class; repeat to compare implementations")
+        parser.add_argument('--rooms', type=int, default=50, help="Concurrent rooms")
+        parser.add_argument('--sockets', type=int, default=2, help="Sockets per room")
+        parser.add_argument('--messages', type=int, default=20, help="Messages sent per room")
+        parser.add_argument('--timeout', type=float, default=10.0, help="Seconds to wait for a frame")
+        parser.add_argument('--keepdb', action='store_true', help="Reuse the test database between runs")
+
+    def handle(self, *args, **options):
+        consumers = options['consumers'] or ['backend.consumers.ChatConsumer']
+
+        # Messages and users are written for real; keep them out of the working database
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            for consumer in consumers:
+                result = run_chat_bench(
+                    consumer, rooms=options['rooms'], sockets_per_room=options['sockets'],
+                    messages_per_room=options['messages'], timeout=options['timeout'],
+                )
+                summary = result.summary()
+                self.stdout.write(self.style.SUCCESS(consumer))
+                self.stdout.write(
+                    f"  sockets {summary['sockets']}, "
+                    f"sent {summary['sent_per_second']:.0f} msg/s, "
+                    f"delivered {summary['delivered_per_second']:.0f} frames/s "
+                    f"({summary['lost_frames']} lost)\n"
+                    f"  fan-out latency p50 {summary['p50_ms']:.1f} ms, "
+                    f"p95 {summary['p95_ms']:.1f} ms, p99 {summary['p99_ms']:.1f} ms\n"
+                    f"  db writes {summary['db_writes_per_second']:.0f}/s, "
+                    f"memory {summary['kib_per_socket']:.1f} KiB/socket"
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
@@ -0,0 +1,77 @@
+import hashlib
+import os
+import random
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.views.static import serve
+
+from backend.media import etag_for, serve_media
+
+
+def _consume(response) -> int:
+    """Read a response body the way a server would, returning its size"""
+    try:
+        if response.streaming:
+            return sum(len(chunk) for chunk in response.streaming_content)
+        return len(response.content)
+    finally:
+        response.close()
+
+
+class Command(BaseCommand):
+    help = "Compare serve_media with django.views.static.serve for full, range and conditional requests"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=2 * 1024 * 1024, help="Bytes in the test file")
+        parser.add_argument('--requests', type=int, default=500, help="Requests per scenario")
+        parser.add_argument('--range-bytes', type=int, default=256 * 1024,
+                            help="Length of each random byte range")
+
+    def handle(self, *args, **options):
+        payload = os.urandom(options['size'])
+        name = f'{hashlib.sha256(payload).hexdigest()}.jpg'
+
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root, MEDIA_ACCEL=''):
+            with open(os.path.join(media_root, name), 'wb') as file:
+                file.write(payload)
+            etag = etag_for(os.stat(os.path.join(media_root, name)))
+
+            factory = RequestFactory()
+            handlers = {
+                'static.serve': lambda request: serve(request, name, document_root=media_root),
+                'serve_media': lambda request: serve_media(request, name),
+            }
+
+            def full():
+                return {}
+
+            def byte_range():
+                start = random.randrange(max(options['size'] - options['range_bytes'], 1))
+                return {'HTTP_RANGE': f'bytes={start}-{start + options["range_bytes"] - 1}'}
+
+            def conditional():
+                return {'HTTP_IF_NONE_MATCH': etag}
+
+            self.stdout.write("scenario     handler       req/s     MiB/s  bytes/req  status")
+            for scenario, headers in (('full', full), ('range', byte_range), ('conditional', conditional)):
+                for label, handler in handlers.items():
+                    sent, statuses = 0, set()
+                    started = time.perf_counter()
+                    for _ in range(options['requests']):
+                        response = handler(factory.get(f'/media/{name}', **headers()))
+                        statuses.add(response.status_code)
+                        sent += _consume(response)
+                    duration = time.perf_counter() - started or 1e-9
+                    self.stdout.write(
+                        f"{scenario:<12} {label:<12} {options['requests'] / duration:>7.0f} "
+                        f"{sent / duration / 1048576:>9.1f} {sent // options['requests']:>10} "
+                        f"{','.join(map(str, sorted(statuses)))}"
+                    )
+
+        self.stdout.write(self.style.SUCCESS(
+            "In-process numbers exclude the socket; under gunicorn serve_media bodies also go out with sendfile"
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from shopiet.recommendations import build_co_saved_items
+
+
+class Command(BaseCommand):
+    help = "Rebuild the co-saved items table from SavedItem"
+
+    def handle(self, *args, **options):
+        stored = build_co_saved_items()
+        self.stdout.write(self.style.SUCCESS(f"Stored {stored} co-saved item pairs"))
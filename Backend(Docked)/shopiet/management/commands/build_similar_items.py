@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from shopiet.recommendations import build_similar_items
+
+
+class Command(BaseCommand):
+    help = "Rebuild the precomputed similar items table from TF-IDF vectors"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, help="Neighbours stored per item")
+
+    def handle(self, *args, **options):
+        stored = build_similar_items(top_k=options['top_k'])
+        self.stdout.write(self.style.SUCCESS(f"Stored {stored} similar item pairs"))
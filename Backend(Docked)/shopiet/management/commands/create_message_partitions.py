@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from shopiet.message_partitions import ensure_partitions, is_partitioned
+
+
+class Command(BaseCommand):
+    help = "Create monthly message partitions ahead of time"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, help="Months past the current one to create")
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            self.stdout.write("Message table is not partitioned, nothing to do")
+            return
+
+        created = ensure_partitions(options['months_ahead'])
+        for name in created:
+            self.stdout.write(f"Created {name}")
+        self.stdout.write(self.style.SUCCESS(f"Created {len(created)} message partitions"))
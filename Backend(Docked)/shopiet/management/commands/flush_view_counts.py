@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from shopiet.view_counts import flush_view_counts
+
+
+class Command(BaseCommand):
+    help = "Write buffered item views from Redis back to Item.view_count"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Rows per bulk UPDATE")
+        parser.add_argument('--interval', type=float, help="Keep flushing every N seconds")
+
+    def handle(self, *args, **options):
+        while True:
+            updated = flush_view_counts(batch_size=options['batch_size'])
+            self.stdout.write(f"Flushed view counts for {updated} items")
+
+            if not options['interval']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,58 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from shopiet.image_processing import delete_stored
+from shopiet.models import ImageBlob, Images, Item
+
+
+def count_references(name):
+    return Item.objects.filter(item_thumbnail=name).count() + Images.objects.filter(image=name).count()
+
+
+class Command(BaseCommand):
+    help = "Recount image blob references and delete blobs no item uses"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-minutes', type=int, default=60,
+                            help="Leave blobs an upload referenced more recently than this, it may still be in flight")
+        parser.add_argument('--dry-run', action='store_true', help="Report without changing anything")
+
+    def handle(self, *args, **options):
+        references = Counter(Item.objects.exclude(item_thumbnail='').values_list('item_thumbnail', flat=True))
+        references.update(Images.objects.exclude(image='').exclude(image=None).values_list('image', flat=True))
+
+        cutoff = timezone.now() - timedelta(minutes=options['grace_minutes'])
+        candidates = [
+            pk for pk, name, ref_count in ImageBlob.objects.filter(touched_at__lt=cutoff)
+            .values_list('pk', 'name', 'ref_count').iterator()
+            if references.get(name, 0) != ref_count
+        ]
+
+        corrected, orphans = 0, []
+        for pk in candidates:
+            # The scan above may be stale: recount under the row lock, which blocks acquire
+            with transaction.atomic():
+                blob = ImageBlob.objects.select_for_update().filter(pk=pk, touched_at__lt=cutoff).first()
+                if blob is None:
+                    continue
+                actual = count_references(blob.name)
+                if actual == blob.ref_count:
+                    continue
+                if actual == 0:
+                    orphans.append(blob.name)
+                    if not options['dry_run']:
+                        blob.delete()
+                        transaction.on_commit(lambda name=blob.name: delete_stored([name]))
+                else:
+                    corrected += 1
+                    if not options['dry_run']:
+                        ImageBlob.objects.filter(pk=pk, ref_count=blob.ref_count).update(ref_count=actual)
+
+        prefix = "Would delete" if options['dry_run'] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} {len(orphans)} unreferenced blobs, corrected {corrected} reference counts"
+        ))
@@ -0,0 +1,75 @@
+import io
+import json
+
+import requests
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from shopiet.direct_uploads import (STAGING_EXPIRE_DAYS, STAGING_PREFIX, direct_uploads_enabled,
+                                    discard_staged, open_staged, presign_upload)
+from shopiet.models import Images, Item, Profile
+
+PUBLIC_PREFIXES = (
+    Item.item_thumbnail.field.upload_to,
+    Images.image.field.upload_to,
+    Profile.profile_pic.field.upload_to,
+)
+
+
+class Command(BaseCommand):
+    help = "Create the media bucket, expire abandoned direct uploads and smoke test presigned uploads"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="Upload a test image through a presigned form and read it back")
+        parser.add_argument('--username', default='bucket-check', help="Staging prefix used by --check")
+
+    def handle(self, *args, **options):
+        if not direct_uploads_enabled():
+            raise CommandError("MEDIA_STORAGE is not 's3'")
+
+        client = default_storage.connection.meta.client
+        bucket = default_storage.bucket_name
+        existing = {entry['Name'] for entry in client.list_buckets().get('Buckets', [])}
+        if bucket not in existing:
+            client.create_bucket(Bucket=bucket)
+            self.stdout.write(f"Created bucket {bucket}")
+
+        client.put_bucket_lifecycle_configuration(Bucket=bucket, LifecycleConfiguration={'Rules': [{
+            'ID': 'expire-staged-uploads',
+            'Filter': {'Prefix': f'{STAGING_PREFIX}/'},
+            'Status': 'Enabled',
+            'Expiration': {'Days': STAGING_EXPIRE_DAYS},
+        }]})
+        # Item images and profile pictures are served by plain URL; staged uploads stay private
+        client.put_bucket_policy(Bucket=bucket, Policy=json.dumps({
+            'Version': '2012-10-17',
+            'Statement': [{
+                'Effect': 'Allow',
+                'Principal': '*',
+                'Action': ['s3:GetObject'],
+                'Resource': [f'arn:aws:s3:::{bucket}/{prefix}/*' for prefix in PUBLIC_PREFIXES],
+            }],
+        }))
+        self.stdout.write(self.style.SUCCESS(f"Bucket {bucket} is ready"))
+
+        if options['check']:
+            self.check_roundtrip(options['username'])
+
+    def check_roundtrip(self, username):
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 64), (141, 197, 114)).save(buffer, 'PNG')
+        payload = buffer.getvalue()
+
+        form = presign_upload(username, 'check.png', 'image/png')
+        response = requests.post(form['url'], data=form['fields'],
+                                 files={'file': ('check.png', payload, 'image/png')}, timeout=30)
+        if response.status_code not in (200, 201, 204):
+            raise CommandError(f"Presigned upload failed with {response.status_code}: {response.text[:200]}")
+
+        with open_staged(username, form['key']) as staged:
+            if staged.read() != payload:
+                raise CommandError("Staged upload does not match what was sent")
+        discard_staged([form['key']])
+        self.stdout.write(self.style.SUCCESS(f"Presigned upload round trip through {form['url']} passed"))
@@ -0,0 +1,187 @@
+"""
+Monthly range partitions of shopiet_message (PostgreSQL only)
+The table is partitioned on timestamp with one partition per month plus a
+default partition. Partitions are created ahead of time, and partitions older
+than MESSAGE_ARCHIVE_AFTER_MONTHS are folded into MessageArchive rows (one
+compressed blob per conversation and month) and then detached and dropped.
+"""
+
+import logging
+import zlib
+from datetime import date
+from itertools import groupby
+from typing import Iterator, List, NamedTuple, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from rest_framework import serializers
+
+from shopiet.models import MessageArchive
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_TABLE = 'shopiet_message'
+DEFAULT_PARTITION = 'shopiet_message_default'
+
+
+class Partition(NamedTuple):
+    name: str
+    start: date
+    end: date
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def partition_name(month: date) -> str:
+    return f'{MESSAGE_TABLE}_y{month.year}m{month.month:02d}'
+
+
+def is_partitioned() -> bool:
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = %s AND c.relnamespace = to_regnamespace(current_schema())",
+            [MESSAGE_TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def create_partition(cursor, month: date):
+    """Create a month's partition, moving its rows out of the default partition first
+
+    Attaching a range the default partition already holds rows for fails, so
+    those rows are moved into the new table before it is attached.
+    """
+    name, start, end = partition_name(month), month.isoformat(), add_months(month, 1).isoformat()
+    with transaction.atomic():
+        cursor.execute(f'LOCK TABLE "{DEFAULT_PARTITION}" IN EXCLUSIVE MODE')
+        cursor.execute(
+            f'SELECT 1 FROM "{DEFAULT_PARTITION}" WHERE timestamp >= %s AND timestamp < %s LIMIT 1',
+            [start, end],
+        )
+        if cursor.fetchone() is None:
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{MESSAGE_TABLE}" '
+                f"FOR VALUES FROM ('{start}') TO ('{end}')"
+            )
+            return
+
+        cursor.execute(f'SELECT * FROM "{MESSAGE_TABLE}" LIMIT 0')
+        columns = ', '.join(f'"{column[0]}"' for column in cursor.description)
+        cursor.execute(f'CREATE TABLE "{name}" (LIKE "{MESSAGE_TABLE}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM "{DEFAULT_PARTITION}" WHERE timestamp >= %s AND timestamp < %s '
+            f'RETURNING {columns}) INSERT INTO "{name}" ({columns}) SELECT {columns} FROM moved',
+            [start, end],
+        )
+        cursor.execute(
+            f'ALTER TABLE "{MESSAGE_TABLE}" ATTACH PARTITION "{name}" '
+            f"FOR VALUES FROM ('{start}') TO ('{end}')"
+        )
+
+
+def ensure_partitions(months_ahead: Optional[int] = None, today: Optional[date] = None) -> List[str]:
+    """Create partitions from the current month to months_ahead months out"""
+    if not is_partitioned():
+        return []
+    months_ahead = settings.MESSAGE_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    current = month_start(today or date.today())
+
+    existing = {partition.name for partition in list_partitions()}
+    created = []
+    with connection.cursor() as cursor:
+        for offset in range(months_ahead + 1):
+            month = add_months(current, offset)
+            if partition_name(month) not in existing:
+                create_partition(cursor, month)
+                created.append(partition_name(month))
+    return created
+
+
+def list_partitions() -> List[Partition]:
+    """Monthly partitions of the message table, oldest first"""
+    if not is_partitioned():
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = %s AND p.relnamespace = to_regnamespace(current_schema())",
+            [MESSAGE_TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = []
+    for name in names:
+        if name == DEFAULT_PARTITION:
+            continue
+        suffix = name[len(MESSAGE_TABLE) + 1:]
+        start = date(int(suffix[1:5]), int(suffix[6:8]), 1)
+        partitions.append(Partition(name, start, add_months(start, 1)))
+    return sorted(partitions, key=lambda partition: partition.start)
+
+
+def cold_partitions(after_months: Optional[int] = None, today: Optional[date] = None) -> List[Partition]:
+    after_months = settings.MESSAGE_ARCHIVE_AFTER_MONTHS if after_months is None else after_months
+    cutoff = add_months(month_start(today or date.today()), -after_months)
+    return [partition for partition in list_partitions() if partition.end <= cutoff]
+
+
+def _fetch_rows(cursor, chunk_size: int = 2000) -> Iterator[tuple]:
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def archive_partition(partition: Partition, batch_size: int = 500) -> int:
+    """Compress a partition into MessageArchive rows, then detach and drop it"""
+    timestamp_field = serializers.DateTimeField()
+    archived = 0
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            # Block new writes into the month while it is copied out
+            cursor.execute(f'LOCK TABLE "{partition.name}" IN SHARE MODE')
+            cursor.execute(
+                f'SELECT conversation_id, id, sender_id, recipient_id, content, content_z, timestamp, seq '
+                f'FROM "{partition.name}" ORDER BY conversation_id, id'
+            )
+            pending = []
+            for conversation_id, rows in groupby(_fetch_rows(cursor), key=lambda row: row[0]):
+                rows = [
+                    [message_id, sender_id, recipient_id,
+                     # The archive blob is compressed as a whole
+                     zlib.decompress(bytes(content_z)).decode('utf8') if content_z else content,
+                     timestamp_field.to_representation(timestamp), seq]
+                    for _, message_id, sender_id, recipient_id, content, content_z, timestamp, seq in rows
+                ]
+                if conversation_id is None:
+                    logger.warning(f"Dropping {len(rows)} messages without a conversation from {partition.name}")
+                    continue
+                pending.append(MessageArchive(
+                    conversation_id=conversation_id, month=partition.start,
+                    first_id=rows[0][0], last_id=rows[-1][0], message_count=len(rows),
+                    payload=MessageArchive.pack(rows),
+                ))
+                archived += len(rows)
+                if len(pending) >= batch_size:
+                    MessageArchive.objects.bulk_create(pending)
+                    pending = []
+            MessageArchive.objects.bulk_create(pending)
+
+            cursor.execute(f'ALTER TABLE "{MESSAGE_TABLE}" DETACH PARTITION "{partition.name}"')
+            cursor.execute(f'DROP TABLE "{partition.name}"')
+
+    logger.info(f"Archived {archived} messages from {partition.name}")
+    return archived
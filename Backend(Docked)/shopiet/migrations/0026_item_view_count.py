@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-19 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopiet', '0025_remove_item_latitudes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='view_count',
+            field=models.PositiveBigIntegerField(db_index=True, default=0),
+        ),
+    ]
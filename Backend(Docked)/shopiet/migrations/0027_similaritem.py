@@ -0,0 +1,27 @@
+# Generated by Django 5.0 on 2026-10-19 09:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopiet', '0026_item_view_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_items', to='shopiet.item')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shopiet.item')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['item', '-score'], name='similar_item_score_idx')],
+                'constraints': [models.UniqueConstraint(fields=('item', 'similar'), name='unique_similar_item')],
+            },
+        ),
+    ]
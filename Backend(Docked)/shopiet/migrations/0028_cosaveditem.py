@@ -0,0 +1,27 @@
+# Generated by Django 5.0 on 2026-10-19 10:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopiet', '0027_similaritem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoSavedItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=1)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='co_saved_items', to='shopiet.item')),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shopiet.item')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['item', '-count'], name='cosaved_item_count_idx')],
+                'constraints': [models.UniqueConstraint(fields=('item', 'other'), name='unique_cosaved_item')],
+            },
+        ),
+    ]
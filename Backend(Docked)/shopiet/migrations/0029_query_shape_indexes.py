@@ -0,0 +1,40 @@
+# Generated by Django 5.0 on 2026-10-19 11:00
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_saved_items(apps, schema_editor):
+    """Keep the first save of each (user, item) pair so the unique constraint can be added"""
+    SavedItem = apps.get_model('shopiet', 'SavedItem')
+    duplicates = (
+        SavedItem.objects.values('user', 'item')
+        .annotate(first_id=Min('id'), saves=Count('id'))
+        .filter(saves__gt=1)
+    )
+    for row in duplicates:
+        SavedItem.objects.filter(user=row['user'], item=row['item']).exclude(id=row['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopiet', '0028_cosaveditem'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    # Message lookups are indexed by later migrations: the per-pair timeline by
+    # message_conversation_idx (0030, which also drops Message.viewed and with it
+    # any partial unread index) and resumes by message_conversation_seq_idx (0032)
+    operations = [
+        migrations.RunPython(remove_duplicate_saved_items, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['item_username'], name='item_username_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='saveditem',
+            constraint=models.UniqueConstraint(fields=('user', 'item'), name='unique_saved_item'),
+        ),
+    ]
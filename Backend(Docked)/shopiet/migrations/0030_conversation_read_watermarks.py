@@ -0,0 +1,80 @@
+# Generated by Django 5.0 on 2026-10-19 12:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max, Q
+
+
+def backfill_conversations(apps, schema_editor):
+    """Create a conversation per user pair and derive read watermarks from the viewed flags"""
+    Conversation = apps.get_model('shopiet', 'Conversation')
+    Message = apps.get_model('shopiet', 'Message')
+
+    pairs = {
+        tuple(sorted(pair))
+        for pair in Message.objects.values_list('sender_id', 'recipient_id').distinct()
+    }
+    for user_low, user_high in pairs:
+        messages = Message.objects.filter(
+            Q(sender_id=user_low, recipient_id=user_high) | Q(sender_id=user_high, recipient_id=user_low)
+        )
+        latest = messages.aggregate(last_id=Max('id'), last_at=Max('timestamp'))
+
+        def last_read(user_id):
+            # Everything a user sent or has seen counts as read
+            read = messages.filter(Q(sender_id=user_id) | Q(recipient_id=user_id, viewed=True))
+            return read.aggregate(last=Max('id'))['last'] or 0
+
+        conversation = Conversation.objects.create(user_low_id=user_low, user_high_id=user_high)
+        Conversation.objects.filter(pk=conversation.pk).update(
+            last_message_id=latest['last_id'],
+            updated_at=latest['last_at'],
+            user_low_last_read=last_read(user_low),
+            user_high_last_read=last_read(user_high),
+        )
+        messages.update(conversation=conversation)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopiet', '0029_query_shape_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_low_last_read', models.PositiveBigIntegerField(default=0)),
+                ('user_high_last_read', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now_add=True)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='shopiet.message')),
+                ('user_high', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user_low', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['user_low', '-updated_at'], name='conversation_low_idx'),
+                    models.Index(fields=['user_high', '-updated_at'], name='conversation_high_idx'),
+                ],
+                'constraints': [models.UniqueConstraint(fields=('user_low', 'user_high'), name='unique_conversation')],
+            },
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='conversation',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='shopiet.conversation'),
+        ),
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='message',
+            name='viewed',
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'id'], name='message_conversation_idx'),
+        ),
+    ]
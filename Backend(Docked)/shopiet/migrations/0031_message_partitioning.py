@@ -0,0 +1,142 @@
+# Generated by Django 5.0 on 2026-10-19 13:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from datetime import date, datetime, timezone
+from django.db import migrations, models
+from django.db.models import Max, Min, OuterRef, Subquery
+
+MESSAGE_TABLE = 'shopiet_message'
+MONTHS_AHEAD = 3
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def backfill_time_bounds(apps, schema_editor):
+    """Start conversations at their first message and time-stamp the read watermarks"""
+    Conversation = apps.get_model('shopiet', 'Conversation')
+    Message = apps.get_model('shopiet', 'Message')
+
+    def message_time(field):
+        return Subquery(Message.objects.filter(id=OuterRef(field)).values('timestamp')[:1])
+
+    for conversation in Conversation.objects.annotate(
+        first_at=Min('messages__timestamp'),
+        low_read_at=message_time('user_low_last_read'),
+        high_read_at=message_time('user_high_last_read'),
+    ):
+        Conversation.objects.filter(pk=conversation.pk).update(
+            started_at=conversation.first_at or conversation.updated_at,
+            user_low_read_at=conversation.low_read_at,
+            user_high_read_at=conversation.high_read_at,
+        )
+
+
+def partition_messages(apps, schema_editor):
+    """Rebuild shopiet_message as a table range-partitioned by month on timestamp"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    Message = apps.get_model('shopiet', 'Message')
+    bounds = Message.objects.aggregate(oldest=Min('timestamp'), max_id=Max('id'))
+    execute = schema_editor.execute
+
+    execute(f'ALTER TABLE {MESSAGE_TABLE} RENAME TO {MESSAGE_TABLE}_unpartitioned')
+    # Free the names the new table needs: the identity sequence goes with
+    # DROP IDENTITY, the primary key and index are renamed
+    execute(f'ALTER TABLE {MESSAGE_TABLE}_unpartitioned ALTER COLUMN id DROP IDENTITY IF EXISTS')
+    execute(f'ALTER TABLE {MESSAGE_TABLE}_unpartitioned RENAME CONSTRAINT {MESSAGE_TABLE}_pkey '
+            f'TO {MESSAGE_TABLE}_unpartitioned_pkey')
+    execute(f'ALTER INDEX message_conversation_idx RENAME TO message_conversation_unpartitioned_idx')
+    # The primary key of a partitioned table must include the partition key
+    execute(f'CREATE SEQUENCE {MESSAGE_TABLE}_id_seq START WITH {(bounds["max_id"] or 0) + 1}')
+    execute(
+        f'CREATE TABLE {MESSAGE_TABLE} ('
+        f"id bigint NOT NULL DEFAULT nextval('{MESSAGE_TABLE}_id_seq'), "
+        f'sender_id integer NOT NULL REFERENCES auth_user (id) DEFERRABLE INITIALLY DEFERRED, '
+        f'recipient_id integer NOT NULL REFERENCES auth_user (id) DEFERRABLE INITIALLY DEFERRED, '
+        f'conversation_id bigint NULL REFERENCES shopiet_conversation (id) DEFERRABLE INITIALLY DEFERRED, '
+        f'content text NOT NULL, '
+        f'timestamp timestamp with time zone NOT NULL, '
+        f'PRIMARY KEY (id, timestamp)'
+        f') PARTITION BY RANGE (timestamp)'
+    )
+    execute(f'ALTER SEQUENCE {MESSAGE_TABLE}_id_seq OWNED BY {MESSAGE_TABLE}.id')
+    execute(f'CREATE TABLE {MESSAGE_TABLE}_default PARTITION OF {MESSAGE_TABLE} DEFAULT')
+
+    today = datetime.now(timezone.utc).date().replace(day=1)
+    oldest = bounds['oldest']
+    month = date(oldest.year, oldest.month, 1) if oldest else today
+    while month <= add_months(today, MONTHS_AHEAD):
+        execute(
+            f'CREATE TABLE {MESSAGE_TABLE}_y{month.year}m{month.month:02d} PARTITION OF {MESSAGE_TABLE} '
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        )
+        month = add_months(month, 1)
+
+    execute(
+        f'INSERT INTO {MESSAGE_TABLE} (id, sender_id, recipient_id, conversation_id, content, timestamp) '
+        f'SELECT id, sender_id, recipient_id, conversation_id, content, timestamp '
+        f'FROM {MESSAGE_TABLE}_unpartitioned'
+    )
+    # Check the copied rows' deferred foreign keys now, indexes cannot be built with them pending
+    execute('SET CONSTRAINTS ALL IMMEDIATE')
+    execute(f'DROP TABLE {MESSAGE_TABLE}_unpartitioned')
+
+    # Indexes declared on the parent are created on every partition
+    execute(f'CREATE INDEX message_conversation_idx ON {MESSAGE_TABLE} (conversation_id, id)')
+    execute(f'CREATE INDEX shopiet_message_sender_id_idx ON {MESSAGE_TABLE} (sender_id)')
+    execute(f'CREATE INDEX shopiet_message_recipient_id_idx ON {MESSAGE_TABLE} (recipient_id)')
+    execute(f'CREATE INDEX shopiet_message_timestamp_idx ON {MESSAGE_TABLE} (timestamp)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopiet', '0030_conversation_read_watermarks'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='conversation',
+            name='last_message',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='shopiet.message'),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='started_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user_low_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user_high_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_time_bounds, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='MessageArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('first_id', models.PositiveBigIntegerField()),
+                ('last_id', models.PositiveBigIntegerField()),
+                ('message_count', models.PositiveIntegerField()),
+                ('payload', models.BinaryField()),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archives', to='shopiet.conversation')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('conversation', 'month'), name='unique_message_archive')],
+            },
+        ),
+        # Not reversible: the partitioned table keeps every row and index of the original
+        migrations.RunPython(partition_messages),
+    ]
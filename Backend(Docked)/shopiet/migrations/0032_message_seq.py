@@ -0,0 +1,51 @@
+# Generated by Django 5.0 on 2026-10-19 14:00
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def backfill_sequence_numbers(apps, schema_editor):
+    """Number existing messages per conversation in id order"""
+    Conversation = apps.get_model('shopiet', 'Conversation')
+    Message = apps.get_model('shopiet', 'Message')
+
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'UPDATE shopiet_message m SET seq = numbered.seq '
+            'FROM (SELECT id, timestamp, row_number() OVER (PARTITION BY conversation_id ORDER BY id) AS seq '
+            'FROM shopiet_message WHERE conversation_id IS NOT NULL) numbered '
+            'WHERE m.id = numbered.id AND m.timestamp = numbered.timestamp'
+        )
+    else:
+        for conversation_id in Conversation.objects.values_list('id', flat=True):
+            ids = Message.objects.filter(conversation_id=conversation_id).order_by('id').values_list('id', flat=True)
+            for seq, message_id in enumerate(ids, start=1):
+                Message.objects.filter(id=message_id).update(seq=seq)
+
+    for conversation in Conversation.objects.annotate(max_seq=Max('messages__seq')):
+        Conversation.objects.filter(pk=conversation.pk).update(last_seq=conversation.max_seq or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopiet', '0031_message_partitioning'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_sequence_numbers, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'seq'], name='message_conversation_seq_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-19 15:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopiet', '0032_message_seq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='content_z',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
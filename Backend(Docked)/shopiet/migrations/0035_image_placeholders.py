@@ -0,0 +1,28 @@
+# Generated by Django 5.0 on 2026-10-19 17:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopiet', '0034_imageblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='item_thumbnail_placeholder',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='images',
+            name='image_placeholder',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='imageblob',
+            name='placeholder',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
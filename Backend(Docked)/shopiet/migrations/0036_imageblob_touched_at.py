@@ -0,0 +1,20 @@
+# Generated by Django 5.0 on 2026-10-19 18:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopiet', '0035_image_placeholders'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageblob',
+            name='touched_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
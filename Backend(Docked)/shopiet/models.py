@@ -1,14 +1,16 @@
-from django.db import models
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
 from django.utils.text import slugify
 from django.contrib.auth.models import User
-from django.db.models import Q, Max, Count
+from django.db.models import Case, Count, DateTimeField, ExpressionWrapper, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest, Now
+from datetime import timedelta
+import json
+import zlib
 from phonenumber_field.modelfields import PhoneNumberField
 import random
 import time
-import tinify
-import tempfile
-import os
-from django.core.files import File
+from shopiet.image_processing import compress_field_file, release_images
 # Create your models here.
 
 
@@ -36,6 +38,8 @@ class Item(models.Model):
     item_price = models.DecimalField(max_digits=10, decimal_places=2,  blank=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True)
     item_thumbnail = models.ImageField(upload_to='item_thumbnails')
+    # Inline 16px preview shown until the thumbnail loads
+    item_thumbnail_placeholder = models.TextField(blank=True, default='', editable=False)
     item_description = models.TextField( blank=False)
     item_condition = models.CharField(max_length=10, choices=CONDITION_CHOICES, default='used')
     delivery = models.BooleanField(default=False)
@@ -53,24 +57,18 @@ class Item(models.Model):
         if self.category:
             self.item_category_name = self.category.name
 
-        if self.item_thumbnail and hasattr(self.item_thumbnail, 'file'):
-            with self.item_thumbnail.open('rb') as source:
-                source_data = source.read()
-                result_data = tinify.from_buffer(source_data).to_buffer()
-
-                with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                    try:
-                        temp_file.write(result_data)
-                        temp_file.seek(0)
-                        self.item_thumbnail.save(os.path.basename(self.item_thumbnail.name), temp_file, save=False)
-                    except Exception as e:
-                        print(f"An error occurred: {e}")
-                    finally:
-                        temp_file.close()
-                        os.remove(temp_file.name)
+        # Only newly assigned uploads; stored files are already compressed
+        replaced = None
+        if self.item_thumbnail and not self.item_thumbnail._committed:
+            if self.pk:
+                replaced = Item.objects.filter(pk=self.pk).values_list('item_thumbnail', flat=True).first()
+            self.item_thumbnail_placeholder = compress_field_file(self.item_thumbnail)
 
         super().save(*args, **kwargs)
 
+        if replaced and replaced != self.item_thumbnail.name:
+            release_images([replaced])
+
     def generate_unique_slug(self):
         base_slug = slugify(self.item_name)
         unique_part = str(int(time.time())) + str(random.randint(1, 1000))  # Combine time and random number
@@ -81,50 +79,168 @@ class Item(models.Model):
         Category, related_name="category", on_delete=models.CASCADE, null=True,db_index=True)
     item_username = models.CharField(max_length=150, blank=True)
     item_category_name = models.CharField(max_length=150, blank=True,db_index=True)
+    # Denormalized popularity, flushed in bulk from the Redis view buffer
+    view_count = models.PositiveBigIntegerField(default=0, db_index=True)
+
+    class Meta:
+        indexes = [
+            # getProfile lists a seller's items by username
+            models.Index(fields=['item_username'], name='item_username_idx'),
+        ]
 
     
 
     
     def __str__(self):
      return self.item_name
+
+
+class ViewCountFlush(models.Model):
+    """A view buffer batch already added to Item.view_count, so a retried flush skips it"""
+    batch_id = models.CharField(max_length=32, unique=True)
+    flushed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.batch_id
+
     
 class SavedItem(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=True)
     item = models.ForeignKey(Item, on_delete=models.CASCADE, db_index=True)
     saved_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # Also serves getSavedItems, which filters by user
+            models.UniqueConstraint(fields=['user', 'item'], name='unique_saved_item'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.item.item_name}"
 
 
+class SimilarItem(models.Model):
+    """Precomputed content-similar listing for an item"""
+    item = models.ForeignKey(Item, related_name='similar_items', on_delete=models.CASCADE)
+    similar = models.ForeignKey(Item, related_name='+', on_delete=models.CASCADE)
+    score = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['item', '-score'], name='similar_item_score_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'similar'], name='unique_similar_item'),
+        ]
+
+    def __str__(self):
+        return f"{self.item_id} ~ {self.similar_id} ({self.score:.3f})"
+
+
+class CoSavedItem(models.Model):
+    """How many users saved both item and other"""
+    item = models.ForeignKey(Item, related_name='co_saved_items', on_delete=models.CASCADE)
+    other = models.ForeignKey(Item, related_name='+', on_delete=models.CASCADE)
+    count = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['item', '-count'], name='cosaved_item_count_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'other'], name='unique_cosaved_item'),
+        ]
+
+    def __str__(self):
+        return f"{self.item_id} + {self.other_id} ({self.count})"
+
+
 class Images(models.Model):
  
     item = models.ForeignKey(
         Item, related_name="images", on_delete=models.CASCADE, null=True, db_index=True)
     image = models.ImageField(
         upload_to='item_images_additional',  null=True)  
+    image_placeholder = models.TextField(blank=True, default='', editable=False)
 
     def __str__(self):
         return self.item.item_name
 
     def save(self, *args, **kwargs):
-        if self.image and hasattr(self.image, 'file'):
-            with self.image.open('rb') as source:
-                source_data = source.read()
-                result_data = tinify.from_buffer(source_data).to_buffer()
-
-                with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                    try:
-                        temp_file.write(result_data)
-                        temp_file.seek(0)
-                        self.image.save(os.path.basename(self.image.name), temp_file, save=False)
-                    except Exception as e:
-                        print(f"An error occurred: {e}")
-                    finally:
-                        temp_file.close()
-                        os.remove(temp_file.name)
+        replaced = None
+        if self.image and not self.image._committed:
+            if self.pk:
+                replaced = Images.objects.filter(pk=self.pk).values_list('image', flat=True).first()
+            self.image_placeholder = compress_field_file(self.image)
 
         super().save(*args, **kwargs)
+
+        if replaced and replaced != self.image.name:
+            release_images([replaced])
+
+
+class ImageBlobManager(models.Manager):
+    def acquire(self, sha256):
+        """Take a reference on an existing blob, returning its (name, placeholder) or None"""
+        with transaction.atomic():
+            found = self.select_for_update().filter(sha256=sha256).values_list('name', 'placeholder').first()
+            if found is not None:
+                self.filter(sha256=sha256).update(ref_count=F('ref_count') + 1, touched_at=Now())
+            return found
+
+    def register(self, sha256, name, size, placeholder=''):
+        """Record a newly stored blob with one reference
+
+        Returns the (name, placeholder) to use and whether it was new. When
+        another upload of the same bytes registered first, a reference on that
+        blob is returned and the caller should delete its own copy.
+        """
+        while True:
+            try:
+                with transaction.atomic():
+                    self.create(sha256=sha256, name=name, size=size, placeholder=placeholder)
+                return (name, placeholder), True
+            except IntegrityError:
+                existing = self.acquire(sha256)
+                if existing is not None:
+                    return existing, False
+
+    def release(self, names):
+        """Drop one reference per name and delete blobs left unreferenced
+
+        Returns the stored names of the deleted blobs, whose files the caller
+        removes. Names without a blob (files stored before deduplication) are
+        ignored.
+        """
+        counts = {}
+        for name in names:
+            if name:
+                counts[name] = counts.get(name, 0) + 1
+        if not counts:
+            return []
+        with transaction.atomic():
+            for name, count in counts.items():
+                self.filter(name=name).update(ref_count=Greatest(F('ref_count') - count, 0))
+            orphans = list(self.filter(name__in=counts, ref_count=0).values_list('name', flat=True))
+            self.filter(name__in=orphans, ref_count=0).delete()
+        return orphans
+
+
+class ImageBlob(models.Model):
+    """A stored image file shared by every Item thumbnail and Images row with the same bytes"""
+    sha256 = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=1)
+    placeholder = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Last time an upload took a reference; gc_image_blobs leaves recently touched blobs alone
+    touched_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ImageBlobManager()
+
+    def __str__(self):
+        return f'{self.name} ({self.ref_count} refs)'
     
 class Profile(models.Model):
     user = models.OneToOneField(User, null=True, on_delete=models.CASCADE, db_index=True)
@@ -139,46 +255,227 @@ class Profile(models.Model):
 
 
 
+class ConversationManager(models.Manager):
+    def for_pair(self, user_id, other_id):
+        """Get or create the conversation between two users"""
+        user_low, user_high = sorted((user_id, other_id))
+        conversation, _ = self.get_or_create(user_low_id=user_low, user_high_id=user_high)
+        return conversation
+
+    def between_usernames(self, username, other_username):
+        return self.filter(
+            Q(user_low__username=username, user_high__username=other_username) |
+            Q(user_low__username=other_username, user_high__username=username)
+        ).select_related('user_low', 'user_high').first()
+
+
+class Conversation(models.Model):
+    """One row per pair of users, holding the latest message and each side's read watermark"""
+    user_low = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    user_high = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    # No database constraint: messages are partitioned and may be archived
+    last_message = models.ForeignKey('Message', related_name='+', null=True, blank=True,
+                                     on_delete=models.SET_NULL, db_constraint=False)
+    # Id and time of the newest message each participant has read
+    user_low_last_read = models.PositiveBigIntegerField(default=0)
+    user_high_last_read = models.PositiveBigIntegerField(default=0)
+    user_low_read_at = models.DateTimeField(null=True, blank=True)
+    user_high_read_at = models.DateTimeField(null=True, blank=True)
+    # Sequence number of the newest message, assigned under a row lock
+    last_seq = models.PositiveBigIntegerField(default=0)
+    # Lower bound on message timestamps, lets queries skip older partitions
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now_add=True)
+    objects = ConversationManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_low', 'user_high'], name='unique_conversation'),
+        ]
+        indexes = [
+            models.Index(fields=['user_low', '-updated_at'], name='conversation_low_idx'),
+            models.Index(fields=['user_high', '-updated_at'], name='conversation_high_idx'),
+        ]
+
+    def _read_field(self, user_id):
+        return 'user_low_last_read' if user_id == self.user_low_id else 'user_high_last_read'
+
+    def _read_at_field(self, user_id):
+        return 'user_low_read_at' if user_id == self.user_low_id else 'user_high_read_at'
+
+    def last_read_id(self, user_id):
+        return getattr(self, self._read_field(user_id))
+
+    def has_unread(self, user_id):
+        return self.last_message_id is not None and self.last_read_id(user_id) < self.last_message_id
+
+    def unread_count(self, user_id):
+        """Messages from the other participant past the user's watermark"""
+        if not self.has_unread(user_id):
+            return 0
+        read_at = getattr(self, self._read_at_field(user_id)) or self.started_at
+        return (
+            Message.objects.filter(conversation=self, id__gt=self.last_read_id(user_id),
+                                   timestamp__gte=read_at - MESSAGE_CLOCK_SKEW)
+            .exclude(sender_id=user_id)
+            .count()
+        )
+
+    def mark_read(self, user_id):
+        """Move the user's watermark to the latest message; no write when already there"""
+        if not self.has_unread(user_id):
+            return False
+        field, read_at_field = self._read_field(user_id), self._read_at_field(user_id)
+        updated = Conversation.objects.filter(
+            pk=self.pk, **{f'{field}__lt': self.last_message_id}
+        ).update(**{field: self.last_message_id, read_at_field: self.updated_at})
+        setattr(self, field, self.last_message_id)
+        setattr(self, read_at_field, self.updated_at)
+        return bool(updated)
+
+    def record_message(self, message):
+        """Point the conversation at a new message in one UPDATE; the sender has read it"""
+        field, read_at_field = self._read_field(message.sender_id), self._read_at_field(message.sender_id)
+        Conversation.objects.filter(pk=self.pk).update(**{
+            'last_message_id': Greatest(Coalesce(F('last_message_id'), Value(0)), Value(message.id)),
+            'updated_at': Greatest(F('updated_at'), Value(message.timestamp)),
+            'last_seq': Greatest(F('last_seq'), Value(message.seq)),
+            field: Greatest(F(field), Value(message.id)),
+            read_at_field: Greatest(Coalesce(F(read_at_field), Value(message.timestamp)), Value(message.timestamp)),
+        })
+        # Mirror the UPDATE so unread counts taken from this instance include the message
+        self.last_message_id = max(self.last_message_id or 0, message.id)
+        self.updated_at = max(self.updated_at, message.timestamp)
+        self.last_seq = max(self.last_seq, message.seq)
+        setattr(self, field, max(getattr(self, field), message.id))
+        setattr(self, read_at_field, max(getattr(self, read_at_field) or message.timestamp, message.timestamp))
+
+    def live_messages(self):
+        """Messages still in the partitioned table, bounded so older partitions are pruned"""
+        return Message.objects.filter(conversation=self, timestamp__gte=self.started_at - MESSAGE_CLOCK_SKEW)
+
+    def messages_after(self, seq):
+        """Live messages with a sequence number past seq, in order"""
+        return self.live_messages().filter(seq__gt=seq).order_by('seq')
+
+    def __str__(self):
+        return f"{self.user_low_id} <-> {self.user_high_id}"
+
+
+# Ids and timestamps come from different clocks; time bounds allow this much disorder
+MESSAGE_CLOCK_SKEW = timedelta(minutes=1)
+
+
 class MessageManager(models.Manager):
     def get_user_conversations(self, user):
-        # Get the latest message for each conversation and count of unseen messages
-        latest_messages = self.filter(
-            Q(sender=user) | Q(recipient=user)
-        ).values(
-            'sender', 'recipient'
-        ).annotate(
-            latest_timestamp=Max('timestamp'),
-            unseen_count=Count('id', filter=Q(viewed=False))
-        ).order_by('-latest_timestamp')
-        
-        processed_users = set()
-        messages = []
+        """Latest message of each of the user's conversations with its unseen count"""
+        watermark = Case(
+            When(user_low=user, then=F('user_low_last_read')),
+            default=F('user_high_last_read'),
+        )
+        read_at = Case(
+            When(user_low=user, then=F('user_low_read_at')),
+            default=F('user_high_read_at'),
+        )
+        # Unread rows are newer than the last read one, so only recent partitions are searched
+        unread_from = ExpressionWrapper(
+            Coalesce(read_at, F('started_at')) - Value(MESSAGE_CLOCK_SKEW),
+            output_field=DateTimeField(),
+        )
+        # Only rows past the watermark are read, through the (conversation, id) index
+        unseen = (
+            self.filter(conversation=OuterRef('pk'), id__gt=OuterRef('watermark'),
+                        timestamp__gte=OuterRef('unread_from'))
+            .exclude(sender=user)
+            .order_by()
+            .values('conversation')
+            .annotate(unseen=Count('id'))
+            .values('unseen')
+        )
+        conversations = (
+            Conversation.objects.filter(Q(user_low=user) | Q(user_high=user), last_message__isnull=False)
+            .annotate(watermark=watermark, unread_from=unread_from)
+            .annotate(unseen_count=Coalesce(Subquery(unseen), 0))
+            .select_related('last_message__sender', 'last_message__recipient')
+            .order_by('-updated_at')
+        )
 
-        for message in latest_messages:
-            sender = message['sender']
-            recipient = message['recipient']
+        conversations = list(conversations)
+        # Dormant conversations may have their last message in the archive
+        archived_last = MessageArchive.objects.last_messages(
+            [conversation for conversation in conversations if conversation.last_message is None]
+        )
 
-   
-            other_user = recipient if sender == user.id else sender
+        messages = []
+        for conversation in conversations:
+            msg = conversation.last_message or archived_last.get(conversation.pk)
+            if msg is None:
+                continue
+            msg.conversation = conversation
+            msg.unseen_count = conversation.unseen_count
+            messages.append(msg)
+        return messages
 
-            if other_user not in processed_users:
-                processed_users.add(other_user)
-                msg = self.get(
-                    Q(sender=sender, recipient=recipient, timestamp=message['latest_timestamp']) |
-                    Q(sender=recipient, recipient=sender, timestamp=message['latest_timestamp'])
-                )
-                msg.unseen_count = message['unseen_count']
-                messages.append(msg)
 
-        return messages
-        
 class Message(models.Model):
     sender = models.ForeignKey(User, related_name='sent_messages',db_index=True, on_delete=models.CASCADE)
     recipient = models.ForeignKey(User, related_name='received_messages',db_index=True, on_delete=models.CASCADE)
+    conversation = models.ForeignKey(Conversation, related_name='messages', null=True, on_delete=models.CASCADE)
+    # Position in the conversation, gap-free and increasing; clients resume from it
+    seq = models.PositiveBigIntegerField(default=0)
     content = models.TextField()
+    # Large bodies are stored here compressed and content is left empty; read body
+    content_z = models.BinaryField(null=True, blank=True)
     timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
-    viewed = models.BooleanField(default=False)
     objects = MessageManager()
+
+    class Meta:
+        indexes = [
+            # Room history and unread counts past a watermark
+            models.Index(fields=['conversation', 'id'], name='message_conversation_idx'),
+            # Resuming a conversation after a sequence number
+            models.Index(fields=['conversation', 'seq'], name='message_conversation_seq_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+
+        self.compress_content()
+
+        if self.conversation_id is None:
+            self.conversation = Conversation.objects.for_pair(self.sender_id, self.recipient_id)
+        with transaction.atomic():
+            # The row lock orders concurrent sends, so sequence numbers have no gaps
+            self.conversation = Conversation.objects.select_for_update().get(pk=self.conversation_id)
+            self.seq = self.conversation.last_seq + 1
+            super().save(*args, **kwargs)
+            self.conversation.record_message(self)
+
+    def compress_content(self):
+        """Move a large body into content_z when compression actually shrinks it"""
+        raw = self.content.encode('utf8')
+        if len(raw) < settings.CHAT_COMPRESS_MIN_BYTES:
+            return
+        compressed = zlib.compress(raw, 6)
+        if len(compressed) < len(raw):
+            self.content_z = compressed
+            self.content = ''
+
+    @property
+    def body(self):
+        """Message text, whether it is stored plain or compressed"""
+        if self.content_z:
+            return zlib.decompress(bytes(self.content_z)).decode('utf8')
+        return self.content
+
+    @property
+    def viewed(self):
+        """Whether the recipient's read watermark has reached this message"""
+        if self.conversation_id is None:
+            return False
+        return self.conversation.last_read_id(self.recipient_id) >= self.id
+
     @property
     def sender_username(self):
         return self.sender.username
@@ -188,5 +485,74 @@ class Message(models.Model):
         return self.recipient.username
 
     def __str__(self):
-        return f"{self.sender.username} to {self.recipient.username}: {self.content[:50]}"
-    
\ No newline at end of file
+        return f"{self.sender.username} to {self.recipient.username}: {self.body[:50]}"
+    
+
+
+class MessageArchiveManager(models.Manager):
+    def history(self, conversation):
+        """Archived messages of a conversation in MessageSerializer form, oldest first"""
+        usernames = {
+            conversation.user_low_id: conversation.user_low.username,
+            conversation.user_high_id: conversation.user_high.username,
+        }
+        messages = []
+        for archive in self.filter(conversation=conversation).order_by('month'):
+            messages.extend(
+                {
+                    'id': message_id,
+                    'seq': seq[0] if seq else None,
+                    'content': content,
+                    'timestamp': timestamp,
+                    'sender_username': usernames.get(sender_id),
+                    'recipient_username': usernames.get(recipient_id),
+                }
+                for message_id, sender_id, recipient_id, content, timestamp, *seq in archive.rows()
+            )
+        return messages
+
+    def last_messages(self, conversations):
+        """Unsaved Message instances for the last archived message of each conversation"""
+        if not conversations:
+            return {}
+        by_id = {conversation.pk: conversation for conversation in conversations}
+        newest_month = (
+            self.filter(conversation=OuterRef('conversation'))
+            .order_by('-month')
+            .values('month')[:1]
+        )
+        latest = {}
+        for archive in self.filter(conversation_id__in=by_id, month=Subquery(newest_month)):
+            message_id, sender_id, recipient_id, content, timestamp, *seq = archive.rows()[-1]
+            latest[archive.conversation_id] = Message(
+                id=message_id, sender_id=sender_id, recipient_id=recipient_id, content=content,
+                timestamp=timestamp, seq=seq[0] if seq else 0, conversation=by_id[archive.conversation_id],
+            )
+        return latest
+
+
+class MessageArchive(models.Model):
+    """One month of a conversation's messages, moved out of a cold partition and compressed"""
+    conversation = models.ForeignKey(Conversation, related_name='archives', on_delete=models.CASCADE)
+    month = models.DateField()
+    first_id = models.PositiveBigIntegerField()
+    last_id = models.PositiveBigIntegerField()
+    message_count = models.PositiveIntegerField()
+    # zlib-compressed JSON list of [id, sender_id, recipient_id, content, timestamp, seq]
+    payload = models.BinaryField()
+    objects = MessageArchiveManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'month'], name='unique_message_archive'),
+        ]
+
+    @staticmethod
+    def pack(rows):
+        return zlib.compress(json.dumps(rows, separators=(',', ':')).encode(), 9)
+
+    def rows(self):
+        return json.loads(zlib.decompress(bytes(self.payload)))
+
+    def __str__(self):
+        return f"{self.conversation_id} {self.month:%Y-%m} ({self.message_count} messages)"
@@ -0,0 +1,303 @@
+"""
+Item recommendations for Shopiet listings
+Similar items: items are embedded as TF-IDF vectors over item_name +
+item_description and compared by cosine similarity within the same category
+and a neighbouring price band; the top-K neighbours are stored in SimilarItem.
+Co-saves: an item x item co-occurrence matrix built from SavedItem is stored
+in CoSavedItem with full counts and kept current as items are saved; the
+count threshold and top-K cap are applied when reading. Both tables are read
+with one indexed query.
+"""
+
+import logging
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Iterable, Iterator, List, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Min
+from scipy import sparse
+
+from backend.cache_batch import cache_batch
+from shopiet.models import CoSavedItem, Item, SavedItem, SimilarItem
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+STOP_WORDS = frozenset({
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is', 'it',
+    'of', 'on', 'or', 'the', 'this', 'to', 'with', 'very', 'good', 'condition',
+})
+
+# Price bands are powers of two; neighbours may differ by this many bands
+PRICE_BAND_TOLERANCE = 1
+# Pairs below this cosine similarity are not stored
+MIN_SIMILARITY = 0.05
+# Rows of the similarity product computed at a time
+CHUNK_SIZE = 512
+
+
+def similar_items_cache_key(slug: str) -> str:
+    return f'similar_items_{slug}'
+
+
+def invalidate_similar_items(slugs: Iterable[str]):
+    """Drop the cached similar-items lists of these items"""
+    with cache_batch() as batch:
+        batch.delete_many(similar_items_cache_key(slug) for slug in slugs)
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_RE.findall(text.lower())
+            if len(token) > 1 and token not in STOP_WORDS]
+
+
+def price_band(price) -> int:
+    return int(math.floor(math.log2(max(float(price), 1.0))))
+
+
+def tfidf_matrix(documents: Sequence[List[str]]) -> sparse.csr_matrix:
+    """L2-normalised TF-IDF rows (sublinear tf, smoothed idf) for tokenised documents"""
+    vocabulary = {}
+    rows, cols, values = [], [], []
+    for row, tokens in enumerate(documents):
+        for token, count in Counter(tokens).items():
+            rows.append(row)
+            cols.append(vocabulary.setdefault(token, len(vocabulary)))
+            values.append(1.0 + math.log(count))
+
+    n_docs = len(documents)
+    tf = sparse.csr_matrix(
+        (np.asarray(values, dtype=np.float32), (rows, cols)),
+        shape=(n_docs, max(len(vocabulary), 1)),
+    )
+    df = np.bincount(tf.indices, minlength=tf.shape[1])
+    idf = (np.log((1.0 + n_docs) / (1.0 + df)) + 1.0).astype(np.float32)
+    weighted = tf @ sparse.diags(idf)
+
+    norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return (sparse.diags((1.0 / norms).astype(np.float32)) @ weighted).tocsr()
+
+
+def _document(item_name: str, item_description: str) -> List[str]:
+    return tokenize(f"{item_name} {item_description}")
+
+
+def _top_k(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Indices of the top_k scores above MIN_SIMILARITY, best first"""
+    candidates = np.flatnonzero(scores > MIN_SIMILARITY)
+    if candidates.size > top_k:
+        candidates = candidates[np.argpartition(scores[candidates], -top_k)[-top_k:]]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+def _neighbours(matrix: sparse.csr_matrix, bands: np.ndarray,
+                top_k: int) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+    """Yield (row, neighbour rows, scores) for every row of a category"""
+    for start in range(0, matrix.shape[0], CHUNK_SIZE):
+        similarities = (matrix[start:start + CHUNK_SIZE] @ matrix.T).toarray()
+        for offset, scores in enumerate(similarities):
+            row = start + offset
+            scores[row] = 0.0
+            scores[np.abs(bands - bands[row]) > PRICE_BAND_TOLERANCE] = 0.0
+            best = _top_k(scores, top_k)
+            yield row, best, scores[best]
+
+
+def build_similar_items(top_k: int = None) -> int:
+    """Rebuild the whole SimilarItem table, returning the number of rows stored"""
+    top_k = top_k or settings.SIMILAR_ITEMS_TOP_K
+    items = list(Item.objects.values_list(
+        'id', 'item_name', 'item_description', 'item_price', 'item_category_name', 'slug'))
+    if not items:
+        return 0
+
+    # IDF is computed over the whole catalogue, neighbours within each category
+    matrix = tfidf_matrix([_document(name, description) for _, name, description, _, _, _ in items])
+    ids = np.asarray([row[0] for row in items])
+    bands = np.asarray([price_band(row[3]) for row in items])
+
+    by_category = defaultdict(list)
+    for index, row in enumerate(items):
+        by_category[row[4]].append(index)
+
+    rows = []
+    for indices in by_category.values():
+        indices = np.asarray(indices)
+        for row, neighbours, scores in _neighbours(matrix[indices], bands[indices], top_k):
+            item_id = ids[indices[row]]
+            rows.extend(
+                SimilarItem(item_id=item_id, similar_id=ids[indices[neighbour]], score=float(score))
+                for neighbour, score in zip(neighbours, scores)
+            )
+
+    with transaction.atomic():
+        SimilarItem.objects.all().delete()
+        SimilarItem.objects.bulk_create(rows, batch_size=1000)
+    invalidate_similar_items(row[5] for row in items)
+
+    logger.info(f"Stored {len(rows)} similar item pairs for {len(items)} items")
+    return len(rows)
+
+
+def refresh_similar_items(item: Item, top_k: int = None) -> int:
+    """Compute neighbours for one new or edited item and link it into its peers' lists
+
+    IDF is taken over the item's category and price band only, which is close
+    enough between full rebuilds.
+    """
+    top_k = top_k or settings.SIMILAR_ITEMS_TOP_K
+    band = price_band(item.item_price)
+    peers = [
+        row for row in Item.objects.filter(item_category_name=item.item_category_name)
+        .exclude(pk=item.pk)
+        .values_list('id', 'item_name', 'item_description', 'item_price', 'slug')
+        if abs(price_band(row[3]) - band) <= PRICE_BAND_TOLERANCE
+    ]
+    # Lists that showed the item before, cached with its old neighbours or text
+    affected = {item.slug, *SimilarItem.objects.filter(similar=item).values_list('item__slug', flat=True)}
+    if not peers:
+        with transaction.atomic():
+            SimilarItem.objects.filter(item=item).delete()
+            SimilarItem.objects.filter(similar=item).delete()
+        invalidate_similar_items(affected)
+        return 0
+
+    matrix = tfidf_matrix(
+        [_document(item.item_name, item.item_description)]
+        + [_document(name, description) for _, name, description, _, _ in peers]
+    )
+    scores = (matrix[0] @ matrix[1:].T).toarray().ravel()
+    peer_ids = [row[0] for row in peers]
+    peer_slugs = {row[0]: row[4] for row in peers}
+
+    forward = [
+        SimilarItem(item=item, similar_id=peer_ids[index], score=float(scores[index]))
+        for index in _top_k(scores, top_k)
+    ]
+
+    # Link back only into peers whose lists have room or a weaker last entry
+    candidates = {peer_ids[index]: float(scores[index]) for index in np.flatnonzero(scores > MIN_SIMILARITY)}
+    current = {
+        row['item_id']: (row['entries'], row['lowest'])
+        for row in SimilarItem.objects.filter(item_id__in=candidates)
+        .exclude(similar=item)
+        .values('item_id')
+        .annotate(entries=Count('id'), lowest=Min('score'))
+    }
+    reverse, full = [], []
+    for peer_id, score in candidates.items():
+        entries, lowest = current.get(peer_id, (0, 0.0))
+        if entries < top_k:
+            reverse.append(SimilarItem(item_id=peer_id, similar=item, score=score))
+        elif score > lowest:
+            reverse.append(SimilarItem(item_id=peer_id, similar=item, score=score))
+            full.append((peer_id, lowest))
+
+    with transaction.atomic():
+        SimilarItem.objects.filter(item=item).delete()
+        SimilarItem.objects.filter(similar=item).delete()
+        SimilarItem.objects.bulk_create(forward + reverse)
+        # Peers that were already full drop their weakest entry
+        for peer_id, lowest in full:
+            weakest = (SimilarItem.objects.filter(item_id=peer_id, score=lowest)
+                       .exclude(similar=item).values_list('id', flat=True)[:1])
+            SimilarItem.objects.filter(id__in=list(weakest)).delete()
+    invalidate_similar_items(affected | {peer_slugs[row.item_id] for row in reverse})
+
+    return len(forward)
+
+
+def build_co_saved_items() -> int:
+    """Rebuild CoSavedItem from the user x item save matrix, returning rows stored
+
+    Every pair keeps its full count, so record_co_save can keep incrementing it;
+    reads apply COSAVE_MIN_COUNT and COSAVE_TOP_K. The table is therefore no
+    longer capped at COSAVE_TOP_K rows per item and grows with the number of
+    distinct co-saved pairs, which (item_id, count) keeps cheap to read.
+    """
+    saves = list(SavedItem.objects.values_list('user_id', 'item_id'))
+    if not saves:
+        with transaction.atomic():
+            CoSavedItem.objects.all().delete()
+        return 0
+
+    user_ids = {user_id: index for index, user_id in enumerate({user for user, _ in saves})}
+    item_ids = sorted({item for _, item in saves})
+    item_index = {item_id: index for index, item_id in enumerate(item_ids)}
+
+    saved = sparse.csr_matrix(
+        (np.ones(len(saves), dtype=np.int32),
+         ([user_ids[user] for user, _ in saves], [item_index[item] for _, item in saves])),
+        shape=(len(user_ids), len(item_ids)),
+    )
+    # Repeated saves of the same item by one user count once
+    saved.sum_duplicates()
+    saved.data[:] = 1
+
+    co_counts = (saved.T @ saved).tocoo()
+    off_diagonal = co_counts.row != co_counts.col
+    rows = [
+        CoSavedItem(item_id=item_ids[row], other_id=item_ids[column], count=int(count))
+        for row, column, count in zip(co_counts.row[off_diagonal], co_counts.col[off_diagonal],
+                                      co_counts.data[off_diagonal])
+    ]
+
+    with transaction.atomic():
+        CoSavedItem.objects.all().delete()
+        CoSavedItem.objects.bulk_create(rows, batch_size=1000)
+
+    logger.info(f"Stored {len(rows)} co-saved pairs for {len(item_ids)} items")
+    return len(rows)
+
+
+def record_co_save(user_id: int, item_id: int):
+    """Count a new save against every other item the user has saved
+
+    Pairs are stored in both directions. Each pair is incremented by a single
+    upsert, so concurrent saves of the same pair all count.
+    """
+    other_ids = list(
+        SavedItem.objects.filter(user_id=user_id)
+        .exclude(item_id=item_id)
+        .values_list('item_id', flat=True)
+        .distinct()
+    )
+    if not other_ids:
+        return
+
+    # Rows are locked in one order so concurrent upserts cannot deadlock
+    pairs = sorted([(item_id, other_id) for other_id in other_ids]
+                   + [(other_id, item_id) for other_id in other_ids])
+
+    if connection.vendor != 'postgresql':
+        with transaction.atomic():
+            for left, right in pairs:
+                pair, created = CoSavedItem.objects.get_or_create(item_id=left, other_id=right)
+                if not created:
+                    CoSavedItem.objects.filter(pk=pair.pk).update(count=F('count') + 1)
+        return
+
+    values = ', '.join(['(%s, %s, 1)'] * len(pairs))
+    params = [value for pair in pairs for value in pair]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {CoSavedItem._meta.db_table} AS pair (item_id, other_id, count) "
+            f"VALUES {values} "
+            f"ON CONFLICT (item_id, other_id) DO UPDATE SET count = pair.count + 1",
+            params,
+        )
+
+
+def co_saved_items(item_id: int):
+    """Items most often saved together with item_id, one indexed query"""
+    return (
+        CoSavedItem.objects.filter(item_id=item_id, count__gte=settings.COSAVE_MIN_COUNT)
+        .select_related('other')
+        .prefetch_related('other__images')
+        .order_by('-count')[:settings.COSAVE_TOP_K]
+    )
@@ -1,3 +1,1414 @@
-from django.test import TestCase
+import asyncio
+import base64
+import io
+import json
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+import boto3
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.utils import OperationalError as DatabaseOperationalError
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import include, path
+from django.utils import timezone
+from django_redis import get_redis_connection
+from django.utils.functional import empty
+from moto import mock_aws
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from storages.backends.s3 import S3Storage
+
+from api import async_views, cache_warming
+from api.serialisers import ChatSerializer, MessageSerializer
+from backend import chat_sync, db_router, presence, routing
+from backend.media import serve_media
+from backend.cache_batch import CacheBatch
+from backend.db_pool import base as db_pool
+from backend.db_pool.pool import ConnectionPool
+from backend.ws_auth import JWTAuthMiddlewareStack
+from backend.single_flight import SingleFlight
+from shopiet import direct_uploads, message_partitions, recommendations, trending, view_counts
+from shopiet.image_processing import PLACEHOLDER_SIZE
+from shopiet.models import CoSavedItem, Conversation, ImageBlob, Images, Item, Message, MessageArchive, SavedItem
+
+
+class CacheBatchTimeoutTests(TestCase):
+    def setUp(self):
+        self.redis = cache.client.get_client(write=True)
+        self.addCleanup(cache.delete_many, ['batch_default', 'batch_short', 'batch_zero', 'batch_forever'])
+
+    def test_timeouts_are_seconds(self):
+        cache.set('batch_zero', 'old')
+        batch = CacheBatch()
+        batch.set('batch_default', 1)
+        batch.set('batch_short', 1, timeout=30)
+        batch.set('batch_zero', 1, timeout=0)
+        batch.set('batch_forever', 1, timeout=None)
+        batch.flush()
+
+        self.assertLessEqual(self.redis.ttl(cache.make_key('batch_default')), cache.default_timeout)
+        self.assertGreater(self.redis.ttl(cache.make_key('batch_default')), 0)
+        self.assertLessEqual(self.redis.ttl(cache.make_key('batch_short')), 30)
+        self.assertIsNone(cache.get('batch_zero'))
+        self.assertEqual(self.redis.ttl(cache.make_key('batch_forever')), -1)
+
+
+class ImageBlobGarbageCollectionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='seller')
+        self.old = timezone.now() - timedelta(days=1)
+
+    def blob(self, name, ref_count, touched_at):
+        blob = ImageBlob.objects.create(sha256=name[-64:], name=name, ref_count=ref_count)
+        ImageBlob.objects.filter(pk=blob.pk).update(touched_at=touched_at)
+        return blob
+
+    def test_deletes_orphans_and_corrects_counts(self):
+        orphan = self.blob('item_thumbnails/aa/' + 'a' * 64 + '.jpg', 1, self.old)
+        shared = self.blob('item_thumbnails/bb/' + 'b' * 64 + '.jpg', 5, self.old)
+        Item.objects.bulk_create([
+            Item(item_name=f'Lamp {n}', item_price=10, user=self.user, item_thumbnail=shared.name,
+                 item_description='Lamp', slug=f'lamp-{n}')
+            for n in range(2)
+        ])
+
+        call_command('gc_image_blobs', stdout=io.StringIO())
+
+        self.assertFalse(ImageBlob.objects.filter(pk=orphan.pk).exists())
+        self.assertEqual(ImageBlob.objects.get(pk=shared.pk).ref_count, 2)
+
+    def test_leaves_recently_acquired_blobs(self):
+        # An upload that just acquired the blob has not inserted its row yet
+        in_flight = self.blob('item_thumbnails/cc/' + 'c' * 64 + '.jpg', 1, timezone.now())
+
+        call_command('gc_image_blobs', stdout=io.StringIO())
+
+        self.assertEqual(ImageBlob.objects.get(pk=in_flight.pk).ref_count, 1)
+
+    def test_acquire_marks_blob_touched(self):
+        blob = self.blob('item_thumbnails/dd/' + 'd' * 64 + '.jpg', 1, self.old)
+
+        self.assertEqual(ImageBlob.objects.acquire(blob.sha256), (blob.name, ''))
+
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertGreater(blob.touched_at, self.old)
+
+
+TEST_BUCKET = 'shopiet-test-media'
+S3_OPTIONS = {
+    'bucket_name': TEST_BUCKET,
+    'access_key': 'testing',
+    'secret_key': 'testing',
+    'region_name': 'us-east-1',
+    'querystring_auth': False,
+    'file_overwrite': False,
+}
+
+
+def png_bytes(color=(141, 197, 114)):
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+@override_settings(AWS_S3_ENDPOINT_URL=None, AWS_S3_PUBLIC_ENDPOINT_URL=None)
+class DirectUploadTests(TransactionTestCase):
+    """Presign and finalize against an in-process S3 (moto) bucket
+
+    A TransactionTestCase, since store_images writes ImageBlob rows from
+    worker threads on their own connections.
+    """
+
+    def setUp(self):
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        direct_uploads._presign_client.cache_clear()
+        self.addCleanup(direct_uploads._presign_client.cache_clear)
+
+        self.s3 = boto3.client('s3', region_name='us-east-1', aws_access_key_id='testing',
+                               aws_secret_access_key='testing')
+        self.s3.create_bucket(Bucket=TEST_BUCKET)
+
+        # Swapped in directly: overriding STORAGES on Django 5.0 drops the OPTIONS
+        default_storage._wrapped = S3Storage(**S3_OPTIONS)
+        self.addCleanup(setattr, default_storage, '_wrapped', empty)
+
+        self.user = User.objects.create(username='seller')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def presign(self, username='seller', content_type='image/png'):
+        return self.client.post('/api/upload/presign/', {
+            'item_username': username, 'filename': 'lamp.png', 'content_type': content_type,
+        }, format='json')
+
+    def upload(self, key, body):
+        """What the browser's POST with the presigned form leaves in the bucket"""
+        self.s3.put_object(Bucket=TEST_BUCKET, Key=key, Body=body, ContentType='image/png')
+
+    def finalize(self, thumbnail_key, image_keys=()):
+        return self.client.post('/api/upload/finalize/', {
+            'item_username': 'seller',
+            'item_name': 'Lamp',
+            'item_price': '120',
+            'item_description': 'Desk lamp',
+            'thumbnail_key': thumbnail_key,
+            'image_keys': list(image_keys),
+        }, format='json')
+
+    def test_presign_pins_key_type_and_size(self):
+        response = self.presign()
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['key'].startswith('uploads-staging/seller/'))
+        self.assertTrue(data['key'].endswith('.png'))
+        self.assertEqual(data['fields']['key'], data['key'])
+        self.assertEqual(data['fields']['Content-Type'], 'image/png')
+        self.assertIn('policy', data['fields'])
+        self.assertIn(TEST_BUCKET, data['url'])
+
+    def test_presign_rejects_non_images(self):
+        self.assertEqual(self.presign(content_type='text/html').status_code, 400)
+
+    def test_finalize_processes_staged_images(self):
+        thumbnail_key = self.presign().json()['key']
+        image_key = self.presign().json()['key']
+        self.upload(thumbnail_key, png_bytes())
+        self.upload(image_key, png_bytes((20, 40, 60)))
+
+        response = self.finalize(thumbnail_key, [image_key])
+
+        self.assertEqual(response.status_code, 201, response.content)
+        item = Item.objects.get(slug=response.json()['slug'])
+        self.assertTrue(item.item_thumbnail.name.startswith('item_thumbnails/'))
+        self.assertTrue(item.item_thumbnail_placeholder.startswith('data:image/jpeg;base64,'))
+        self.assertTrue(default_storage.exists(item.item_thumbnail.name))
+        self.assertEqual(Images.objects.filter(item=item).count(), 1)
+        self.assertEqual(ImageBlob.objects.count(), 2)
+        # Staging copies are removed once processed
+        self.assertFalse(default_storage.exists(thumbnail_key))
+        self.assertFalse(default_storage.exists(image_key))
+
+    def test_finalize_deduplicates_repeated_photos(self):
+        keys = [self.presign().json()['key'] for _ in range(2)]
+        for key in keys:
+            self.upload(key, png_bytes())
+
+        self.assertEqual(self.finalize(keys[0]).status_code, 201)
+        self.assertEqual(self.finalize(keys[1]).status_code, 201)
+
+        self.assertEqual(ImageBlob.objects.get().ref_count, 2)
+        self.assertEqual(len(set(Item.objects.values_list('item_thumbnail', flat=True))), 1)
+
+    def test_finalize_rejects_keys_outside_the_users_prefix(self):
+        other = User.objects.create(username='other')
+        other_key = direct_uploads.presign_upload(other.username, 'lamp.png', 'image/png')['key']
+        self.upload(other_key, png_bytes())
+
+        for key in (other_key, 'item_thumbnails/ab/' + 'a' * 64 + '.png',
+                    'uploads-staging/seller/../other/x.png', None):
+            with self.subTest(key=key):
+                self.assertEqual(self.finalize(key).status_code, 400)
+        self.assertFalse(Item.objects.exists())
+        self.assertTrue(default_storage.exists(other_key))
+
+    def test_uploads_for_another_user_are_forbidden(self):
+        other = User.objects.create(username='other')
+        other_key = direct_uploads.presign_upload(other.username, 'lamp.png', 'image/png')['key']
+        self.upload(other_key, png_bytes())
+
+        self.assertEqual(self.presign(username='other').status_code, 403)
+        response = self.client.post('/api/upload/finalize/', {
+            'item_username': 'other', 'item_name': 'Lamp', 'item_price': '120',
+            'item_description': 'Desk lamp', 'thumbnail_key': other_key, 'image_keys': [],
+        }, format='json')
+
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Item.objects.exists())
+        self.assertTrue(default_storage.exists(other_key))
+
+    def test_staging_prefix_comes_from_the_authenticated_user(self):
+        response = self.client.post('/api/upload/presign/', {
+            'filename': 'lamp.png', 'content_type': 'image/png',
+        }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['key'].startswith('uploads-staging/seller/'))
+
+    def test_finalize_rejects_uploads_that_never_arrived(self):
+        key = self.presign().json()['key']
+
+        response = self.finalize(key)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Item.objects.exists())
+
+
+
+class AddItemTests(TransactionTestCase):
+    """Multipart uploads to addItem, stored in a temporary MEDIA_ROOT
+
+    A TransactionTestCase for the same reason as DirectUploadTests.
+    """
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create(username='seller')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, name, body):
+        return SimpleUploadedFile(name, body, content_type='image/png')
+
+    def test_stores_the_thumbnail_and_images(self):
+        response = self.client.post('/api/upload/', {
+            'item_username': 'seller',
+            'item_name': 'Lamp',
+            'item_price': '120',
+            'item_description': 'Desk lamp',
+            'item_thumbnail': self.upload('front.png', png_bytes()),
+            # The first photo repeats the thumbnail and shares its blob
+            'additional_images': [self.upload('front-again.png', png_bytes()),
+                                  self.upload('side.png', png_bytes((20, 40, 60)))],
+        }, format='multipart')
+
+        self.assertEqual(response.status_code, 201, response.content)
+        item = Item.objects.get(slug=response.json()['slug'])
+        self.assertEqual(item.item_username, 'seller')
+        self.assertTrue(default_storage.exists(item.item_thumbnail.name))
+
+        images = list(Images.objects.filter(item=item).order_by('id'))
+        self.assertEqual(len(images), 2)
+        self.assertEqual(images[0].image.name, item.item_thumbnail.name)
+        self.assertNotEqual(images[1].image.name, item.item_thumbnail.name)
+        self.assertTrue(default_storage.exists(images[1].image.name))
+
+        self.assertEqual(ImageBlob.objects.count(), 2)
+        self.assertEqual(ImageBlob.objects.get(name=item.item_thumbnail.name).ref_count, 2)
+        self.assertTrue(item.item_thumbnail_placeholder.startswith('data:image/jpeg;base64,'))
+        self.assertTrue(all(image.image_placeholder.startswith('data:image/jpeg;base64,') for image in images))
+
+    def test_unknown_users_are_rejected(self):
+        response = self.client.post('/api/upload/', {
+            'item_username': 'nobody',
+            'item_thumbnail': self.upload('front.png', png_bytes()),
+        }, format='multipart')
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Item.objects.exists())
+
+
+class ImagePlaceholderTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def assertPlaceholder(self, value):
+        prefix = 'data:image/jpeg;base64,'
+        self.assertTrue(value.startswith(prefix), value[:40])
+        with Image.open(io.BytesIO(base64.b64decode(value[len(prefix):]))) as preview:
+            self.assertEqual(preview.format, 'JPEG')
+            self.assertLessEqual(max(preview.size), PLACEHOLDER_SIZE)
+
+    def test_new_images_get_placeholders(self):
+        item = Item.objects.create(item_name='Lamp', item_price=10, item_description='Lamp',
+                                   item_thumbnail=SimpleUploadedFile('lamp.png', png_bytes()))
+        image = Images.objects.create(item=item, image=SimpleUploadedFile('side.png', png_bytes((20, 40, 60))))
+
+        self.assertPlaceholder(Item.objects.get(pk=item.pk).item_thumbnail_placeholder)
+        self.assertPlaceholder(Images.objects.get(pk=image.pk).image_placeholder)
+
+    def test_backfill_fills_only_empty_placeholders(self):
+        names = [default_storage.save(f'item_thumbnails/lamp-{n}.png', ContentFile(png_bytes())) for n in range(2)]
+        kept = 'data:image/jpeg;base64,a2VwdA=='
+        empty, filled = Item.objects.bulk_create([
+            Item(item_name='Lamp', item_price=10, item_description='Lamp', slug='lamp',
+                 item_thumbnail=names[0], item_thumbnail_placeholder=''),
+            Item(item_name='Desk', item_price=10, item_description='Desk', slug='desk',
+                 item_thumbnail=names[1], item_thumbnail_placeholder=kept),
+        ])
+        image = Images.objects.create(item=empty, image=names[1], image_placeholder='')
+
+        call_command('backfill_image_placeholders', stdout=io.StringIO())
+
+        self.assertPlaceholder(Item.objects.get(pk=empty.pk).item_thumbnail_placeholder)
+        self.assertEqual(Item.objects.get(pk=filled.pk).item_thumbnail_placeholder, kept)
+        self.assertPlaceholder(Images.objects.get(pk=image.pk).image_placeholder)
+
+class LocalStorageDirectUploadTests(TestCase):
+    def test_endpoints_answer_501(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='seller'))
+
+        self.assertEqual(client.post('/api/upload/presign/', {}, format='json').status_code, 501)
+        self.assertEqual(client.post('/api/upload/finalize/', {}, format='json').status_code, 501)
+
+
+class ConversationUnreadTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='x')
+        self.bob = User.objects.create_user('bob', password='x')
+
+    def test_sent_message_counts_as_unread_on_the_same_instance(self):
+        Message.objects.create(sender=self.alice, recipient=self.bob, content='one')
+        message = Message.objects.create(sender=self.alice, recipient=self.bob, content='two')
+
+        conversation = message.conversation
+        self.assertEqual(conversation.last_message_id, message.id)
+        self.assertEqual(conversation.unread_count(self.bob.id), 2)
+        self.assertEqual(conversation.unread_count(self.alice.id), 0)
+
+        reply = Message.objects.create(sender=self.bob, recipient=self.alice, content='three')
+        self.assertEqual(reply.conversation.unread_count(self.bob.id), 0)
+        self.assertEqual(reply.conversation.unread_count(self.alice.id), 1)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class GetMessagesTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='x')
+        self.bob = User.objects.create_user('bob', password='x')
+        self.messages = [
+            Message.objects.create(sender=self.alice, recipient=self.bob, content=f'hello {n}')
+            for n in range(3)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.bob)
+        cache.delete('messages_alice_bob')
+        self.addCleanup(cache.delete, 'messages_alice_bob')
+
+    def test_fetching_messages_moves_the_readers_watermark(self):
+        conversation = Conversation.objects.get()
+        self.assertEqual(conversation.unread_count(self.bob.id), 3)
+
+        response = self.client.get('/api/chat/alice_bob/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([message['content'] for message in response.data], ['hello 0', 'hello 1', 'hello 2'])
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.last_read_id(self.bob.id), self.messages[-1].id)
+        self.assertEqual(conversation.unread_count(self.bob.id), 0)
+        # The sender's own watermark is untouched
+        self.assertEqual(conversation.unread_count(self.alice.id), 0)
+
+    def test_after_seq_pages_only_newer_messages(self):
+        response = self.client.get('/api/chat/alice_bob/', {'after_seq': 1})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([message['seq'] for message in response.data], [2, 3])
+        self.assertEqual([message['content'] for message in response.data], ['hello 1', 'hello 2'])
+
+        response = self.client.get('/api/chat/alice_bob/', {'after_seq': 3})
+        self.assertEqual(response.data, [])
+
+    def test_after_seq_must_be_an_integer(self):
+        response = self.client.get('/api/chat/alice_bob/', {'after_seq': 'latest'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ChatConsumerIdentityTests(TransactionTestCase):
+    """Acks are recorded for the socket's authenticated user, never a claimed one
+
+    A TransactionTestCase, since the consumer reads on its own connection.
+    """
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='x')
+        self.bob = User.objects.create_user('bob', password='x')
+        for n in range(2):
+            Message.objects.create(sender=self.alice, recipient=self.bob, content=f'hello {n}')
+        self.conversation = Conversation.objects.get()
+        patcher = mock.patch.object(chat_sync, 'ACKS_KEY', 'test_chat_acks_{}')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(get_redis_connection('default').delete, f'test_chat_acks_{self.conversation.pk}')
+
+    def ack_as(self, user, query=''):
+        async def exchange():
+            communicator = WebsocketCommunicator(URLRouter(routing.websocket_urlpatterns),
+                                                 f'/ws/socket-server/alice_bob/{query}')
+            communicator.scope['user'] = user
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            await communicator.send_json_to({'type': 'ack', 'seq': 2, 'username': 'alice'})
+            # Frames are handled in order, so the resume reply follows the ack
+            await communicator.send_json_to({'type': 'resume', 'last_seq': 2})
+            while (await communicator.receive_json_from(timeout=5))['type'] != 'resume':
+                pass
+            await communicator.disconnect()
+        async_to_sync(exchange)()
+
+    def test_ack_is_recorded_for_the_authenticated_user(self):
+        self.ack_as(self.bob)
+
+        self.assertEqual(chat_sync.acked_seq(self.conversation.pk, 'bob'), 2)
+        self.assertEqual(chat_sync.acked_seq(self.conversation.pk, 'alice'), 0)
+
+    @override_settings(PRESENCE_TTL_SECONDS=1)
+    def test_any_inbound_frame_keeps_the_user_online(self):
+        for name in ('PRESENCE_KEY', 'LAST_SEEN_KEY'):
+            patcher = mock.patch.object(presence, name, f'test_{getattr(presence, name)}')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        redis = get_redis_connection('default')
+        self.addCleanup(redis.delete, presence.PRESENCE_KEY.format('bob'), presence.LAST_SEEN_KEY.format('bob'))
+
+        async def exchange():
+            communicator = WebsocketCommunicator(URLRouter(routing.websocket_urlpatterns),
+                                                 '/ws/socket-server/alice_bob/')
+            communicator.scope['user'] = self.bob
+            await communicator.connect()
+            # Outlive the presence TTL without any heartbeat, then send an ordinary frame
+            await asyncio.sleep(1.2)
+            online_before = presence.room_state('alice_bob', ['bob'])['users']['bob']['online']
+            await communicator.send_json_to({'type': 'ack', 'seq': 1})
+            await communicator.send_json_to({'type': 'resume', 'last_seq': 2})
+            while (await communicator.receive_json_from(timeout=5))['type'] != 'resume':
+                pass
+            online_after = presence.room_state('alice_bob', ['bob'])['users']['bob']['online']
+            await communicator.disconnect()
+            return online_before, online_after
+
+        self.assertEqual(async_to_sync(exchange)(), (False, True))
+
+    def test_claimed_usernames_are_ignored(self):
+        self.ack_as(AnonymousUser(), query='?username=alice')
+
+        self.assertEqual(chat_sync.acked_seq(self.conversation.pk, 'alice'), 0)
+        self.assertEqual(chat_sync.acked_seq(self.conversation.pk, 'bob'), 0)
+
+
+
+
+@override_settings(CHAT_COMPRESS_MIN_BYTES=1024)
+class MessageArchiveTests(TestCase):
+    """Partition a month out of the default partition and archive it (PostgreSQL only)"""
+
+    def setUp(self):
+        if not message_partitions.is_partitioned():
+            self.skipTest("The message table is only partitioned on PostgreSQL")
+        self.alice = User.objects.create_user('alice', password='x')
+        self.bob = User.objects.create_user('bob', password='x')
+
+    def test_archive_round_trip_keeps_compressed_bodies(self):
+        long_text = 'Is the lamp still available? ' * 100
+        texts = ['hello', long_text, 'see you at noon']
+        messages = [Message.objects.create(sender=self.alice, recipient=self.bob, content=text)
+                    for text in texts]
+        self.assertTrue(Message.objects.get(pk=messages[1].pk).content_z)
+        conversation = Conversation.objects.get()
+
+        month = date(2020, 3, 1)
+        Message.objects.update(timestamp=timezone.make_aware(datetime(2020, 3, 15, 12)))
+        with connection.cursor() as cursor:
+            message_partitions.create_partition(cursor, month)
+        partition, = [partition for partition in message_partitions.list_partitions()
+                      if partition.start == month]
+
+        self.assertEqual(message_partitions.archive_partition(partition), 3)
+
+        self.assertFalse(Message.objects.exists())
+        self.assertNotIn(partition.name, {p.name for p in message_partitions.list_partitions()})
+        archive = MessageArchive.objects.get()
+        self.assertEqual((archive.month, archive.message_count), (month, 3))
+        history = MessageArchive.objects.history(conversation)
+        self.assertEqual([message['content'] for message in history], texts)
+        self.assertEqual([message['seq'] for message in history], [1, 2, 3])
+        self.assertEqual({message['sender_username'] for message in history}, {'alice'})
+
+@override_settings(CHAT_COMPRESS_MIN_BYTES=1024)
+class MessageCompressionTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='x')
+        self.bob = User.objects.create_user('bob', password='x')
+
+    def send(self, text):
+        message = Message.objects.create(sender=self.alice, recipient=self.bob, content=text)
+        return Message.objects.get(pk=message.pk)
+
+    def test_short_messages_are_stored_plain(self):
+        message = self.send('see you at noon')
+
+        self.assertEqual(message.content, 'see you at noon')
+        self.assertFalse(message.content_z)
+        self.assertEqual(message.body, 'see you at noon')
+
+    def test_long_messages_round_trip_through_compression(self):
+        text = 'Is the lamp still available? ' * 100
+        message = self.send(text)
+
+        self.assertEqual(message.content, '')
+        self.assertLess(len(bytes(message.content_z)), len(text))
+        self.assertEqual(message.body, text)
+
+    def test_serializers_return_the_body(self):
+        text = 'Is the lamp still available? ' * 100
+        message = self.send(text)
+
+        self.assertEqual(MessageSerializer(message).data['content'], text)
+        self.assertEqual(ChatSerializer(message).data['content'], text)
+        self.assertEqual(chat_sync.chat_frame(message)['message'], text)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+                   CHAT_MAX_FRAME_BYTES=256, CHAT_MAX_MESSAGE_CHARS=10)
+class ChatFrameLimitTests(SimpleTestCase):
+    def exchange(self, text_data):
+        """Send one frame on a fresh chat socket and return what the server answered"""
+        async def run():
+            communicator = WebsocketCommunicator(URLRouter(routing.websocket_urlpatterns),
+                                                 '/ws/socket-server/alice_bob/')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            await communicator.send_to(text_data=text_data)
+            output = await communicator.receive_output(timeout=5)
+            await communicator.disconnect()
+            return output
+        return async_to_sync(run)()
+
+    def test_oversize_frames_close_with_1009(self):
+        output = self.exchange(json.dumps({'message': 'x' * 300, 'sender': 'alice', 'recipient': 'bob'}))
+
+        self.assertEqual(output, {'type': 'websocket.close', 'code': 1009})
+
+    def test_oversize_messages_are_rejected(self):
+        output = self.exchange(json.dumps({'message': 'x' * 11, 'sender': 'alice', 'recipient': 'bob'}))
+
+        self.assertEqual(output['type'], 'websocket.send')
+        self.assertEqual(json.loads(output['text']),
+                         {'type': 'error', 'error': 'Messages are limited to 10 characters'})
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class NotificationConsumerTests(SimpleTestCase):
+    def connect_as(self, user, username):
+        async def handshake():
+            communicator = WebsocketCommunicator(URLRouter(routing.websocket_urlpatterns),
+                                                 f'/ws/notifications/{username}/')
+            communicator.scope['user'] = user
+            connected, _ = await communicator.connect()
+            await communicator.disconnect()
+            return connected
+        return async_to_sync(handshake)()
+
+    def test_rejects_anonymous_sockets(self):
+        self.assertFalse(self.connect_as(AnonymousUser(), 'alice'))
+
+    def test_rejects_other_users_channels(self):
+        self.assertFalse(self.connect_as(User(username='bob'), 'alice'))
+
+    def test_accepts_the_users_own_channel(self):
+        self.assertTrue(self.connect_as(User(username='alice'), 'alice'))
+
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class WebsocketJWTAuthTests(TransactionTestCase):
+    """Sockets authenticate with the SPA's access token, loaded on its own connection"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='x')
+        self.bob = User.objects.create_user('bob', password='x')
+
+    def connect(self, path):
+        async def handshake():
+            communicator = WebsocketCommunicator(JWTAuthMiddlewareStack(URLRouter(routing.websocket_urlpatterns)),
+                                                 path)
+            connected, _ = await communicator.connect()
+            await communicator.disconnect()
+            return connected
+        return async_to_sync(handshake)()
+
+    def test_valid_token_connects(self):
+        token = AccessToken.for_user(self.alice)
+        self.assertTrue(self.connect(f'/ws/notifications/alice/?token={token}'))
+
+    def test_mismatched_token_is_refused(self):
+        token = AccessToken.for_user(self.bob)
+        self.assertFalse(self.connect(f'/ws/notifications/alice/?token={token}'))
+
+    def test_missing_or_invalid_token_is_refused(self):
+        self.assertFalse(self.connect('/ws/notifications/alice/'))
+        self.assertFalse(self.connect('/ws/notifications/alice/?token=not-a-jwt'))
+
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        for patcher in (mock.patch('backend.db_router.replica_aliases', return_value=['replica_1']),
+                        mock.patch('backend.db_router._replica_lag', return_value=0.0)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        db_router._lag_checks.clear()
+        self.addCleanup(db_router._lag_checks.clear)
+
+    def route(self, method, read=lambda: None):
+        """Run a request through the middleware, returning the alias its read used"""
+        aliases = []
+
+        def view(request):
+            read()
+            aliases.append(db_router.ReplicaRouter().db_for_read(Item))
+            return HttpResponse()
+
+        request = getattr(RequestFactory(), method)('/api/items/')
+        response = db_router.ReplicaRoutingMiddleware(view)(request)
+        return aliases[0], response
+
+    def test_safe_requests_read_from_replicas(self):
+        alias, _ = self.route('get')
+        self.assertEqual(alias, 'replica_1')
+
+    def test_writes_read_from_the_primary_and_pin_the_client(self):
+        alias, response = self.route('post')
+        self.assertEqual(alias, 'default')
+        self.assertIn(db_router.PIN_COOKIE, response.cookies)
+
+    def test_lagging_replicas_are_skipped(self):
+        with mock.patch('backend.db_router._replica_lag', return_value=60.0):
+            alias, _ = self.route('get')
+        self.assertEqual(alias, 'default')
+
+    def test_cache_fills_read_from_the_primary(self):
+        used = []
+
+        def compute():
+            used.append(db_router.ReplicaRouter().db_for_read(Item))
+            return 'value'
+
+        cache.delete('replica_routing_test')
+        self.addCleanup(cache.delete, 'replica_routing_test')
+        self.route('get', lambda: SingleFlight().do('replica_routing_test', compute, timeout=10))
+        self.assertEqual(used, ['default'])
+
+    def test_follower_fallback_reads_from_the_primary(self):
+        group = SingleFlight(wait_timeout=0.1)
+        leading, release = threading.Event(), threading.Event()
+        used = []
+
+        def slow_compute():
+            leading.set()
+            release.wait(5)
+            return 'leader'
+
+        def compute():
+            used.append(db_router.ReplicaRouter().db_for_read(Item))
+            return 'follower'
+
+        cache.delete('replica_routing_test')
+        self.addCleanup(cache.delete, 'replica_routing_test')
+        leader = threading.Thread(target=group.do, args=('replica_routing_test', slow_compute, 10))
+        leader.start()
+        leading.wait(5)
+        try:
+            # The leader outlasts the follower's wait, so the follower computes the value itself
+            self.route('get', lambda: group.do('replica_routing_test', compute, timeout=10))
+        finally:
+            release.set()
+            leader.join()
+        self.assertEqual(used, ['default'])
+
+    def test_forced_warming_reads_from_the_primary(self):
+        used = []
+
+        def loader(*args):
+            return 'value'
+
+        def uncoalesced(*args):
+            used.append(db_router.ReplicaRouter().db_for_read(Item))
+            return 'value'
+
+        loader.uncoalesced, loader.cache_timeout = uncoalesced, 10
+        cache.delete('replica_routing_test')
+        self.addCleanup(cache.delete, 'replica_routing_test')
+        self.route('get', lambda: cache_warming._run_task('replica_routing_test', loader, (), force=True))
+        self.assertEqual(used, ['default'])
+
+
+
+
+class SingleFlightTests(SimpleTestCase):
+    key = 'single_flight_test'
+
+    def setUp(self):
+        cache.delete_many([self.key, f'lease_{self.key}'])
+        self.addCleanup(cache.delete_many, [self.key, f'lease_{self.key}'])
+
+    def test_concurrent_misses_compute_once(self):
+        group = SingleFlight()
+        calls = []
+        start = threading.Barrier(8)
+        results = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        def miss():
+            start.wait()
+            results.append(group.do(self.key, compute, timeout=10))
+
+        threads = [threading.Thread(target=miss) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['value'] * 8)
+        self.assertEqual(cache.get(self.key), 'value')
+
+    def test_timed_out_follower_uses_the_stored_value(self):
+        group = SingleFlight(wait_timeout=0.1)
+        leading, release = threading.Event(), threading.Event()
+
+        def slow_compute():
+            leading.set()
+            release.wait(5)
+            return 'leader'
+
+        leader = threading.Thread(target=group.do, args=(self.key, slow_compute, 10))
+        leader.start()
+        leading.wait(5)
+        # Written by the leader of another worker, say, after this one's wait began
+        cache.set(self.key, 'stored', timeout=10)
+        try:
+            self.assertEqual(group.do(self.key, lambda: 'recomputed', timeout=10), 'stored')
+        finally:
+            release.set()
+            leader.join()
+
+class ReplicaLagCheckTests(SimpleTestCase):
+    def setUp(self):
+        db_router._lag_checks.clear()
+        self.addCleanup(db_router._lag_checks.clear)
+
+    def check(self, row):
+        """replica_is_healthy against a PostgreSQL replica whose lag query returns row"""
+        replica = mock.MagicMock(vendor='postgresql')
+        replica.cursor.return_value.__enter__.return_value.fetchone.return_value = row
+        with mock.patch.object(db_router, 'connections', {'replica_1': replica}):
+            return db_router.replica_is_healthy('replica_1')
+
+    def test_streaming_replica_within_budget_is_healthy(self):
+        self.assertTrue(self.check((True, True, 0.0)))
+
+    def test_disconnected_wal_receiver_is_unhealthy(self):
+        # Receive and replay positions match, but nothing is arriving from the primary
+        self.assertFalse(self.check((True, False, 0.0)))
+
+    def test_lagging_replica_is_unhealthy(self):
+        self.assertFalse(self.check((True, True, 3600.0)))
+
+
+class FakeConnection:
+    """Stands in for a psycopg connection handed to the pool"""
+
+    def __init__(self):
+        self.closed = False
+        self.info = mock.Mock(transaction_status=0)
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def test_waiter_times_out_once_the_pool_is_full(self):
+        pool = ConnectionPool('pool_test', max_size=2, timeout=0.2)
+        held = [pool.acquire(FakeConnection) for _ in range(2)]
+
+        started = time.monotonic()
+        with self.assertRaisesMessage(DatabaseOperationalError, "'pool_test' pool (2 connections in use)"):
+            pool.acquire(FakeConnection)
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        self.assertEqual(pool.in_use, 2)
+
+        # A release wakes a blocked waiter with the returned connection
+        waiter = threading.Timer(0.05, pool.release, [held[0]])
+        waiter.start()
+        self.assertIs(pool.acquire(FakeConnection), held[0])
+        waiter.join()
+
+    def test_broken_connections_are_discarded(self):
+        pool = ConnectionPool('pool_test', max_size=1, timeout=0.2)
+        broken = pool.acquire(FakeConnection)
+        broken.info = mock.Mock(transaction_status=3)
+        broken.rollback = mock.Mock(side_effect=Exception('server closed the connection'))
+
+        pool.release(broken)
+
+        self.assertTrue(broken.closed)
+        self.assertEqual(pool.in_use, 0)
+        replacement = pool.acquire(FakeConnection)
+        self.assertIsNot(replacement, broken)
+
+    def test_idle_connections_failing_the_health_check_are_discarded(self):
+        pool = ConnectionPool('pool_test', max_size=1, health_check_interval=0)
+        stale = pool.acquire(FakeConnection)
+        pool.release(stale)
+        stale.cursor = mock.Mock(side_effect=Exception('terminating connection'))
+
+        self.assertIsNot(pool.acquire(FakeConnection), stale)
+        self.assertTrue(stale.closed)
+
+
+class PooledDatabaseWrapperTests(SimpleTestCase):
+    """The pooled engine against the test database, at its configured max size"""
+
+    def setUp(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest("The pooled engine wraps the PostgreSQL backend")
+        settings_dict = dict(connection.settings_dict, ENGINE='backend.db_pool', CONN_MAX_AGE=0,
+                             POOL={'MAX_SIZE': 1, 'TIMEOUT': 0.2})
+        self.wrapper = db_pool.DatabaseWrapper(settings_dict, alias='pool_test')
+        self.addCleanup(self.close_pool)
+
+    def close_pool(self):
+        self.wrapper.close()
+        db_pool._pools.pop('pool_test').close_all()
+
+    def query(self):
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            return cursor.fetchone()[0]
+
+    def test_connections_return_to_the_pool_at_request_end(self):
+        self.assertEqual(self.query(), 1)
+        raw = self.wrapper.connection
+        self.assertEqual(self.wrapper.pool.in_use, 1)
+
+        # What close_old_connections does when request_finished fires
+        self.wrapper.close_if_unusable_or_obsolete()
+
+        self.assertIsNone(self.wrapper.connection)
+        self.assertEqual(self.wrapper.pool.in_use, 0)
+        self.assertFalse(raw.closed)
+        self.assertEqual(self.query(), 1)
+        self.assertIs(self.wrapper.connection, raw)
+
+    def test_checkouts_past_max_size_time_out(self):
+        self.query()
+        other = db_pool.DatabaseWrapper(self.wrapper.settings_dict, alias='pool_test')
+
+        with self.assertRaises(DatabaseOperationalError):
+            other.ensure_connection()
+
+
+# AsyncReadViewTests serves the async views beside the sync ones, whatever ASYNC_READ_VIEWS is
+urlpatterns = [
+    path('api/', include('api.urls')),
+    path('async/', async_views.getData),
+    path('async/item/<slug:slug>/', async_views.getItem),
+    path('async/category/<str:item_category_name>/', async_views.getCatItems),
+]
+
+
+@override_settings(ROOT_URLCONF='shopiet.tests')
+class AsyncReadViewTests(TestCase):
+    cache_keys = ['all_items', 'item_lamp', 'category_items_Home']
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='x')
+        self.auth = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        Item.objects.create(item_name='Lamp', item_price=10, item_description='Desk lamp',
+                            item_category_name='Home', slug='lamp')
+
+        cache.delete_many(self.cache_keys)
+        self.addCleanup(cache.delete_many, self.cache_keys)
+        for patcher in (mock.patch.object(async_views, '_redis', None),
+                        mock.patch.object(async_views, 'VIEW_BUFFER_KEY', 'test_async_item_view_buffer'),
+                        mock.patch('api.views.record_view'),
+                        mock.patch('shopiet.trending.record_signal')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(get_redis_connection('default').delete, 'test_async_item_view_buffer')
+
+    def run_async(self, request):
+        """Run request() on its own event loop, closing the asyncio Redis client bound to it"""
+        async def run():
+            try:
+                return await request()
+            finally:
+                if async_views._redis is not None:
+                    await async_views._redis.aclose()
+                    async_views._redis = None
+        return async_to_sync(run)()
+
+    def async_get(self, path, headers=None):
+        return self.run_async(lambda: AsyncClient().get(path, headers=headers))
+
+    def test_payloads_match_the_sync_views(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for sync_path, async_path in (('/api/', '/async/'), ('/api/item/lamp/', '/async/item/lamp/'),
+                                      ('/api/category/Home/', '/async/category/Home/')):
+            with self.subTest(path=async_path):
+                expected = client.get(sync_path)
+                cache.delete_many(self.cache_keys)
+                response = self.async_get(async_path, self.auth)
+
+                self.assertEqual(response.status_code, expected.status_code)
+                self.assertEqual(response.json(), expected.json())
+
+    def test_requests_without_a_token_are_rejected(self):
+        for path in ('/async/', '/async/item/lamp/', '/async/category/Home/'):
+            with self.subTest(path=path):
+                self.assertEqual(self.async_get(path).status_code, 401)
+                self.assertEqual(self.async_get(path, {'Authorization': 'Bearer not-a-jwt'}).status_code, 401)
+
+    def test_concurrent_misses_share_one_rebuild(self):
+        loads = []
+        load_items = async_views._load_items
+
+        async def slow_load(queryset):
+            loads.append(queryset)
+            await asyncio.sleep(0.2)
+            return await load_items(queryset)
+
+        async def fetch_together():
+            client = AsyncClient()
+            return await asyncio.gather(*(client.get('/async/', headers=self.auth) for _ in range(5)))
+
+        # Without the cache write, any request that missed the shared future would load again
+        async def skip_cache_set(key, value, timeout):
+            pass
+
+        with mock.patch.object(async_views, '_load_items', slow_load), \
+                mock.patch.object(async_views, '_cache_set', skip_cache_set):
+            responses = self.run_async(fetch_together)
+
+        self.assertEqual(len(loads), 1)
+        self.assertEqual({response.status_code for response in responses}, {200})
+        self.assertEqual([response.json()[0]['slug'] for response in responses], ['lamp'] * 5)
+        self.assertEqual(async_views._inflight, {})
+
+@override_settings(COSAVE_MIN_COUNT=2, COSAVE_TOP_K=10)
+class CoSavedItemTests(TestCase):
+    def setUp(self):
+        seller = User.objects.create(username='seller')
+        self.items = Item.objects.bulk_create([
+            Item(item_name=f'Lamp {n}', item_price=10, user=seller, item_description='Lamp', slug=f'lamp-{n}')
+            for n in range(3)
+        ])
+        self.buyers = [User.objects.create(username=f'buyer{n}') for n in range(3)]
+
+    def save(self, buyer, item):
+        SavedItem.objects.create(user=buyer, item=item)
+        recommendations.record_co_save(buyer.id, item.id)
+
+    def count(self, item, other):
+        return CoSavedItem.objects.get(item=item, other=other).count
+
+    def test_saves_increment_both_directions(self):
+        lamp, desk, _ = self.items
+        for buyer in self.buyers[:2]:
+            self.save(buyer, lamp)
+            self.save(buyer, desk)
+
+        self.assertEqual(self.count(lamp, desk), 2)
+        self.assertEqual(self.count(desk, lamp), 2)
+        self.assertEqual([row.other for row in recommendations.co_saved_items(lamp.id)], [desk])
+
+    def test_rebuild_keeps_pairs_below_the_threshold(self):
+        lamp, desk, chair = self.items
+        for buyer in self.buyers[:2]:
+            SavedItem.objects.create(user=buyer, item=lamp)
+            SavedItem.objects.create(user=buyer, item=desk)
+        SavedItem.objects.create(user=self.buyers[0], item=chair)
+
+        recommendations.build_co_saved_items()
+        self.assertEqual(self.count(lamp, chair), 1)
+        self.assertEqual([row.other for row in recommendations.co_saved_items(lamp.id)], [desk])
+
+        # A later save continues from the rebuilt count instead of restarting it
+        self.save(self.buyers[1], chair)
+        self.assertEqual(self.count(lamp, chair), 2)
+        self.assertEqual(self.count(chair, desk), 2)
+        self.assertEqual({row.other for row in recommendations.co_saved_items(lamp.id)}, {desk, chair})
+
+
+
+class SaveItemViewTests(TestCase):
+    def setUp(self):
+        seller = User.objects.create(username='seller')
+        self.lamp, self.desk = Item.objects.bulk_create([
+            Item(item_name=name, item_price=10, user=seller, item_description=name,
+                 item_category_name='Home', slug=name.lower())
+            for name in ('Lamp', 'Desk')
+        ])
+        self.buyer = User.objects.create(username='buyer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+        for name in ('TRENDING_KEY', 'TRENDING_CATEGORY_KEY', 'TRENDING_CATEGORIES_KEY', 'TRENDING_EPOCH_KEY'):
+            patcher = mock.patch.object(trending, name, f'test_{getattr(trending, name)}')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.redis = get_redis_connection('default')
+        names = [trending.TRENDING_KEY, trending.TRENDING_CATEGORY_KEY.format('Home'),
+                 trending.TRENDING_CATEGORIES_KEY, trending.TRENDING_EPOCH_KEY]
+        self.redis.delete(*names)
+        self.addCleanup(self.redis.delete, *names)
+
+    def test_save_bumps_the_co_saved_pair(self):
+        self.assertEqual(self.client.post('/api/save/buyer/lamp/').status_code, 201)
+        self.assertEqual(self.client.post('/api/save/buyer/desk/').status_code, 201)
+
+        self.assertEqual(CoSavedItem.objects.get(item=self.lamp, other=self.desk).count, 1)
+        self.assertEqual(CoSavedItem.objects.get(item=self.desk, other=self.lamp).count, 1)
+
+    def test_save_raises_the_items_trending_score(self):
+        self.assertIsNone(self.redis.zscore(trending.TRENDING_KEY, 'lamp'))
+
+        self.assertEqual(self.client.post('/api/save/buyer/lamp/').status_code, 201)
+
+        self.assertGreater(self.redis.zscore(trending.TRENDING_KEY, 'lamp'), 0)
+        self.assertGreater(self.redis.zscore(trending.TRENDING_CATEGORY_KEY.format('Home'), 'lamp'), 0)
+
+    def test_saving_twice_is_rejected(self):
+        self.client.post('/api/save/buyer/lamp/')
+        self.assertEqual(self.client.post('/api/save/buyer/lamp/').status_code, 400)
+        self.assertEqual(SavedItem.objects.filter(user=self.buyer).count(), 1)
+
+class SimilarItemsCacheTests(TestCase):
+    def setUp(self):
+        seller = User.objects.create(username='seller')
+        self.lamp, self.desk_lamp = Item.objects.bulk_create([
+            Item(item_name=name, item_price=10, user=seller, item_description='Brass reading lamp',
+                 item_category_name='Home', slug=slug)
+            for name, slug in (('Lamp', 'lamp'), ('Desk lamp', 'desk-lamp'))
+        ])
+        self.keys = [recommendations.similar_items_cache_key(slug) for slug in ('lamp', 'desk-lamp')]
+        self.addCleanup(cache.delete_many, self.keys)
+
+    def cache_lists(self):
+        cache.set_many({key: ['stale'] for key in self.keys})
+
+    def cached(self):
+        return [key for key in self.keys if cache.get(key) is not None]
+
+    def test_refresh_drops_the_item_and_its_new_neighbours(self):
+        self.cache_lists()
+        recommendations.refresh_similar_items(self.desk_lamp)
+        self.assertEqual(self.cached(), [])
+
+    def test_rebuild_drops_every_list(self):
+        self.cache_lists()
+        recommendations.build_similar_items()
+        self.assertEqual(self.cached(), [])
+
+    def test_deleting_an_item_drops_lists_showing_it(self):
+        recommendations.build_similar_items()
+        self.cache_lists()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.desk_lamp.delete()
+        self.assertEqual(self.cached(), [])
+
+
+class QueryPlanTests(TestCase):
+    """The hot read paths stay on their indexes
+
+    Profile items and saved items use item_username_idx and unique_saved_item
+    (0029). Conversation lists use conversation_low_idx and conversation_high_idx
+    (0030). Message history and unread counts use message_conversation_idx
+    (0030), and resumes use message_conversation_seq_idx (0032). Since 0031,
+    every partition carries its own copy of the message indexes.
+    """
+
+    # Either conversation-led index; partitions get their own copies, named by PostgreSQL
+    MESSAGE_INDEXES = ('message_conversation_idx', 'message_conversation_seq_idx',
+                       '_conversation_id_id_idx', '_conversation_id_seq_idx')
+
+    def setUp(self):
+        self.alice = User.objects.create(username='alice')
+        self.bob = User.objects.create(username='bob')
+        Item.objects.bulk_create([
+            Item(item_name=f'Lamp {n}', item_price=10, user=self.alice, item_username='alice',
+                 item_description='Lamp', slug=f'lamp-{n}')
+            for n in range(3)
+        ])
+        SavedItem.objects.bulk_create([SavedItem(user=self.bob, item=item) for item in Item.objects.all()])
+        for n in range(3):
+            Message.objects.create(sender=self.alice, recipient=self.bob, content=f'hello {n}')
+        self.conversation = Conversation.objects.get()
+
+        if connection.vendor == 'postgresql':
+            # Tiny test tables are cheaper to scan; ask whether the index is usable at all
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def assertUsesIndex(self, queryset, indexes):
+        plan = queryset.explain()
+        self.assertTrue(any(index in plan for index in indexes), f"No index of {indexes} in plan:\n{plan}")
+
+    def test_get_messages(self):
+        self.assertUsesIndex(self.conversation.live_messages().order_by('id'), self.MESSAGE_INDEXES)
+
+    def test_unread_counts(self):
+        unread = (self.conversation.live_messages().filter(id__gt=self.conversation.user_high_last_read)
+                  .exclude(sender=self.bob))
+        self.assertUsesIndex(unread, self.MESSAGE_INDEXES)
+
+    def test_user_conversations(self):
+        self.assertUsesIndex(Conversation.objects.filter(user_low=self.alice).order_by('-updated_at'),
+                             ['conversation_low_idx'])
+
+    def test_profile_items(self):
+        self.assertUsesIndex(Item.objects.filter(item_username='alice'), ['item_username_idx'])
+
+    def test_saved_items(self):
+        # SQLite names the unique constraint's index itself
+        self.assertUsesIndex(SavedItem.objects.filter(user=self.bob).values_list('item_id', flat=True),
+                             ['unique_saved_item', 'sqlite_autoindex_shopiet_saveditem'])
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+                   TYPING_TTL_SECONDS=1, ROOM_BROADCAST_WINDOW_MS=50)
+class PresenceLapseTests(SimpleTestCase):
+    room = 'alice_bob'
+
+    def setUp(self):
+        self.layer = get_channel_layer()
+        self.channel = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(self.room, self.channel)
+        self.addCleanup(presence.set_typing, self.room, 'alice', False)
+
+    def next_state(self):
+        async def receive():
+            return await asyncio.wait_for(self.layer.receive(self.channel), timeout=3)
+        return json.loads(async_to_sync(receive)()['text'])['users']['alice']
+
+    def test_expired_typing_is_broadcast(self):
+        presence.set_typing(self.room, 'alice', True)
+        presence.schedule_room_broadcast(self.room, ['alice', 'bob'])
+        # Past the typing TTL, the window and the lapse margin
+        time.sleep(1.5)
+
+        self.assertTrue(self.next_state()['typing'])
+        self.assertFalse(self.next_state()['typing'])
+
+
+@override_settings(TRENDING_HALF_LIFE_HOURS=1)
+class TrendingTests(SimpleTestCase):
+    def setUp(self):
+        keys = {
+            'TRENDING_KEY': 'test_trending_items',
+            'TRENDING_CATEGORY_KEY': 'test_trending_items_{}',
+            'TRENDING_CATEGORIES_KEY': 'test_trending_categories',
+            'TRENDING_EPOCH_KEY': 'test_trending_epoch',
+            'TRENDING_REBASE_LOCK_KEY': 'test_trending_rebase_lock',
+        }
+        for name, key in keys.items():
+            patcher = mock.patch.object(trending, name, key)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.redis = get_redis_connection('default')
+        names = [key.format('Home') for key in keys.values()]
+        self.redis.delete(*names)
+        self.addCleanup(self.redis.delete, *names)
+
+    def test_signals_are_weighted_by_time_since_the_epoch(self):
+        self.redis.set(trending.TRENDING_EPOCH_KEY, time.time() - 2 * 3600)
+        trending.record_signal('lamp', 'Home', 'save')
+
+        self.assertAlmostEqual(self.redis.zscore(trending.TRENDING_KEY, 'lamp'), 20, places=2)
+        self.assertAlmostEqual(self.redis.zscore('test_trending_items_Home', 'lamp'), 20, places=2)
+        ranked, total = trending.trending_page()
+        self.assertEqual(total, 1)
+        self.assertAlmostEqual(ranked[0][1], 5, places=2)
+
+    def test_rebase_keeps_decayed_scores(self):
+        self.redis.set(trending.TRENDING_EPOCH_KEY, time.time() - 3600)
+        trending.record_signal('lamp', None, 'view')
+        trending.rebase(self.redis)
+        trending.record_signal('lamp', None, 'view')
+
+        ranked, _ = trending.trending_page()
+        self.assertAlmostEqual(ranked[0][1], 2, places=2)
+
+    def test_remove_item_survives_redis_errors(self):
+        with mock.patch('shopiet.trending.get_redis_connection', side_effect=ConnectionError('down')):
+            trending.remove_item('lamp', 'Home')
+
+
+class ViewCountTests(TestCase):
+    def setUp(self):
+        for name in ('VIEW_BUFFER_KEY', 'VIEW_FLUSH_KEY', 'VIEW_FLUSH_ID_KEY', 'VIEW_FLUSH_LOCK_KEY'):
+            patcher = mock.patch.object(view_counts, name, f'test_{getattr(view_counts, name)}')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.redis = get_redis_connection('default')
+        keys = [view_counts.VIEW_BUFFER_KEY, view_counts.VIEW_FLUSH_KEY, view_counts.VIEW_FLUSH_ID_KEY,
+                view_counts.VIEW_FLUSH_LOCK_KEY]
+        self.redis.delete(*keys)
+        self.addCleanup(self.redis.delete, *keys)
+
+        seller = User.objects.create(username='seller')
+        self.lamp, self.desk = Item.objects.bulk_create([
+            Item(item_name=name, item_price=10, user=seller, item_description=name,
+                 item_category_name='Home', slug=slug)
+            for name, slug in (('Lamp', 'lamp'), ('Desk', 'desk'))
+        ])
+
+    def test_flush_retried_after_failed_cleanup_counts_once(self):
+        view_counts.record_view('lamp', 3)
+
+        with mock.patch.object(type(self.redis), 'delete', side_effect=ConnectionError('down')):
+            with self.assertRaises(ConnectionError):
+                view_counts.flush_view_counts()
+        self.assertEqual(Item.objects.get(pk=self.lamp.pk).view_count, 3)
+
+        self.assertEqual(view_counts.flush_view_counts(), 0)
+        self.assertEqual(Item.objects.get(pk=self.lamp.pk).view_count, 3)
+        self.assertFalse(self.redis.exists(view_counts.VIEW_FLUSH_KEY, view_counts.VIEW_FLUSH_ID_KEY))
+
+        # The next batch gets a fresh id
+        view_counts.record_view('lamp', 2)
+        self.assertEqual(view_counts.flush_view_counts(), 1)
+        self.assertEqual(Item.objects.get(pk=self.lamp.pk).view_count, 5)
+
+    def test_overlapping_flushes_lose_no_views(self):
+        view_counts.record_view('lamp', 2)
+        apply_counts = view_counts._apply_counts
+
+        def apply_while_another_flush_starts(counts, batch_size):
+            # Views keep arriving and a second flusher starts mid-flush
+            view_counts.record_view('lamp', 3)
+            self.assertEqual(view_counts.flush_view_counts(), 0)
+            apply_counts(counts, batch_size)
+
+        with mock.patch.object(view_counts, '_apply_counts', side_effect=apply_while_another_flush_starts):
+            self.assertEqual(view_counts.flush_view_counts(), 1)
+        self.assertEqual(Item.objects.get(pk=self.lamp.pk).view_count, 2)
+
+        self.assertEqual(view_counts.flush_view_counts(), 1)
+        self.assertEqual(Item.objects.get(pk=self.lamp.pk).view_count, 5)
+
+    def test_pending_batch_is_drained_before_the_buffer(self):
+        # A batch left behind by a failed flush, with newer views buffered since
+        view_counts.record_view('lamp', 2)
+        self.redis.rename(view_counts.VIEW_BUFFER_KEY, view_counts.VIEW_FLUSH_KEY)
+        view_counts.record_view('lamp', 3)
+
+        view_counts.flush_view_counts()
+        self.assertEqual(Item.objects.get(pk=self.lamp.pk).view_count, 2)
+        view_counts.flush_view_counts()
+        self.assertEqual(Item.objects.get(pk=self.lamp.pk).view_count, 5)
+
+    def test_most_viewed_endpoint_sorts_by_view_count(self):
+        Item.objects.filter(pk=self.lamp.pk).update(view_count=2)
+        Item.objects.filter(pk=self.desk.pk).update(view_count=7)
+        client = APIClient()
+        client.force_authenticate(User.objects.get(username='seller'))
+
+        response = client.get('/api/most-viewed/Home/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual([item['slug'] for item in response.data['results']], ['desk', 'lamp'])
+
+
+
+class ConcurrentViewFlushTests(TransactionTestCase):
+    """Flushers racing each other and new views, each thread on its own connection"""
+
+    def setUp(self):
+        for name in ('VIEW_BUFFER_KEY', 'VIEW_FLUSH_KEY', 'VIEW_FLUSH_ID_KEY', 'VIEW_FLUSH_LOCK_KEY'):
+            patcher = mock.patch.object(view_counts, name, f'test_concurrent_{getattr(view_counts, name)}')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        redis = get_redis_connection('default')
+        keys = [view_counts.VIEW_BUFFER_KEY, view_counts.VIEW_FLUSH_KEY, view_counts.VIEW_FLUSH_ID_KEY,
+                view_counts.VIEW_FLUSH_LOCK_KEY]
+        redis.delete(*keys)
+        self.addCleanup(redis.delete, *keys)
+        self.lamp = Item.objects.create(item_name='Lamp', item_price=10, item_description='Lamp', slug='lamp')
+
+    def test_every_view_is_flushed_exactly_once(self):
+        views = 200
+        recording = threading.Event()
+        recording.set()
+
+        def flusher():
+            try:
+                while recording.is_set():
+                    view_counts.flush_view_counts()
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=flusher) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for _ in range(views):
+            view_counts.record_view('lamp')
+        recording.clear()
+        for thread in threads:
+            thread.join()
+        view_counts.flush_view_counts()
+
+        self.assertEqual(Item.objects.get(pk=self.lamp.pk).view_count, views)
+
+@override_settings(MEDIA_ACCEL='')
+class MediaEtagTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        for suffix, body in (('', b'<svg>' + b' ' * 512 + b'</svg>'), ('.br', b'br body'), ('.gz', b'gzip body')):
+            with open(f'{root.name}/logo.svg{suffix}', 'wb') as file:
+                file.write(body)
+        media_root = override_settings(MEDIA_ROOT=root.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    def get(self, **headers):
+        response = serve_media(RequestFactory().get('/media/logo.svg', headers=headers), 'logo.svg')
+        response.close()
+        return response
+
+    def test_each_encoding_has_its_own_etag(self):
+        identity = self.get()
+        brotli = self.get(accept_encoding='br, gzip')
+        gzip = self.get(accept_encoding='gzip')
+
+        self.assertEqual(brotli['Content-Encoding'], 'br')
+        self.assertTrue(brotli['ETag'].endswith('-br"'))
+        self.assertEqual(len({identity['ETag'], brotli['ETag'], gzip['ETag']}), 3)
+        self.assertEqual(brotli['Vary'], 'Accept-Encoding')
+
+    def test_revalidation_matches_the_served_representation(self):
+        brotli = self.get(accept_encoding='br')
+
+        self.assertEqual(self.get(accept_encoding='br', if_none_match=brotli['ETag']).status_code, 304)
+        # A cached brotli body is no valid copy for a client without brotli
+        self.assertEqual(self.get(if_none_match=brotli['ETag']).status_code, 200)
+
+    def test_ranges_validate_against_the_identity_body(self):
+        identity = self.get()
+        response = self.get(range='bytes=0-4', if_range=identity['ETag'], accept_encoding='br')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['ETag'], identity['ETag'])
+        self.assertNotIn('Content-Encoding', response)
@@ -0,0 +1,142 @@
+"""
+Trending items scored from exponentially decayed views and saves
+Scores live in Redis sorted sets (one global, one per category). Instead of
+decaying every score over time, each new signal is weighted by
+2 ** ((now - epoch) / half_life), which keeps relative order identical to a
+true decay and makes every update a single script call that reads the epoch
+and increments together. Scores are rebased onto a new epoch before the
+multiplier grows large.
+"""
+
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+TRENDING_KEY = 'trending_items'
+TRENDING_CATEGORY_KEY = 'trending_items_{}'
+TRENDING_CATEGORIES_KEY = 'trending_categories'
+TRENDING_EPOCH_KEY = 'trending_epoch'
+TRENDING_REBASE_LOCK_KEY = 'trending_rebase_lock'
+
+SIGNAL_WEIGHTS: Dict[str, float] = {
+    'view': 1.0,
+    'save': 5.0,
+    'message': 3.0,
+}
+
+# Rebase once signals are weighted by more than 2 ** REBASE_AFTER_HALF_LIVES
+REBASE_AFTER_HALF_LIVES = 32
+# Decayed scores below this are dropped on rebase
+MIN_SCORE = 0.01
+
+# Weight by the epoch and ZINCRBY in one step, so a rebase cannot land in between;
+# returns the half-lives since the epoch as a string (Lua numbers become integers)
+_RECORD_SCRIPT = """
+redis.call('SET', KEYS[1], ARGV[1], 'NX')
+local half_lives = (tonumber(ARGV[1]) - tonumber(redis.call('GET', KEYS[1]))) / tonumber(ARGV[3])
+local increment = tonumber(ARGV[2]) * 2 ^ half_lives
+redis.call('ZINCRBY', KEYS[2], increment, ARGV[4])
+if KEYS[3] then
+    redis.call('ZINCRBY', KEYS[3], increment, ARGV[4])
+    redis.call('SADD', KEYS[4], ARGV[5])
+end
+return tostring(half_lives)
+"""
+
+
+def _half_life() -> float:
+    return settings.TRENDING_HALF_LIFE_HOURS * 3600
+
+
+def _epoch(redis) -> float:
+    now = time.time()
+    redis.set(TRENDING_EPOCH_KEY, now, nx=True)
+    return float(redis.get(TRENDING_EPOCH_KEY) or now)
+
+
+def _category_key(category: str) -> str:
+    return TRENDING_CATEGORY_KEY.format(category)
+
+
+def record_signal(slug: str, category: Optional[str], signal: str):
+    """Add a weighted signal for an item to the global and category rankings"""
+    try:
+        redis = get_redis_connection('default')
+        keys = [TRENDING_EPOCH_KEY, TRENDING_KEY]
+        args = [repr(time.time()), SIGNAL_WEIGHTS[signal], _half_life(), slug]
+        if category:
+            keys += [_category_key(category), TRENDING_CATEGORIES_KEY]
+            args.append(category)
+        half_lives = float(redis.eval(_RECORD_SCRIPT, len(keys), *keys, *args))
+
+        if half_lives > REBASE_AFTER_HALF_LIVES:
+            rebase(redis)
+    except Exception as e:
+        logger.warning(f"Could not record trending {signal} for {slug}: {e}")
+
+
+def remove_item(slug: str, category: Optional[str]):
+    """Drop an item from the rankings"""
+    try:
+        redis = get_redis_connection('default')
+        pipe = redis.pipeline(transaction=False)
+        pipe.zrem(TRENDING_KEY, slug)
+        if category:
+            pipe.zrem(_category_key(category), slug)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Could not remove {slug} from trending: {e}")
+
+
+def rebase(redis=None):
+    """Rescale all scores onto the current time and prune decayed items"""
+    redis = redis or get_redis_connection('default')
+    if not redis.set(TRENDING_REBASE_LOCK_KEY, 1, nx=True, ex=60):
+        return
+
+    try:
+        now = time.time()
+        factor = 2 ** -((now - _epoch(redis)) / _half_life())
+        categories = [
+            category.decode() if isinstance(category, bytes) else category
+            for category in redis.smembers(TRENDING_CATEGORIES_KEY)
+        ]
+        keys = [TRENDING_KEY] + [_category_key(category) for category in categories]
+
+        pipe = redis.pipeline(transaction=True)
+        for key in keys:
+            pipe.zunionstore(key, {key: factor})
+            pipe.zremrangebyscore(key, '-inf', MIN_SCORE)
+        pipe.set(TRENDING_EPOCH_KEY, now)
+        pipe.execute()
+        logger.info(f"Rebased {len(keys)} trending rankings")
+    finally:
+        redis.delete(TRENDING_REBASE_LOCK_KEY)
+
+
+def trending_page(category: Optional[str] = None, page: int = 1,
+                  page_size: int = 20) -> Tuple[List[Tuple[str, float]], int]:
+    """Return ([(slug, decayed score)], total) for one page of the ranking"""
+    redis = get_redis_connection('default')
+    key = _category_key(category) if category else TRENDING_KEY
+    start = (page - 1) * page_size
+
+    pipe = redis.pipeline(transaction=False)
+    pipe.zrevrange(key, start, start + page_size - 1, withscores=True)
+    pipe.zcard(key)
+    pipe.get(TRENDING_EPOCH_KEY)
+    rows, total, epoch = pipe.execute()
+
+    # Convert stored scores back to present-day decayed values
+    epoch = float(epoch) if epoch else time.time()
+    scale = 2 ** -((time.time() - epoch) / _half_life())
+    ranked = [
+        (slug.decode() if isinstance(slug, bytes) else slug, score * scale)
+        for slug, score in rows
+    ]
+    return ranked, total
@@ -0,0 +1,130 @@
+"""
+Buffered item view counting
+Views are counted with HINCRBY into a Redis hash and periodically written
+back to Item.view_count in bulk, so item pages never write to Postgres.
+Each flushed batch gets an id that is recorded in the same transaction as
+the counts, so retrying a flush whose Redis cleanup failed adds nothing twice.
+Flushes hold a Redis lock, so overlapping flushers never rename a fresh
+buffer over a batch that is still being drained.
+"""
+
+import logging
+import uuid
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django_redis import get_redis_connection
+from redis.exceptions import LockError, ResponseError
+
+from shopiet.models import Item, ViewCountFlush
+
+logger = logging.getLogger(__name__)
+
+VIEW_BUFFER_KEY = 'item_view_buffer'
+# The buffer is renamed here while a flush is in progress
+VIEW_FLUSH_KEY = 'item_view_buffer_flushing'
+# Id of the batch held in VIEW_FLUSH_KEY
+VIEW_FLUSH_ID_KEY = 'item_view_buffer_flushing_id'
+VIEW_FLUSH_LOCK_KEY = 'item_view_buffer_flush_lock'
+# Outlives any single flush; a crashed flusher frees the lock after this
+FLUSH_LOCK_TIMEOUT = 300
+# Applied batch ids are kept this long; a failed cleanup is retried well within it
+FLUSH_RECORD_TTL = timedelta(days=7)
+
+
+def record_view(slug: str, count: int = 1):
+    """Add views for an item to the Redis buffer"""
+    try:
+        get_redis_connection('default').hincrby(VIEW_BUFFER_KEY, slug, count)
+    except Exception as e:
+        logger.warning(f"Could not buffer view for {slug}: {e}")
+
+
+def most_viewed_items(category: Optional[str] = None):
+    """Items with flushed views, most viewed first, optionally within one category"""
+    items = Item.objects.filter(view_count__gt=0)
+    if category:
+        items = items.filter(item_category_name=category)
+    return items.order_by('-view_count', '-id')
+
+
+def most_viewed_slugs(limit: int) -> List[str]:
+    """Slugs of the most viewed items according to the flushed counts"""
+    return list(most_viewed_items().values_list('slug', flat=True)[:limit])
+
+
+def _apply_counts(counts: Dict[str, int], batch_size: int):
+    rows = list(counts.items())
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+
+        if connection.vendor != 'postgresql':
+            for slug, views in batch:
+                Item.objects.filter(slug=slug).update(view_count=F('view_count') + views)
+            continue
+
+        values = ', '.join(['(%s, %s)'] * len(batch))
+        params = [value for row in batch for value in row]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {Item._meta.db_table} AS item "
+                f"SET view_count = item.view_count + buffered.views "
+                f"FROM (VALUES {values}) AS buffered(slug, views) "
+                f"WHERE item.slug = buffered.slug",
+                params,
+            )
+
+
+def flush_view_counts(batch_size: int = 500) -> int:
+    """Move buffered views into Item.view_count, returning the items updated"""
+    redis = get_redis_connection('default')
+
+    lock = redis.lock(VIEW_FLUSH_LOCK_KEY, timeout=FLUSH_LOCK_TIMEOUT)
+    if not lock.acquire(blocking=False):
+        logger.info("Another view count flush is running, skipped this one")
+        return 0
+    try:
+        return _flush(redis, batch_size)
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            logger.warning(f"View count flush outlived its {FLUSH_LOCK_TIMEOUT}s lock")
+
+
+def _flush(redis, batch_size: int) -> int:
+    # RENAMENX leaves a batch whose flush failed in place, so it is drained first
+    # and the buffer follows on the next flush
+    try:
+        redis.renamenx(VIEW_BUFFER_KEY, VIEW_FLUSH_KEY)
+    except ResponseError:
+        # Nothing buffered
+        pass
+    if not redis.exists(VIEW_FLUSH_KEY):
+        return 0
+
+    # A retried flush keeps the id it was given the first time
+    redis.set(VIEW_FLUSH_ID_KEY, uuid.uuid4().hex, nx=True)
+    batch_id = redis.get(VIEW_FLUSH_ID_KEY).decode()
+
+    counts = {
+        (slug.decode() if isinstance(slug, bytes) else slug): int(views)
+        for slug, views in redis.hgetall(VIEW_FLUSH_KEY).items()
+    }
+
+    # All batches commit together with the batch id, so a flush applies at most once
+    with transaction.atomic():
+        _, created = ViewCountFlush.objects.get_or_create(batch_id=batch_id)
+        if created:
+            _apply_counts(counts, batch_size)
+            ViewCountFlush.objects.filter(flushed_at__lt=timezone.now() - FLUSH_RECORD_TTL).delete()
+    redis.delete(VIEW_FLUSH_KEY, VIEW_FLUSH_ID_KEY)
+
+    if not created:
+        logger.info(f"View batch {batch_id} was already flushed, discarded it")
+        return 0
+    logger.info(f"Flushed views for {len(counts)} items")
+    return len(counts)
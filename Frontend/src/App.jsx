@@ -90,7 +90,7 @@ function App() {
     {latestItems.map((item) => (
       <Link to={`/item/${item.slug}`}key={item.id}>
       <div className='item-card' >
-        <div className="item-card-img-cnt" >
+        <div className="item-card-img-cnt" style={item.item_thumbnail_placeholder ? { backgroundImage: `url(${item.item_thumbnail_placeholder})`, backgroundSize: 'cover' } : undefined} >
           <img loading="lazy" alt={item.item_thumbnail.name} src={`${item.item_thumbnail}`} className="item-image" srcSet="" />
         </div>
         <div className="item-card-desc">
@@ -3,8 +3,11 @@ import AuthContext from './context/AuthContext';
 import { useParams,Link } from 'react-router-dom';
 import './css/chat.css'
 
+// Well inside the server's 60 second presence TTL
+const PRESENCE_HEARTBEAT_MS = 20000;
+
 const Chat = () => {
-    const { user } = useContext(AuthContext);
+    const { user, authTokens } = useContext(AuthContext);
     const [messages, setMessages] = useState([]);
     const [prevMessages, setPrevMessages] = useState(null);
     const [timeSent, setTimesent] = useState(null);
@@ -16,6 +19,7 @@ const Chat = () => {
 
     const roomName = [user.username, recipient].sort().join('_');
     const isSocketInitialized = useRef(false);
+    const heartbeat = useRef(null);
 
     useEffect(() => {
         
@@ -54,11 +58,18 @@ const Chat = () => {
 
     const initializeSocket = () => {
         const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:'
-        const wsUrl = `${protocol}//${import.meta.env.VITE_API_URL.replace(/^https?:\/\//, '')}/ws/socket-server/${roomName}/`
+        const wsUrl = `${protocol}//${import.meta.env.VITE_API_URL.replace(/^https?:\/\//, '')}/ws/socket-server/${roomName}/?token=${encodeURIComponent(authTokens.access)}`
         const chatSocket = new WebSocket(wsUrl);
 
         chatSocket.onopen = () => {
             console.log('WebSocket connection opened');
+            // Keeps the user shown as online while they only read
+            clearInterval(heartbeat.current);
+            heartbeat.current = setInterval(() => {
+                if (chatSocket.readyState === WebSocket.OPEN) {
+                    chatSocket.send(JSON.stringify({ 'type': 'presence' }));
+                }
+            }, PRESENCE_HEARTBEAT_MS);
         };
 
         chatSocket.onmessage = (e) => {
@@ -77,6 +88,7 @@ const Chat = () => {
 
         chatSocket.onclose = (e) => {
             console.error('Chat socket closed unexpectedly', e);
+            clearInterval(heartbeat.current);
             isSocketInitialized.current = false; 
         };
 
@@ -95,7 +107,9 @@ const Chat = () => {
         } else {
             console.error('WebSocket is not open. Reconnecting...');
             const newSocket = initializeSocket();
+            const startHeartbeat = newSocket.onopen;
             newSocket.onopen = () => {
+                startHeartbeat();
                 newSocket.send(JSON.stringify({
                     'message': messageInput,
                     'sender': user.username,
@@ -7,6 +7,7 @@ import photomulti from './assets/photo-multi.svg';
 import LocationAutocomplete from './utils/LocationAutoComplete';
 import { Link } from 'react-router-dom';
 import linkExt from './assets/link-ext.svg'
+import { uploadItemDirect } from './utils/directUpload';
 const UploadItem = () => {
     const { user } = useContext(AuthContext);
     const [formData, setFormData] = useState({
@@ -124,11 +125,14 @@ const UploadItem = () => {
         
         console.log(formDataObject);
         let url = `${import.meta.env.VITE_API_URL}/api/upload/`;
-        const response = axios.post(url, form_data, {
-                headers: {
-                    'content-type': 'multipart/form-data',
-                },
-            })
+        const response = uploadItemDirect(import.meta.env.VITE_API_URL, formData)
+            .catch((err) => err.directUnsupported
+                ? axios.post(url, form_data, {
+                    headers: {
+                        'content-type': 'multipart/form-data',
+                    },
+                })
+                : Promise.reject(err))
             .then((response) => {
                 setLoading(false);
                 console.log(response.data)
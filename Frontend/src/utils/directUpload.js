@@ -0,0 +1,34 @@
+import axios from 'axios';
+
+// Uploads item images straight to the media bucket with presigned forms, then
+// asks the backend to process them. Rejects with directUnsupported set when
+// the backend stores media locally, so callers can fall back to multipart.
+const uploadToBucket = async (apiUrl, username, file) => {
+    const { data } = await axios.post(`${apiUrl}/api/upload/presign/`, {
+        item_username: username,
+        filename: file.name,
+        content_type: file.type,
+    });
+    const body = new FormData();
+    Object.entries(data.fields).forEach(([key, value]) => body.append(key, value));
+    body.append('file', file);  // Must come after the policy fields
+    await axios.post(data.url, body);
+    return data.key;
+};
+
+export const uploadItemDirect = async (apiUrl, formData) => {
+    const { item_thumbnail, additional_images, ...fields } = formData;
+    let keys;
+    try {
+        keys = await Promise.all(
+            [item_thumbnail, ...additional_images.flat()].map(file => uploadToBucket(apiUrl, fields.item_username, file))
+        );
+    } catch (err) {
+        if (err.response && err.response.status === 501) {
+            err.directUnsupported = true;
+        }
+        throw err;
+    }
+    const [thumbnail_key, ...image_keys] = keys;
+    return axios.post(`${apiUrl}/api/upload/finalize/`, { ...fields, thumbnail_key, image_keys });
+};